@@ -1,4 +1,4 @@
-from rest_framework.parsers import JSONParser
+from bizease.parsers import JSONParser
 from .models import CustomUser
 from .serializers import SignUpDataSerializer, LoginDataSerializer, ProfileDataSerializer
 from django.contrib.auth import authenticate
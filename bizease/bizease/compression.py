@@ -0,0 +1,190 @@
+"""
+Compression of large responses (chart data, unpaginated lists, ...).
+
+The encoding is negotiated from 'Accept-Encoding'. gzip is always available and brotli is preferred when the client
+accepts it and the optional 'brotli' (or 'brotlicffi') package is installed. Responses smaller than
+COMPRESSION_MIN_SIZE bytes aren't worth the cpu and are sent as they are. Streaming responses (see
+bizease.renderers.StreamingJSONResponse) are compressed chunk by chunk as they are sent.
+
+For each endpoint (url name), bizease.metrics counts the bytes before and after compression and the cpu time spent
+compressing under 'compression.<endpoint>.*' and CompressionReportView summarizes them to help tune the thresholds.
+"""
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from rest_framework.views import APIView
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework import status
+from . import metrics
+import time
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+
+COMPRESSIBLE_CONTENT_TYPES = ("application/json", "text/", "application/javascript", "application/yaml")
+
+
+def is_compressible(content_type):
+    content_type = content_type.split(";")[0].strip().lower()
+    # vendor json media types, e.g the columnar format's application/vnd.bizease.columnar+json
+    return content_type.startswith(COMPRESSIBLE_CONTENT_TYPES) or content_type.endswith("+json")
+
+
+def accepted_encodings(header):
+    """ The encodings accepted by an 'Accept-Encoding' header mapped to their quality values """
+    encodings = {}
+    for part in header.split(","):
+        name, *params = [value.strip() for value in part.split(";")]
+        if not name:
+            continue
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        encodings[name.lower()] = quality
+    return encodings
+
+
+def negotiate_encoding(header):
+    """ 'br', 'gzip' or None. Brotli wins ties since it compresses json better at a similar cost """
+    encodings = accepted_encodings(header)
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_quality = None, 0.0
+    for encoding in candidates:
+        quality = encodings.get(encoding, encodings.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class Compressor:
+    """ Incremental compressor with the same interface for both encodings """
+
+    def __init__(self, encoding):
+        if encoding == "br":
+            self.compressor = brotli.Compressor(quality=getattr(settings, "COMPRESSION_BROTLI_QUALITY", 4))
+            self.compress, self.flush, self.finish = self.compressor.process, self.compressor.flush, self.compressor.finish
+        else:
+            # wbits=31 writes a gzip header and trailer around the deflate stream
+            self.compressor = zlib.compressobj(getattr(settings, "COMPRESSION_GZIP_LEVEL", 6), zlib.DEFLATED, 31)
+            self.compress = self.compressor.compress
+            self.flush = lambda: self.compressor.flush(zlib.Z_SYNC_FLUSH)
+            self.finish = self.compressor.flush
+
+
+def endpoint_name(request):
+    match = getattr(request, "resolver_match", None)
+    return (match.url_name if match and match.url_name else None) or "other"
+
+
+def record(endpoint, bytes_in, bytes_out, cpu_seconds):
+    metrics.incr(f"compression.{endpoint}.responses")
+    metrics.incr(f"compression.{endpoint}.bytes_in", bytes_in)
+    metrics.incr(f"compression.{endpoint}.bytes_out", bytes_out)
+    metrics.incr(f"compression.{endpoint}.cpu_us", round(cpu_seconds * 1_000_000))
+
+
+class CompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if (
+            response.has_header("Content-Encoding") or response.status_code in (204, 304) or getattr(response, "is_async", False)
+            or not is_compressible(response.get("Content-Type", ""))
+        ):
+            return response
+        # the response varies with Accept-Encoding even when it's sent uncompressed
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        encoding = negotiate_encoding(request.headers.get("Accept-Encoding", ""))
+        if encoding is None:
+            return response
+
+        endpoint = endpoint_name(request)
+        if response.streaming:
+            response.streaming_content = self.compress_stream(response.streaming_content, encoding, endpoint)
+            del response["Content-Length"]
+        else:
+            min_size = getattr(settings, "COMPRESSION_MIN_SIZE", 1024)
+            if len(response.content) < min_size:
+                metrics.incr(f"compression.{endpoint}.skipped")
+                metrics.incr(f"compression.{endpoint}.skipped_bytes", len(response.content))
+                return response
+
+            started = time.thread_time()
+            compressor = Compressor(encoding)
+            compressed = compressor.compress(response.content) + compressor.finish()
+            record(endpoint, len(response.content), len(compressed), time.thread_time() - started)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response["Content-Length"] = str(len(compressed))
+
+        # The compressed bytes differ from the uncompressed ones so a strong ETag has to be weakened (the same as
+        # django's GZipMiddleware does). If-None-Match uses weak comparison so revalidation still works
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        response["Content-Encoding"] = encoding
+        return response
+
+    def compress_stream(self, chunks, encoding, endpoint):
+        compressor = Compressor(encoding)
+        bytes_in = bytes_out = 0
+        cpu_seconds = 0.0
+        try:
+            for chunk in chunks:
+                started = time.thread_time()
+                # each chunk is flushed so the client receives data as soon as it's produced
+                compressed = compressor.compress(chunk) + compressor.flush()
+                cpu_seconds += time.thread_time() - started
+                bytes_in += len(chunk)
+                bytes_out += len(compressed)
+                if compressed:
+                    yield compressed
+            started = time.thread_time()
+            compressed = compressor.finish()
+            cpu_seconds += time.thread_time() - started
+            bytes_out += len(compressed)
+            yield compressed
+        finally:
+            record(endpoint, bytes_in, bytes_out, cpu_seconds)
+
+
+def compression_report():
+    """ The compression counters of each endpoint with the ratios needed to judge whether compressing it pays off """
+    counters = metrics.snapshot("compression.")
+    endpoints = {}
+    for name, value in counters.items():
+        endpoint, counter = name.removeprefix("compression.").rsplit(".", 1)
+        endpoints.setdefault(endpoint, {
+            "responses": 0, "bytes_in": 0, "bytes_out": 0, "cpu_us": 0, "skipped": 0, "skipped_bytes": 0
+        })[counter] = value
+
+    for endpoint in endpoints.values():
+        saved = endpoint["bytes_in"] - endpoint["bytes_out"]
+        endpoint["bytes_saved"] = saved
+        endpoint["ratio"] = round(endpoint["bytes_out"] / endpoint["bytes_in"], 4) if endpoint["bytes_in"] else None
+        endpoint["bytes_saved_per_cpu_ms"] = round(saved / (endpoint["cpu_us"] / 1000)) if endpoint["cpu_us"] else None
+        endpoint["avg_skipped_size"] = round(endpoint["skipped_bytes"] / endpoint["skipped"]) if endpoint["skipped"] else None
+    return endpoints
+
+
+class CompressionReportView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, **kwargs):
+        return Response({"data": compression_report()}, status=status.HTTP_200_OK)
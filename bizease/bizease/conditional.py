@@ -0,0 +1,111 @@
+"""
+Optimistic concurrency control and conditional requests for rows that can be edited by more than one request at a
+time (inventory items, orders).
+
+Versioned rows carry a 'version' that is bumped by every UPDATE and every UPDATE is conditional on the version the
+instance was read with, so a write based on stale data fails with VersionConflict instead of silently overwriting
+the changes of another request. The version is exposed to clients as an ETag and checked against 'If-Match' on
+writes and 'If-None-Match' on reads.
+"""
+from django.db import models
+from django.db.models import Count, Max, Sum
+import hashlib
+from rest_framework.response import Response
+from rest_framework import status
+
+
+class VersionConflict(Exception):
+    """ The row was changed by another transaction after the instance being saved was read """
+    pass
+
+
+class VersionedModel(models.Model):
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # UPDATE ... SET version = <read version> + 1 WHERE id = <pk> AND version = <read version>
+        expected_version = self.version
+        values = [value for value in values if value[0].attname != "version"]
+        values.append((self._meta.get_field("version"), None, expected_version + 1))
+
+        updated = super()._do_update(
+            base_qs.filter(version=expected_version), using, pk_val, values, update_fields, forced_update
+        )
+        if updated:
+            self.version = expected_version + 1
+        elif base_qs.filter(pk=pk_val).exists():
+            raise VersionConflict(f"{self._meta.object_name} {pk_val} was modified by another request")
+        return updated
+
+
+def version_etag(version):
+    return f'"{version}"'
+
+
+def etag_for(instance):
+    return version_etag(instance.version)
+
+
+def list_etag(request, queryset):
+    """
+    A strong ETag for a list of versioned rows that is computed with one aggregate query instead of from the rows.
+    Any insert changes the max id, any delete the count and any update the sum of versions. The owner and the full
+    path (filters, ordering, page, ...) are part of the tag because they determine which rows the list holds, and so is
+    the negotiated media type because it determines how they are represented.
+    """
+    state = queryset.order_by().aggregate(count=Count("id"), last_id=Max("id"), versions=Sum("version"))
+    media_type = getattr(request, "accepted_media_type", "")
+    key = f"{request.user.id}:{request.get_full_path()}:{media_type}:{state['count']}:{state['last_id']}:{state['versions']}"
+    return '"' + hashlib.sha256(key.encode()).hexdigest()[:32] + '"'
+
+
+def if_none_match(request, etag):
+    """ True if the client's cached copy (identified by 'If-None-Match') is still current. Uses weak comparison """
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in [tag.strip().removeprefix("W/") for tag in header.split(",")]
+
+
+def cache_headers(etag):
+    # 'no-cache' makes browsers revalidate the cached response with 'If-None-Match' every time instead of reusing it
+    return {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept, Authorization"}
+
+
+def not_modified_response(etag):
+    return Response(status=status.HTTP_304_NOT_MODIFIED, headers=cache_headers(etag))
+
+
+def if_match_failed(request, instance):
+    """ True if the request has an 'If-Match' header that doesn't match the current version of the instance """
+    header = request.headers.get("If-Match")
+    if not header or header.strip() == "*":
+        return False
+    # The tag is only weakened when the response was compressed (see bizease.compression). It still names the version
+    return etag_for(instance) not in [etag.strip().removeprefix("W/") for etag in header.split(",")]
+
+
+def precondition_failed_response(instance):
+    return Response(
+        {"detail": "The resource has been modified since it was last retrieved. Fetch it again and retry"},
+        status=status.HTTP_412_PRECONDITION_FAILED, headers={"ETag": etag_for(instance)}
+    )
+
+
+def version_conflict_response(request):
+    """
+    The response for a write that lost a race against another request. If the client made the write conditional with
+    'If-Match', the precondition it asked for has failed. Otherwise the write simply conflicted with another one
+    """
+    if request.headers.get("If-Match"):
+        status_code = status.HTTP_412_PRECONDITION_FAILED
+    else:
+        status_code = status.HTTP_409_CONFLICT
+    return Response(
+        {"detail": "The resource has been modified since it was last retrieved. Fetch it again and retry"}, status=status_code
+    )
@@ -0,0 +1,38 @@
+"""
+In-process counters for operational metrics (transaction retries, response compression, ...).
+
+Counters are per worker process and reset when the process restarts. Staff users can read the
+current values of the process that served the request from the metrics endpoint.
+"""
+from collections import defaultdict
+from rest_framework.views import APIView
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework import status
+import threading
+
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+
+
+def incr(name, value=1):
+    with _lock:
+        _counters[name] += value
+
+
+def snapshot(prefix=""):
+    with _lock:
+        return {name: value for name, value in _counters.items() if name.startswith(prefix)}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+
+
+class MetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, **kwargs):
+        return Response({"data": snapshot(request.GET.get("prefix", ""))}, status=status.HTTP_200_OK)
@@ -0,0 +1,56 @@
+"""
+Keyset ('cursor') pagination.
+
+Instead of an OFFSET, which makes the db read and discard every row before the requested page, the next page is
+selected with a WHERE clause on the position of the last row of the previous page. Each page costs the same no matter
+how deep into the list it is and rows inserted or deleted in between pages don't cause rows to be skipped or repeated.
+The position is handed to the client as an opaque cursor.
+"""
+from django.db.models import Q
+import base64
+import json
+
+
+def model_position(ordering, row):
+    return getattr(row, ordering.lstrip("-")), row.id
+
+
+def encode_cursor(ordering, value, row_id):
+    return base64.urlsafe_b64encode(json.dumps([ordering, str(value), row_id]).encode()).decode()
+
+
+def decode_cursor(cursor, ordering):
+    """ Returns the (value, id) position in the cursor. Raises ValueError if it's malformed or was made for another ordering """
+    try:
+        cursor_ordering, value, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if cursor_ordering != ordering or type(last_id) != int:
+        raise ValueError("Invalid cursor")
+    return value, last_id
+
+
+def keyset_page(queryset, ordering, cursor, page_size, position=model_position):
+    """
+    Returns (rows, next_cursor) for the page after 'cursor' (the first page if cursor is empty) of the queryset ordered by
+    'ordering' (a field name with an optional '-'). Ties are broken by id in the same direction, so that should be part
+    of an index together with the field for the page to be an index range scan. next_cursor is None on the last page.
+
+    position(ordering, row) returns the (ordering field value, id) of a row. The default one reads them from model instances.
+    """
+    field = ordering.lstrip("-")
+    descending = ordering.startswith("-")
+    id_ordering = "-id" if descending else "id"
+    queryset = queryset.order_by(ordering, id_ordering) if field != "id" else queryset.order_by(id_ordering)
+
+    if cursor:
+        value, last_id = decode_cursor(cursor, ordering)
+        comparison = "lt" if descending else "gt"
+        if field == "id":
+            queryset = queryset.filter(**{f"id__{comparison}": last_id})
+        else:
+            queryset = queryset.filter(Q(**{f"{field}__{comparison}": value}) | Q(**{field: value, f"id__{comparison}": last_id}))
+
+    rows = list(queryset[:page_size + 1]) # the extra row tells if there's a next page
+    next_cursor = encode_cursor(ordering, *position(ordering, rows[page_size - 1])) if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
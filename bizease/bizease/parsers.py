@@ -0,0 +1,26 @@
+"""
+Parsers shared by the API views.
+"""
+from django.conf import settings
+from rest_framework import parsers
+from rest_framework.exceptions import ParseError
+import codecs
+import orjson
+
+
+class FastJSONParser(parsers.JSONParser):
+    """ JSONParser that parses utf-8 request bodies, i.e nearly all of them, with orjson """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get("encoding", settings.DEFAULT_CHARSET)
+        if codecs.lookup(encoding).name != "utf-8":
+            return super().parse(stream, media_type, parser_context)
+        try:
+            # orjson rejects NaN and Infinity, which is what strict json parsing does as well
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+# The JSON parser of the current environment. Views that only accept JSON use it as their only parser
+JSONParser = FastJSONParser if getattr(settings, "FAST_JSON", False) else parsers.JSONParser
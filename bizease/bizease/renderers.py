@@ -0,0 +1,126 @@
+"""
+Renderers shared by the API views.
+
+FastJSONRenderer produces the same JSON as DRF's JSONRenderer with orjson instead of json.dumps and DRF's encoder.
+Strings, numbers and UUIDs are encoded natively by orjson and the remaining types the API returns (dates, datetimes,
+Decimal, ...) are looked up by their exact type in a table of encoders before falling back to DRF's encoder. Dates and
+times are passed through to the encoders because orjson's own format differs from DRF's: DRF keeps the microseconds
+and the seconds of UTC offsets, orjson rounds offsets to the minute.
+Which JSON renderer is used is chosen per environment in settings (see FAST_JSON).
+"""
+from django.conf import settings
+from django.db.models.query import QuerySet
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from itertools import islice
+import orjson
+
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+def encode_datetime(value):
+    representation = value.isoformat()
+    return representation[:-6] + "Z" if representation.endswith("+00:00") else representation
+
+
+# Encoders for types orjson doesn't support (or passes through), keyed by exact type. They match the output of DRF's
+# JSONEncoder. Times are left to DRF's encoder, which rejects timezone-aware ones
+FAST_ENCODERS = {
+    datetime: encode_datetime,
+    date: date.isoformat,
+    Decimal: float,
+    timedelta: lambda value: str(value.total_seconds()),
+    bytes: bytes.decode,
+}
+
+_drf_encoder = JSONEncoder()
+
+
+def encode_default(value):
+    encode = FAST_ENCODERS.get(type(value))
+    if encode is not None:
+        return encode(value)
+    if isinstance(value, QuerySet):
+        return list(value)
+    return _drf_encoder.default(value)
+
+
+def dumps(data):
+    return orjson.dumps(data, default=encode_default, option=ORJSON_OPTIONS)
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            # indented output (e.g for the browsable api) isn't worth optimizing and orjson only indents by 2 spaces
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = dumps(data)
+        except orjson.JSONEncodeError:
+            # e.g integers that don't fit in 64 bits. json.dumps either handles them or raises the usual error
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same as JSONRenderer: \u2028 and \u2029 are escaped so the output is a strict javascript subset
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
+
+
+class ColumnarJSONRenderer(FastJSONRenderer):
+    """
+    Opt-in compact representation of lists, requested with '?format=columnar' or the media type below. Views that support
+    it check `request.accepted_renderer.format == "columnar"` and return tables as {"fields": [...], "rows": [[...], ...]}
+    (see bizease.serializers.columnar) instead of a list of objects that repeat every key for every row.
+    """
+    media_type = "application/vnd.bizease.columnar+json"
+    format = "columnar"
+
+
+def columnar_requested(request):
+    return getattr(request.accepted_renderer, "format", None) == ColumnarJSONRenderer.format
+
+
+# Stands in for the streamed array when the rest of the response is rendered
+STREAMED_ARRAY = "\x00streamed-array\x00"
+
+
+def streamed_length(request, queryset):
+    """
+    The number of rows in the queryset if they should be streamed as a StreamingJSONResponse, None otherwise. Only
+    plain JSON responses rendered by FastJSONRenderer are streamed, once there are at least JSON_STREAMING_MIN_ITEMS rows.
+    """
+    min_items = getattr(settings, "JSON_STREAMING_MIN_ITEMS", None)
+    renderer = getattr(request, "accepted_renderer", None)
+    if min_items is None or type(renderer) != FastJSONRenderer or renderer.get_indent(request.accepted_media_type, {}) is not None:
+        return None
+    length = queryset.count()
+    return length if length >= min_items else None
+
+
+class StreamingJSONResponse(StreamingHttpResponse):
+    """
+    Streams a JSON document that holds a large array. 'data' is the document with STREAMED_ARRAY in place of the
+    array and serialize(items) returns the representations of a batch of items. Items are read from the iterable
+    and serialized batch_size at a time so neither the objects nor the encoded array are ever held in memory at once.
+    """
+
+    def __init__(self, data, items, serialize, batch_size=500, **kwargs):
+        head, tail = dumps(data).split(dumps(STREAMED_ARRAY), 1)
+        kwargs.setdefault("content_type", FastJSONRenderer.media_type)
+        super().__init__(self.chunks(head, iter(items), serialize, batch_size, tail), **kwargs)
+
+    @staticmethod
+    def chunks(head, items, serialize, batch_size, tail):
+        yield head + b"["
+        separator = b""
+        while batch := list(islice(items, batch_size)):
+            encoded = FastJSONRenderer().render(list(serialize(batch)))
+            if len(encoded) > 2:
+                yield separator + encoded[1:-1]
+                separator = b","
+        yield b"]" + tail
@@ -0,0 +1,73 @@
+"""
+Sparse fieldsets for list endpoints: '?fields=id,product_name,price' returns (and selects from the db) only the listed
+fields and '?expand=ordered_products' opts into related rows that are otherwise left out of a sparse response.
+
+Also builds the tables of the columnar format (see bizease.renderers.ColumnarJSONRenderer).
+"""
+
+
+class DynamicFieldsMixin:
+    """ Lets the user of a serializer keep only some of its fields with the 'fields' keyword argument """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
+def parse_sparse_fieldset(request, allowed_fields, expandable=()):
+    """
+    Returns the (fields, expand) lists requested with the 'fields' and 'expand' query parameters. 'fields' is None if
+    the parameter is absent, in which case the full representation should be returned. 'id' is always included.
+    Raises ValueError for names that aren't in allowed_fields or expandable.
+    """
+    fields = None
+    if request.GET.get("fields"):
+        fields = [name.strip() for name in request.GET["fields"].split(",") if name.strip()]
+        unknown_fields = [name for name in fields if name not in allowed_fields]
+        if unknown_fields:
+            raise ValueError(f"Invalid value for fields parameter. Unknown field(s): {', '.join(unknown_fields)}")
+        if "id" not in fields:
+            fields.insert(0, "id")
+
+    expand = [name.strip() for name in request.GET.get("expand", "").split(",") if name.strip()]
+    unknown_expansions = [name for name in expand if name not in expandable]
+    if unknown_expansions:
+        raise ValueError(f"Invalid value for expand parameter. Unknown relation(s): {', '.join(unknown_expansions)}")
+    return fields, expand
+
+
+def columnar(queryset, serializer, field_names):
+    """
+    Returns {"fields": field_names, "rows": [[...], ...]} for the queryset. Rows are built straight from .values_list()
+    and each column is converted with the to_representation() of the serializer's field of the same name, so a row
+    holds exactly the values the serializer would have put in a dict for the same object.
+    """
+    return columnar_rows(queryset.values_list(*field_names), serializer, field_names)
+
+
+def columnar_rows(rows, serializer, field_names):
+    """ Same as columnar() for rows (tuples of the values of field_names) that have already been fetched """
+    converters = [serializer.fields[name].to_representation for name in field_names]
+    return {
+        "fields": list(field_names),
+        "rows": [[None if value is None else convert(value) for convert, value in zip(converters, row)] for row in rows]
+    }
+
+
+def is_table(value):
+    return type(value) == dict and list(value) == ["fields", "rows"]
+
+
+def rows_to_dicts(table):
+    """ The inverse of columnar(): the list of dicts of the default format. Nested tables are converted as well """
+    return [
+        {name: rows_to_dicts(value) if is_table(value) else value for name, value in zip(table["fields"], row)}
+        for row in table["rows"]
+    ]
+
+
+def rows_to_columns(table):
+    """ Column arrays ({"field": [values]}) for chart data """
+    return {name: [row[index] for row in table["rows"]] for index, name in enumerate(table["fields"])}
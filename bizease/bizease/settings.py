@@ -48,6 +48,7 @@ INSTALLED_APPS = [
     'orders',
     'dashboard',
     'reports',
+    'jobs',
     "corsheaders",
     'rest_framework',
     'rest_framework_simplejwt',
@@ -76,17 +77,101 @@ AUTHENTICATION_BACKENDS = [
 ]
 
 
+# JSON is rendered and parsed with orjson (bizease.renderers.FastJSONRenderer and bizease.parsers.FastJSONParser)
+# unless FAST_JSON is disabled. The browsable api is only enabled outside production
+FAST_JSON = os.getenv('FAST_JSON', 'true').lower() == 'true'
+
+if FAST_JSON:
+    renderer_classes = ['bizease.renderers.FastJSONRenderer']
+    parser_classes = ['bizease.parsers.FastJSONParser']
+else:
+    renderer_classes = ['rest_framework.renderers.JSONRenderer']
+    parser_classes = ['rest_framework.parsers.JSONParser']
+if curr_env != "production":
+    renderer_classes.append('rest_framework.renderers.BrowsableAPIRenderer')
+
+# Unpaginated lists with at least this many items are streamed instead of being rendered in one piece
+JSON_STREAMING_MIN_ITEMS = int(os.getenv('JSON_STREAMING_MIN_ITEMS', 1000))
+
+# Responses of at least COMPRESSION_MIN_SIZE bytes are compressed with gzip (or brotli, if the 'brotli' package is
+# installed) when the client accepts it. Streamed responses are always compressed
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 4
+
 REST_FRAMEWORK = {
     'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.URLPathVersioning',
-    'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
+    'DEFAULT_RENDERER_CLASSES': renderer_classes,
+    'DEFAULT_PARSER_CLASSES': [
+        *parser_classes,
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework_simplejwt.authentication.JWTAuthentication',
  ] 
 }
 
+# When enabled, new orders are queued and acknowledged with '202 Accepted' instead of being created inline.
+# Queued orders are applied by background jobs (see orders.intake). Orders still being applied after
+# ORDER_INTAKE_TIMEOUT seconds are assumed to belong to a worker that died and are queued again
+ORDER_INTAKE_ASYNC = os.getenv('ORDER_INTAKE_ASYNC', 'false').lower() == 'true'
+ORDER_INTAKE_TIMEOUT = 300
+
+# Results of report jobs (see reports.jobs) are kept for REPORT_JOB_RESULT_TTL seconds. Jobs still running after
+# REPORT_JOB_TIMEOUT seconds are assumed to belong to a worker that died and are queued again
+REPORT_JOB_RESULT_TTL = int(os.getenv('REPORT_JOB_RESULT_TTL', 3600))
+REPORT_JOB_TIMEOUT = 900
+
+# Background jobs (see jobs.queue), run by python manage.py run_worker. Failed runs are retried after
+# min(JOBS_RETRY_MAX_DELAY, JOBS_RETRY_DELAY * 2^(attempt - 1)) seconds. Workers refresh the jobs they run every
+# JOBS_HEARTBEAT seconds, jobs not refreshed for JOBS_TIMEOUT seconds are assumed to belong to a worker that died and
+# finished jobs are deleted after JOBS_RETENTION seconds
+JOBS_RETRY_DELAY = 10
+JOBS_RETRY_MAX_DELAY = 3600
+JOBS_HEARTBEAT = 60
+JOBS_TIMEOUT = 600
+JOBS_RETENTION = 7 * 24 * 3600
+
+# Jobs enqueued on a cron schedule (minute hour day-of-month month day-of-week) by the workers, see jobs.cron
+PERIODIC_JOBS = {
+    "precompute-report-snapshots": {"task": "reports.precompute_report_snapshots", "cron": "5 0 * * *"},
+    "detect-low-stock": {"task": "inventory.detect_low_stock", "cron": "*/5 * * * *"},
+    "low-stock-digests": {"task": "inventory.send_low_stock_digests", "cron": "0 * * * *"},
+    "requeue-stale-intakes": {"task": "orders.requeue_stale_intakes", "cron": "*/5 * * * *"},
+    "clean-up-report-jobs": {"task": "reports.clean_up_report_jobs", "cron": "*/5 * * * *"},
+}
+
+# When enabled, report revenue and sales are computed from numpy columns of each tenant's delivered orders (see
+# reports.analytics) instead of database aggregates. Off by default: the columns are loaded by every process for every
+# tenant and only pay off for tenants whose reports are read much more often than their orders change. The columns of
+# REPORT_ANALYTICS_CACHE_SIZE tenants at most are kept in memory
+REPORT_ANALYTICS = os.getenv('REPORT_ANALYTICS', 'false').lower() == 'true'
+REPORT_ANALYTICS_CACHE_SIZE = int(os.getenv('REPORT_ANALYTICS_CACHE_SIZE', 64))
+
+# Products are in class A of the ABC classification (see reports.pareto) until the products ranked above them take
+# ABC_CLASS_SHARES[0] percent of the period's revenue (or units), in class B until they take ABC_CLASS_SHARES[1] percent
+ABC_CLASS_SHARES = (80, 95)
+
+# Stock-out forecasts (see inventory.forecast) use an EWMA of daily sales with a span of FORECAST_EWMA_SPAN_DAYS and
+# suggest reordering items that run out within FORECAST_LEAD_TIME_DAYS, enough for FORECAST_COVER_DAYS more days of
+# sales. The sales velocities of FORECAST_CACHE_SIZE tenants at most are kept in memory
+FORECAST_EWMA_SPAN_DAYS = int(os.getenv('FORECAST_EWMA_SPAN_DAYS', 14))
+FORECAST_LEAD_TIME_DAYS = int(os.getenv('FORECAST_LEAD_TIME_DAYS', 7))
+FORECAST_COVER_DAYS = int(os.getenv('FORECAST_COVER_DAYS', 30))
+FORECAST_CACHE_SIZE = int(os.getenv('FORECAST_CACHE_SIZE', 64))
+
+# An item gets at most one low stock alert every LOW_STOCK_ALERT_DEBOUNCE seconds (see inventory.alerts) and low stock
+# digests are sent LOW_STOCK_DIGEST_BATCH_SIZE at a time over one SMTP connection
+LOW_STOCK_ALERT_DEBOUNCE = 24 * 3600
+LOW_STOCK_DIGEST_BATCH_SIZE = 50
+
+# Transactions that fail with a deadlock or serialization error are retried up to TRANSACTION_MAX_ATTEMPTS times
+# after a random delay of at most min(TRANSACTION_RETRY_MAX_DELAY, TRANSACTION_RETRY_BASE_DELAY * 2^attempt) seconds
+TRANSACTION_MAX_ATTEMPTS = int(os.getenv('TRANSACTION_MAX_ATTEMPTS', 5))
+TRANSACTION_RETRY_BASE_DELAY = 0.02
+TRANSACTION_RETRY_MAX_DELAY = 1.0
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(hours=1), # change to 1 hour in the final release
     "REFRESH_TOKEN_LIFETIME": timedelta(days=5),
@@ -96,12 +181,14 @@ SIMPLE_JWT = {
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
+    'bizease.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     # 'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'bizease.tenancy.TenantScopeMiddleware',
 ]
 
 CORS_ALLOWED_ORIGINS = os.getenv('ALLOWED_ORIGINS', 'http://localhost:3000').split(',')
@@ -0,0 +1,117 @@
+"""
+Tenant scoping for the models that belong to a single user's business (inventory items, orders, ...).
+
+Querysets of those models must be scoped to an owner with `for_owner()` before they are evaluated inside
+an API request. Evaluating an unscoped queryset while a request is being served raises UnscopedQueryError,
+so a forgotten owner filter fails loudly instead of silently scanning (and leaking) every tenant's rows.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import models
+from rest_framework.views import APIView
+
+
+_scope_enforced = ContextVar("tenant_scope_enforced", default=False)
+
+
+class UnscopedQueryError(RuntimeError):
+    pass
+
+
+@contextmanager
+def enforce_tenant_scope():
+    token = _scope_enforced.set(True)
+    try:
+        yield
+    finally:
+        _scope_enforced.reset(token)
+
+
+class TenantQuerySet(models.QuerySet):
+    owner_field = "owner" # lookup from the model to the owning CustomUser
+    default_select_related = ()
+    default_prefetch_related = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._tenant_scoped = False
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._tenant_scoped = self._tenant_scoped
+        return clone
+
+    def for_owner(self, owner):
+        """ Scopes the queryset to the rows of one owner (a user or a user id) and applies the standard related lookups """
+        queryset = self.filter(**{self.owner_field: owner})
+        if self.default_select_related:
+            queryset = queryset.select_related(*self.default_select_related)
+        if self.default_prefetch_related:
+            queryset = queryset.prefetch_related(*self.default_prefetch_related)
+        queryset._tenant_scoped = True
+        return queryset
+
+    def unscoped(self):
+        """
+        Explicitly opts out of tenant scoping. Only meant for querysets that are already restricted
+        to ids taken from a scoped queryset and for cross-tenant maintenance jobs.
+        """
+        queryset = self._chain()
+        queryset._tenant_scoped = True
+        return queryset
+
+    def assert_scoped(self):
+        # Related managers (e.g order.ordered_products) are implicitly scoped by the instance they were accessed from
+        if _scope_enforced.get() and not self._tenant_scoped and "instance" not in self._hints:
+            raise UnscopedQueryError(f"Unscoped {self.model.__name__} query evaluated inside a request. Use for_owner()")
+
+    def _fetch_all(self):
+        if self._result_cache is None:
+            self.assert_scoped()
+        super()._fetch_all()
+
+    def iterator(self, *args, **kwargs):
+        self.assert_scoped()
+        return super().iterator(*args, **kwargs)
+
+    def count(self):
+        if self._result_cache is None:
+            self.assert_scoped()
+        return super().count()
+
+    def exists(self):
+        if self._result_cache is None:
+            self.assert_scoped()
+        return super().exists()
+
+    def aggregate(self, *args, **kwargs):
+        self.assert_scoped()
+        return super().aggregate(*args, **kwargs)
+
+    def update(self, **kwargs):
+        self.assert_scoped()
+        return super().update(**kwargs)
+
+    def delete(self):
+        self.assert_scoped()
+        return super().delete()
+
+
+class TenantScopeMiddleware:
+    """ Enforces tenant scoping while an API view (and the rendering of its response) is running """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.tenant_scope_token = None
+        try:
+            return self.get_response(request)
+        finally:
+            if request.tenant_scope_token is not None:
+                _scope_enforced.reset(request.tenant_scope_token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, "cls", None)
+        if view_class is not None and issubclass(view_class, APIView):
+            request.tenant_scope_token = _scope_enforced.set(True)
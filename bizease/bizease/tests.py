@@ -0,0 +1,97 @@
+from django.test import SimpleTestCase, TestCase, RequestFactory, override_settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from unittest.mock import patch
+from accounts.models import CustomUser
+from bizease import metrics
+from bizease.compression import CompressionMiddleware, negotiate_encoding, compression_report
+import gzip
+import json
+
+
+class CompressionMiddlewareTest(SimpleTestCase):
+	def setUp(self):
+		metrics.reset()
+		self.body = json.dumps({"data": [{"id": index, "name": f"item {index}"} for index in range(200)]}).encode()
+
+	def get(self, response, accept_encoding="gzip"):
+		request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept_encoding)
+		return CompressionMiddleware(lambda request: response)(request)
+
+	def json_response(self, **headers):
+		return HttpResponse(self.body, content_type="application/json", headers=headers)
+
+	def test_encoding_negotiation(self):
+		self.assertEqual(negotiate_encoding("gzip, deflate"), "gzip")
+		self.assertEqual(negotiate_encoding("*"), "gzip")
+		self.assertIsNone(negotiate_encoding("gzip;q=0, identity"))
+		self.assertIsNone(negotiate_encoding(""))
+		with patch("bizease.compression.brotli", object()):
+			self.assertEqual(negotiate_encoding("gzip, br"), "br")
+			self.assertEqual(negotiate_encoding("gzip, br;q=0.5"), "gzip")
+		with patch("bizease.compression.brotli", None):
+			self.assertEqual(negotiate_encoding("br"), None)
+
+	@override_settings(COMPRESSION_MIN_SIZE=100)
+	def test_large_responses_are_compressed(self):
+		response = self.get(self.json_response(ETag='"v1"'), "gzip, deflate")
+		self.assertEqual(response.headers["Content-Encoding"], "gzip")
+		self.assertEqual(int(response.headers["Content-Length"]), len(response.content))
+		self.assertEqual(gzip.decompress(response.content), self.body)
+		self.assertIn("Accept-Encoding", response.headers["Vary"])
+		self.assertEqual(response.headers["ETag"], 'W/"v1"') # the compressed bytes differ, so a strong ETag is weakened
+
+		report = compression_report()["other"]
+		self.assertEqual((report["responses"], report["bytes_in"], report["skipped"]), (1, len(self.body), 0))
+		self.assertLess(report["bytes_out"], report["bytes_in"])
+
+	def test_responses_that_arent_compressed(self):
+		with override_settings(COMPRESSION_MIN_SIZE=len(self.body) + 1):
+			response = self.get(self.json_response())
+			self.assertNotIn("Content-Encoding", response.headers)
+			# the response still varies with Accept-Encoding
+			self.assertIn("Accept-Encoding", response.headers["Vary"])
+		self.assertEqual(compression_report()["other"]["skipped_bytes"], len(self.body))
+
+		with override_settings(COMPRESSION_MIN_SIZE=100):
+			self.assertNotIn("Content-Encoding", self.get(self.json_response(), "gzip;q=0, identity").headers)
+			self.assertNotIn("Content-Encoding", self.get(HttpResponse(self.body, content_type="image/png")).headers)
+			already_encoded = self.get(self.json_response(**{"Content-Encoding": "br"}))
+			self.assertEqual((already_encoded.headers["Content-Encoding"], already_encoded.content), ("br", self.body))
+
+	def test_streamed_responses_are_compressed_as_they_are_sent(self):
+		chunks = [self.body[:500], self.body[500:], b""]
+		response = self.get(StreamingHttpResponse(iter(chunks), content_type="application/json"))
+		self.assertEqual(response.headers["Content-Encoding"], "gzip")
+		self.assertNotIn("Content-Length", response.headers)
+		self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), self.body)
+		self.assertEqual(compression_report()["other"]["bytes_in"], len(self.body))
+
+
+class CompressionReportViewTest(TestCase):
+	def setUp(self):
+		metrics.reset()
+		self.admin = CustomUser.objects.create(
+			business_name="Admin-biz", full_name="admin", email="admin@gmail.com", password="12345678", is_active=True, is_staff=True
+		)
+		self.client = APIClient()
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + str(RefreshToken.for_user(self.admin).access_token))
+
+	@override_settings(COMPRESSION_MIN_SIZE=100)
+	def test_responses_are_compressed_by_the_installed_middleware(self):
+		for endpoint in ["orders", "inventory", "reports"]:
+			metrics.incr(f"compression.{endpoint}.responses")
+			metrics.incr(f"compression.{endpoint}.bytes_in", 2000)
+			metrics.incr(f"compression.{endpoint}.bytes_out", 500)
+		uncompressed = self.client.get(reverse("compression-report", args=["v1"]), HTTP_ACCEPT_ENCODING="identity")
+		self.assertEqual(uncompressed.status_code, 200)
+		self.assertNotIn("Content-Encoding", uncompressed.headers)
+
+		response = self.client.get(reverse("compression-report", args=["v1"]), HTTP_ACCEPT_ENCODING="gzip")
+		self.assertEqual(response.headers["Content-Encoding"], "gzip")
+		self.assertEqual(json.loads(gzip.decompress(response.content)), uncompressed.json())
+		self.assertEqual(uncompressed.json()["data"]["orders"]["ratio"], 0.25)
+		# counted under the endpoint's url name
+		self.assertEqual(compression_report()["compression-report"]["responses"], 1)
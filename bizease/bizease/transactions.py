@@ -0,0 +1,68 @@
+"""
+A shared runner for transactions that touch inventory rows.
+
+Deadlocks are avoided by always locking inventory rows in the same order (by id) and transactions that still
+fail with a deadlock or serialization error (or sqlite's "database is locked") are retried with jittered
+exponential backoff. Retries are counted in bizease.metrics under 'transactions.<name>.*'.
+"""
+from django.conf import settings
+from django.db import transaction, connection, OperationalError
+from . import metrics
+import random
+import time
+
+
+# SQLSTATE codes of postgres errors that are safe to retry: serialization_failure and deadlock_detected
+RETRYABLE_SQLSTATES = ("40001", "40P01")
+RETRYABLE_MESSAGES = ("deadlock detected", "could not serialize access", "database is locked", "database table is locked")
+
+
+def is_retryable(error):
+    cause = error.__cause__
+    sqlstate = getattr(cause, "sqlstate", None) or getattr(cause, "pgcode", None)
+    if sqlstate in RETRYABLE_SQLSTATES:
+        return True
+    message = str(error).lower()
+    return any(retryable_message in message for retryable_message in RETRYABLE_MESSAGES)
+
+
+def backoff_delay(attempt):
+    """ 'Full jitter' exponential backoff: a random delay between 0 and base * 2^attempt, capped """
+    base_delay = getattr(settings, "TRANSACTION_RETRY_BASE_DELAY", 0.02)
+    max_delay = getattr(settings, "TRANSACTION_RETRY_MAX_DELAY", 1.0)
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def run_in_transaction(func, *args, name="default", **kwargs):
+    """
+    Runs func(*args, **kwargs) in a transaction, retrying the whole transaction if it fails with a retryable error.
+    func must be safe to run more than once, i.e it must reset any in-memory state a failed attempt changed.
+
+    When called inside another transaction, func is simply run in it. Only the outermost transaction can be retried.
+    """
+    if connection.in_atomic_block:
+        return func(*args, **kwargs)
+
+    max_attempts = getattr(settings, "TRANSACTION_MAX_ATTEMPTS", 5)
+    attempt = 1
+    while True:
+        try:
+            with transaction.atomic():
+                return func(*args, **kwargs)
+        except OperationalError as err:
+            if not is_retryable(err):
+                raise
+            if attempt >= max_attempts:
+                metrics.incr(f"transactions.{name}.exhausted")
+                raise
+            metrics.incr(f"transactions.{name}.retries")
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+
+
+def lock_rows(queryset):
+    """
+    Locks the rows of the queryset with SELECT ... FOR UPDATE, always in order of their ids, so that two transactions
+    locking overlapping sets of rows can't each hold a row the other is waiting for. A no-op lock on sqlite.
+    """
+    return list(queryset.select_for_update().order_by("id"))
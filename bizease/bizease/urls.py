@@ -5,6 +5,8 @@ from django.http import HttpResponseNotFound, HttpResponseServerError, HttpRespo
 from django.shortcuts import render
 
 from rest_framework.decorators import api_view
+from .metrics import MetricsView
+from .compression import CompressionReportView
 
 
 def docs_view(request, **kwargs):
@@ -20,7 +22,9 @@ urlpatterns = [
   re_path(r'^(?P<version>(v1))/token/obtain/$', TokenObtainPairView.as_view(), name='token_obtain_pair'),
   re_path(r'^(?P<version>(v1))/token/refresh/$', TokenRefreshView.as_view(), name='token_refresh'),
   re_path(r'^(?P<version>(v1))/token/blacklist/$', TokenBlacklistView.as_view(), name='token_blacklist'),
-  re_path(r'^(?P<version>(v1))/api-docs/$', docs_view)
+  re_path(r'^(?P<version>(v1))/api-docs/$', docs_view),
+  re_path(r'^(?P<version>(v1))/metrics/$', MetricsView.as_view(), name='metrics'),
+  re_path(r'^(?P<version>(v1))/metrics/compression/$', CompressionReportView.as_view(), name='compression-report')
 ]
 
 def custom_404_view(request, exception):
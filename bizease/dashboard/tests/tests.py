@@ -1,5 +1,5 @@
 from rest_framework.test import APITransactionTestCase
-from orders.models import Order, OrderedProduct
+from orders.models import Order, OrderedProduct, OrderBuilder
 from accounts.models import CustomUser
 from inventory.models import Inventory
 from django.urls import reverse
@@ -34,27 +34,23 @@ class DashboardViewTest(APITransactionTestCase):
 		self.item_4 = Inventory.objects.create(owner=self.test_user, product_name="Wheelbarrow", price=150000, stock_level=7, low_stock_threshold=10, date_added="2025-03-20")
 
 		self.order = Order(product_owner_id=self.test_user, client_name="bob", client_email="bob@gmail.com", order_date="2025-02-20")
-		self.order.ordered_products_objects = [OrderedProduct(name="Wheelbarrow", quantity=1, price=150000), OrderedProduct(name="Helmet", quantity=5, price=6000)]
-		self.order.save()
+		OrderBuilder(self.order, [OrderedProduct(name="Wheelbarrow", quantity=1, price=150000), OrderedProduct(name="Helmet", quantity=5, price=6000)]).save()
 
 		self.order_1 = Order(product_owner_id=self.test_user, client_name="Davy Jones", client_email="dv@shipwrecks.ocean", status="Delivered", order_date="2025-02-22")
-		self.order_1.ordered_products_objects = [OrderedProduct(name="Wheelbarrow", quantity=1, price=150000)]
-		self.order_1.save()
+		OrderBuilder(self.order_1, [OrderedProduct(name="Wheelbarrow", quantity=1, price=150000)]).save()
 
 		self.order_2 = Order(product_owner_id=self.test_user, client_name="customer 1", client_phone="08045342896", status="Delivered", order_date="2025-03-19")
-		self.order_2.ordered_products_objects = [
+		OrderBuilder(self.order_2, [
 			OrderedProduct(name="Helmet", quantity=10, price=6000), 
 			OrderedProduct(name="Tape", quantity=4, price=4000), 
 			OrderedProduct(name="Safety Boots", quantity=2, price=65000)
-		]
-		self.order_2.save()
+		]).save()
 
 		self.order_2 = Order(product_owner_id=self.test_user, client_name="customer 2", order_date="2025-04-10")
-		self.order_2.ordered_products_objects = [
+		OrderBuilder(self.order_2, [
 			OrderedProduct(name="Wheelbarrow", quantity=1, price=150000),
 			OrderedProduct(name="Safety Boots", quantity=1, price=65000)
-		]
-		self.order_2.save()
+		]).save()
 
 	def test_get_dashboard_data_without_credentials(self):
 		response = self.client.get(reverse("dashboard-data", args=["v1"]), format="json")
@@ -101,15 +97,13 @@ class DashboardViewTest(APITransactionTestCase):
 	def test_get_date_dashboard_data_with_credentials(self):
 
 		self.order_1 = Order(product_owner_id=self.test_user, client_name="Paul", client_email="dv@shipwrecks.ocean", status="Delivered", order_date="2025-07-28")
-		self.order_1.ordered_products_objects = [OrderedProduct(name="Wheelbarrow", quantity=1, price=150000), OrderedProduct(name="Helmet", quantity=1, price=6000)]
-		self.order_1.save()
+		OrderBuilder(self.order_1, [OrderedProduct(name="Wheelbarrow", quantity=1, price=150000), OrderedProduct(name="Helmet", quantity=1, price=6000)]).save()
 
 		self.order_2 = Order(product_owner_id=self.test_user, client_name="customer 1", client_phone="08045342896", status="Delivered", order_date="2025-07-29")
-		self.order_2.ordered_products_objects = [ 
+		OrderBuilder(self.order_2, [ 
 			OrderedProduct(name="Tape", quantity=5, price=4000), 
 			OrderedProduct(name="Safety Boots", quantity=1, price=65000)
-		]
-		self.order_2.save()
+		]).save()
 
 		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
 		response = self.client.get(reverse("dashboard-data", args=["v1"]), query_params={"period": "2025-07-29"}, format="json")
@@ -129,15 +123,13 @@ class DashboardViewTest(APITransactionTestCase):
 	def test_get_date_dashboard_data_with_credentials_extra_check(self):
 
 		self.order_1 = Order(product_owner_id=self.test_user, client_name="Paul", client_email="dv@shipwrecks.ocean", status="Delivered", order_date="2025-07-28")
-		self.order_1.ordered_products_objects = [ 
+		OrderBuilder(self.order_1, [ 
 			OrderedProduct(name="Tape", quantity=5, price=4000), 
 			OrderedProduct(name="Safety Boots", quantity=1, price=65000)
-		]
-		self.order_1.save()
+		]).save()
 
 		self.order_2 = Order(product_owner_id=self.test_user, client_name="customer 1", client_phone="08045342896", status="Delivered", order_date="2025-07-29")
-		self.order_2.ordered_products_objects = [OrderedProduct(name="Wheelbarrow", quantity=1, price=150000), OrderedProduct(name="Helmet", quantity=1, price=6000)]
-		self.order_2.save()
+		OrderBuilder(self.order_2, [OrderedProduct(name="Wheelbarrow", quantity=1, price=150000), OrderedProduct(name="Helmet", quantity=1, price=6000)]).save()
 
 		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
 		response = self.client.get(reverse("dashboard-data", args=["v1"]), query_params={"period": "2025-07-29"}, format="json")
@@ -1,13 +1,13 @@
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from orders.models import Order, OrderedProduct
+from orders.models import Order, OrderedProduct, ProductSalesStats
 from inventory.models import Inventory
 from rest_framework import status
-from django.db.models import Sum, F
+from django.db.models import Sum
 from orders.serializers import OrderSerializer
 from inventory.serializers import InventoryItemSerializer
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.parsers import JSONParser
+from bizease.parsers import JSONParser
 from datetime import timedelta, datetime
 
 
@@ -34,10 +34,10 @@ class DashBoardView(APIView):
 
             products_orders = (
                 OrderedProduct.objects
-                .filter(order_id__product_owner_id=request.user.id)
+                .for_owner(request.user.id)
                 .filter(order_id__order_date=(period_date))
                 .filter(order_id__status="Delivered")
-                .values("name").annotate(total_units_sold=Sum("quantity"))
+                .group_by_product().annotate(total_units_sold=Sum("quantity"))
                 .order_by("-total_units_sold")
             )
 
@@ -45,11 +45,11 @@ class DashBoardView(APIView):
             if len(products_orders) == 0:
                 dashboard_data["top_selling_product"] = None
             else:
-                dashboard_data["top_selling_product"] = products_orders[0]['name']
+                dashboard_data["top_selling_product"] = products_orders[0]['product_name']
 
             prev_revenue = (
                 Order.objects
-                .filter(product_owner_id=request.user.id)
+                .for_owner(request.user.id)
                 .filter(order_date=(prev_date))
                 .filter(status="Delivered")
                 .aggregate(Sum("total_price"))['total_price__sum']
@@ -58,7 +58,7 @@ class DashBoardView(APIView):
             # revenue - sum of total_price in orders
             dashboard_data["revenue"] = (
                 Order.objects
-                .filter(product_owner_id=request.user.id)
+                .for_owner(request.user.id)
                 .filter(order_date=(period_date))
                 .filter(status="Delivered")
                 .aggregate(Sum("total_price"))['total_price__sum']
@@ -80,7 +80,7 @@ class DashBoardView(APIView):
             orders_serializer = OrderSerializer(
                 list(
                     Order.objects
-                    .filter(product_owner_id=request.user.id)
+                    .for_owner(request.user.id)
                     .filter(order_date=(period_date))
                     .filter(status="Pending")
                     .order_by("-order_date")[:6]
@@ -88,7 +88,7 @@ class DashBoardView(APIView):
                 many=True
             )
             inventory_serializer = InventoryItemSerializer(
-                list(Inventory.objects.filter(owner=request.user.id).filter(stock_level__lte=F("low_stock_threshold")).order_by("-last_updated")[:6]),
+                list(Inventory.objects.for_owner(request.user.id).low_stock().order_by("-last_updated")[:6]),
                 many=True
             )
             dashboard_data["pending_orders"] = orders_serializer.data
@@ -97,31 +97,25 @@ class DashBoardView(APIView):
 
         elif period and (len(request.GET.getlist('period')) == 1) and period == "all-time":
 
-            products_orders = (
-                OrderedProduct.objects
-                .filter(order_id__product_owner_id=request.user.id)
-                .filter(order_id__status="Delivered").values("name")
-                .annotate(total_units_sold=Sum("quantity")).order_by("-total_units_sold")
+            # top selling product - the product with the most units sold, read from the per product sales stats
+            top_product = (
+                ProductSalesStats.objects.for_owner(request.user.id).with_product_name()
+                .order_by("-units_sold").values("product_name").first()
             )
-
-            # top selling product - ordered product with the max sum of quantity
-            if len(products_orders) == 0:
-                dashboard_data["top_selling_product"] = None
-            else:
-                dashboard_data["top_selling_product"] = products_orders[0]['name']
+            dashboard_data["top_selling_product"] = top_product["product_name"] if top_product else None
 
             # revenue - sum of total_price in orders
             dashboard_data["revenue"] = (
-                Order.objects.filter(product_owner_id=request.user.id).filter(status="Delivered").aggregate(Sum("total_price"))['total_price__sum']
+                Order.objects.for_owner(request.user.id).filter(status="Delivered").aggregate(Sum("total_price"))['total_price__sum']
             )
             dashboard_data["revenue_change"] = None
 
             orders_serializer = OrderSerializer(
-                list(Order.objects.filter(product_owner_id=request.user.id).filter(status="Pending").order_by("-order_date")[:6]),
+                list(Order.objects.for_owner(request.user.id).filter(status="Pending").order_by("-order_date")[:6]),
                 many=True
             )
             inventory_serializer = InventoryItemSerializer(
-                list(Inventory.objects.filter(owner=request.user.id).filter(stock_level__lte=F("low_stock_threshold")).order_by("-last_updated")[:6]),
+                list(Inventory.objects.for_owner(request.user.id).low_stock().order_by("-last_updated")[:6]),
                 many=True
             )
             dashboard_data["pending_orders"] = orders_serializer.data
@@ -137,10 +131,10 @@ class DashBoardView(APIView):
 
             products_orders = (
                 OrderedProduct.objects
-                .filter(order_id__product_owner_id=request.user.id)
+                .for_owner(request.user.id)
                 .filter(order_id__order_date__range=(start_date, end_date))
                 .filter(order_id__status="Delivered")
-                .values("name").annotate(total_units_sold=Sum("quantity"))
+                .group_by_product().annotate(total_units_sold=Sum("quantity"))
                 .order_by("-total_units_sold")
             )
 
@@ -148,11 +142,11 @@ class DashBoardView(APIView):
             if len(products_orders) == 0:
                 dashboard_data["top_selling_product"] = None
             else:
-                dashboard_data["top_selling_product"] = products_orders[0]['name']
+                dashboard_data["top_selling_product"] = products_orders[0]['product_name']
 
             prev_revenue = (
                 Order.objects
-                .filter(product_owner_id=request.user.id)
+                .for_owner(request.user.id)
                 .filter(order_date__range=(prev_start_date, prev_end_date))
                 .filter(status="Delivered")
                 .aggregate(Sum("total_price"))['total_price__sum']
@@ -161,7 +155,7 @@ class DashBoardView(APIView):
             # revenue - sum of total_price in orders
             dashboard_data["revenue"] = (
                 Order.objects
-                .filter(product_owner_id=request.user.id)
+                .for_owner(request.user.id)
                 .filter(order_date__range=(start_date, end_date))
                 .filter(status="Delivered")
                 .aggregate(Sum("total_price"))['total_price__sum']
@@ -183,7 +177,7 @@ class DashBoardView(APIView):
             orders_serializer = OrderSerializer(
                 list(
                     Order.objects
-                    .filter(product_owner_id=request.user.id)
+                    .for_owner(request.user.id)
                     .filter(order_date__range=(start_date, end_date))
                     .filter(status="Pending")
                     .order_by("-order_date")[:6]
@@ -191,7 +185,7 @@ class DashBoardView(APIView):
                 many=True
             )
             inventory_serializer = InventoryItemSerializer(
-                list(Inventory.objects.filter(owner=request.user.id).filter(stock_level__lte=F("low_stock_threshold")).order_by("-last_updated")[:6]),
+                list(Inventory.objects.for_owner(request.user.id).low_stock().order_by("-last_updated")[:6]),
                 many=True
             )
             dashboard_data["pending_orders"] = orders_serializer.data
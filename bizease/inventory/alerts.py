@@ -0,0 +1,91 @@
+"""
+Low stock alerts and the digests they're sent in.
+
+detect_low_stock() runs periodically (see the PERIODIC_JOBS setting) and only reads the items that are low in stock,
+through the partial index inventory_low_stock_idx, rather than the whole inventory. An item that dropped to or below
+its threshold since the previous run gets an alert unless it already has an open one or got one less than
+LOW_STOCK_ALERT_DEBOUNCE seconds ago, so an item whose stock hovers around its threshold doesn't alert over and over.
+
+send_low_stock_digests() sends each tenant that receives low stock emails (rcv_mail_notification and
+rcv_mail_for_low_stocks) one email listing its new alerts. Digests are sent in batches of LOW_STOCK_DIGEST_BATCH_SIZE
+over a single SMTP connection per batch instead of a connection per email.
+"""
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import Exists, OuterRef, Q, F
+from django.utils import timezone
+from django.utils.html import escape
+from itertools import groupby
+from datetime import timedelta
+from .models import Inventory, LowStockAlert
+
+
+def receives_low_stock_mail():
+	""" The filter of the inventory items (or alerts) whose owners want low stock emails """
+	return Q(owner__is_active=True, owner__rcv_mail_notification=True, owner__rcv_mail_for_low_stocks=True)
+
+
+def detect_low_stock():
+	""" Resolves the alerts of restocked items and creates alerts for the items that became low in stock. Returns the number created """
+	now = timezone.now()
+	LowStockAlert.objects.unscoped().filter(resolved_at__isnull=True, inventory_item__stock_level__gt=F("inventory_item__low_stock_threshold")).update(
+		resolved_at=now
+	)
+
+	debounce_start = now - timedelta(seconds=getattr(settings, "LOW_STOCK_ALERT_DEBOUNCE", 24 * 3600))
+	recent_alerts = LowStockAlert.objects.unscoped().filter(
+		Q(resolved_at__isnull=True) | Q(detected_at__gte=debounce_start), inventory_item=OuterRef("pk")
+	)
+	new_low_stock = (
+		Inventory.objects.unscoped().low_stock()
+		.filter(receives_low_stock_mail(), ~Exists(recent_alerts))
+		.values_list("id", "owner_id", "stock_level", "low_stock_threshold")
+	)
+	alerts = [
+		LowStockAlert(inventory_item_id=item_id, owner_id=owner_id, stock_level=stock_level, low_stock_threshold=threshold)
+		for item_id, owner_id, stock_level, threshold in new_low_stock
+	]
+	# a concurrent run may have created some of them already, one_open_low_stock_alert makes sure there's one
+	LowStockAlert.objects.bulk_create(alerts, ignore_conflicts=True)
+
+	# resolved alerts are only needed to debounce new ones
+	LowStockAlert.objects.unscoped().filter(resolved_at__lt=debounce_start, digested_at__isnull=False).delete()
+	return len(alerts)
+
+
+def digest_email(owner, alerts):
+	items = [(alert.inventory_item.product_name, alert.inventory_item.stock_level, alert.inventory_item.low_stock_threshold) for alert in alerts]
+	subject = f"{len(items)} product{'s are' if len(items) > 1 else ' is'} running low in {owner.business_name}"
+	text_content = "These products are at or below their low stock threshold:\n" + "\n".join(
+		f"- {name}: {stock_level} left (threshold {threshold})" for name, stock_level, threshold in items
+	)
+	html_content = "<p>These products are at or below their low stock threshold:</p><ul>" + "".join(
+		f"<li><strong>{escape(name)}</strong>: {stock_level} left (threshold {threshold})</li>" for name, stock_level, threshold in items
+	) + "</ul>"
+	mail = EmailMultiAlternatives(subject, text_content, settings.EMAIL_HOST_USER, [owner.email])
+	mail.attach_alternative(html_content, "text/html")
+	return mail
+
+
+def send_low_stock_digests(batch_size=None):
+	"""
+	Sends the alerts that haven't been digested yet, one email per tenant, and returns the number of emails sent. Alerts
+	of items restocked in the meantime are digested without being mentioned and alerts of tenants that no longer
+	receive low stock emails are dropped
+	"""
+	batch_size = batch_size or getattr(settings, "LOW_STOCK_DIGEST_BATCH_SIZE", 50)
+	pending = LowStockAlert.objects.unscoped().filter(digested_at__isnull=True)
+	pending.exclude(receives_low_stock_mail()).delete()
+	pending.filter(resolved_at__isnull=False).update(digested_at=timezone.now())
+
+	alerts = pending.select_related("owner", "inventory_item").order_by("owner_id", "inventory_item__product_name")
+	digests = [(owner, list(owner_alerts)) for owner, owner_alerts in groupby(alerts, key=lambda alert: alert.owner)]
+	sent = 0
+	for start in range(0, len(digests), batch_size):
+		# the connection is opened once for the whole batch
+		with get_connection() as connection:
+			for owner, owner_alerts in digests[start:start + batch_size]:
+				connection.send_messages([digest_email(owner, owner_alerts)])
+				LowStockAlert.objects.unscoped().filter(id__in=[alert.id for alert in owner_alerts]).update(digested_at=timezone.now())
+				sent += 1
+	return sent
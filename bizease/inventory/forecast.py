@@ -0,0 +1,223 @@
+"""
+Stock-out forecasts and reorder suggestions.
+
+The sales velocity of an inventory item is an exponentially weighted moving average (EWMA) of the units it sold per day
+in delivered orders (by order date) with a span of FORECAST_EWMA_SPAN_DAYS days. Days without sales count as zero units
+but an item added to the inventory recently is only averaged over the days it has been in the inventory. An item runs
+out of stock when its stock is used up at that velocity, and an item that would run out before a restock arrives
+(FORECAST_LEAD_TIME_DAYS) or is already low in stock gets a suggested reorder quantity that covers FORECAST_COVER_DAYS
+more days of sales on top of its low stock threshold. The whole catalog is forecast with a handful of array operations.
+
+The velocities of a tenant are kept in the process, for at most FORECAST_CACHE_SIZE tenants, as of the day they were
+computed. An EWMA is linear in the daily units so they're refreshed incrementally: a new day decays every velocity by
+the same factor and a newly delivered order adds the weighted units of its ordered products. Each request compares the
+fingerprint of the tenant's delivered orders (see reports.snapshots) with the cached one. If it changed, the orders
+that were pending or didn't exist yet at the last refresh are read and if the ones delivered since account for the
+whole change only their ordered products are added. Any other change (e.g a deleted delivered order) recomputes the
+velocities from the ordered products of the last history_days() days, before which sales have a negligible weight.
+"""
+from django.conf import settings
+from django.db.models import Max, Q
+from django.utils import timezone
+from cachetools import LRUCache
+from orders.models import Order, OrderedProduct
+from reports.snapshots import fingerprint_aggregates
+from bizease import metrics
+from .models import Inventory
+from datetime import timedelta
+import numpy as np
+import math
+import threading
+
+
+NEGLIGIBLE_WEIGHT = 1e-6
+MIN_VELOCITY = 1e-4 # units per day. Slower items are treated as not selling at all
+MAX_STOCKOUT_DAYS = 3650 # stock-outs further away than this aren't forecast
+
+
+def smoothing_factor():
+	return 2 / (getattr(settings, "FORECAST_EWMA_SPAN_DAYS", 14) + 1)
+
+
+def history_days(alpha):
+	""" The number of days after which the weight of a day's sales in the EWMA is negligible """
+	return math.ceil(math.log(NEGLIGIBLE_WEIGHT) / math.log(1 - alpha))
+
+
+def order_state(owner_id):
+	""" The fingerprint of the tenant's delivered orders, as a (count, last id, sum of versions) tuple, and its last order id """
+	state = Order.objects.for_owner(owner_id).order_by().aggregate(**fingerprint_aggregates(Q(status="Delivered")), last_order_id=Max("id"))
+	return (state["count"], state["last_id"] or 0, state["versions"] or 0), state["last_order_id"] or 0
+
+
+class SalesVelocity:
+	""" The EWMA of the units sold per day of every inventory item of a tenant that has sold, as of a day """
+
+	def __init__(self, owner_id, alpha, day, fingerprint, last_order_id, pending):
+		self.owner_id = owner_id
+		self.alpha = alpha
+		self.day = day # the ordinal of the day the velocities are as of
+		self.item_ids = np.empty(0, dtype=np.int64) # sorted
+		self.velocities = np.empty(0, dtype=np.float64)
+		# the orders the velocities were computed from: the fingerprint of the delivered ones, the last order id and
+		# the ids of the pending ones. An order delivered since is either pending or newer than last_order_id
+		self.fingerprint = fingerprint
+		self.last_order_id = last_order_id
+		self.pending = pending
+		self.lock = threading.Lock()
+
+	@classmethod
+	def load(cls, owner_id, alpha, today):
+		fingerprint, last_order_id = order_state(owner_id)
+		pending = set(Order.objects.for_owner(owner_id).filter(status="Pending").order_by().values_list("id", flat=True))
+		velocity = cls(owner_id, alpha, today.toordinal(), fingerprint, last_order_id, pending)
+		velocity.add_sales(
+			OrderedProduct.objects.for_owner(owner_id)
+			.filter(order_id__status="Delivered", order_id__order_date__gte=today - timedelta(days=history_days(alpha)))
+		)
+		return velocity
+
+	def add_sales(self, ordered_products):
+		""" Adds the weighted units of the (delivered) ordered products to the velocities of their inventory items """
+		rows = list(ordered_products.filter(inventory_item__isnull=False).order_by().values_list("order_id__order_date", "inventory_item", "quantity"))
+		if not rows:
+			return
+		days = np.fromiter((order_date.toordinal() for order_date, _, _ in rows), dtype=np.int64, count=len(rows))
+		item_ids = np.fromiter((item_id for _, item_id, _ in rows), dtype=np.int64, count=len(rows))
+		quantities = np.fromiter((quantity for _, _, quantity in rows), dtype=np.float64, count=len(rows))
+
+		# orders dated in the future count as sales of the current day
+		weights = self.alpha * (1 - self.alpha) ** np.maximum(self.day - days, 0)
+		sold_ids, codes = np.unique(item_ids, return_inverse=True)
+		sums = np.bincount(codes, weights=weights * quantities, minlength=len(sold_ids))
+
+		merged_ids = np.union1d(self.item_ids, sold_ids)
+		velocities = np.zeros(len(merged_ids))
+		velocities[np.searchsorted(merged_ids, self.item_ids)] = self.velocities
+		velocities[np.searchsorted(merged_ids, sold_ids)] += sums
+		self.item_ids, self.velocities = merged_ids, velocities
+
+	def advance(self, today):
+		""" Decays the velocities to today's, which adds a day without sales for every day that passed """
+		if today.toordinal() > self.day:
+			self.velocities = self.velocities * (1 - self.alpha) ** (today.toordinal() - self.day)
+			self.day = today.toordinal()
+
+	def refresh(self, today):
+		""" Brings the velocities up to date and returns True, or returns False if they have to be recomputed instead """
+		fingerprint, _ = order_state(self.owner_id)
+		if fingerprint == self.fingerprint:
+			self.advance(today)
+			metrics.incr("forecast.velocity.hits")
+			return True
+
+		orders = list(
+			Order.objects.for_owner(self.owner_id).order_by()
+			.filter(Q(id__in=self.pending) | Q(id__gt=self.last_order_id)).values_list("id", "status", "version")
+		)
+		delivered = [(order_id, version) for order_id, order_status, version in orders if order_status == "Delivered"]
+		count, last_id, versions = self.fingerprint
+		expected = (
+			count + len(delivered),
+			max([last_id, *(order_id for order_id, _ in delivered)]),
+			versions + sum(version for _, version in delivered),
+		)
+		if fingerprint != expected: # delivered orders were also edited or deleted
+			return False
+
+		self.advance(today)
+		self.add_sales(OrderedProduct.objects.unscoped().filter(order_id__in=[order_id for order_id, _ in delivered]))
+		self.fingerprint = fingerprint
+		self.last_order_id = max([self.last_order_id, *(order_id for order_id, _, _ in orders)])
+		self.pending = {order_id for order_id, order_status, _ in orders if order_status == "Pending"}
+		metrics.incr("forecast.velocity.updates")
+		return True
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def clear_cache():
+	global _cache
+	with _cache_lock:
+		_cache = None
+
+
+def sales_velocity(owner_id, today):
+	"""
+	The (sorted inventory item ids, velocities) arrays of a tenant as of today, refreshed incrementally if they're
+	cached. The arrays are replaced rather than changed by later refreshes so they can be read without the lock
+	"""
+	global _cache
+	alpha = smoothing_factor()
+	with _cache_lock:
+		if _cache is None:
+			_cache = LRUCache(maxsize=getattr(settings, "FORECAST_CACHE_SIZE", 64))
+		cached = _cache.get(owner_id)
+	if cached is not None and cached.alpha == alpha:
+		with cached.lock:
+			if cached.refresh(today):
+				return cached.item_ids, cached.velocities
+
+	metrics.incr("forecast.velocity.loads")
+	velocity = SalesVelocity.load(owner_id, alpha, today)
+	# orders delivered while the ordered products were read may be missing, the velocities are only cached if there were none
+	if order_state(owner_id)[0] == velocity.fingerprint:
+		with _cache_lock:
+			_cache[owner_id] = velocity
+	return velocity.item_ids, velocity.velocities
+
+
+def forecast(owner_id, lead_time=None, cover_days=None, within=None, today=None):
+	"""
+	The forecast of every inventory item of the tenant as a list of dicts, soonest stock-out first. 'within' only keeps
+	the items that run out of stock within that many days
+	"""
+	today = today or timezone.now().date()
+	lead_time = getattr(settings, "FORECAST_LEAD_TIME_DAYS", 7) if lead_time is None else lead_time
+	cover_days = getattr(settings, "FORECAST_COVER_DAYS", 30) if cover_days is None else cover_days
+	alpha = smoothing_factor()
+	sold_ids, sold_velocities = sales_velocity(owner_id, today)
+
+	items = list(
+		Inventory.objects.for_owner(owner_id).order_by()
+		.values_list("id", "product_name", "stock_level", "low_stock_threshold", "date_added")
+	)
+	ids = np.fromiter((item[0] for item in items), dtype=np.int64, count=len(items))
+	stock = np.fromiter((item[2] for item in items), dtype=np.float64, count=len(items))
+	thresholds = np.fromiter((item[3] for item in items), dtype=np.float64, count=len(items))
+	ages = today.toordinal() - np.fromiter((item[4].toordinal() for item in items), dtype=np.int64, count=len(items)) + 1
+
+	velocities = np.zeros(len(items))
+	if len(sold_ids):
+		positions = np.minimum(np.searchsorted(sold_ids, ids), len(sold_ids) - 1)
+		sold = sold_ids[positions] == ids
+		velocities[sold] = sold_velocities[positions[sold]]
+	# the EWMA started at zero when the item was added, its weights since then sum to 1 - (1 - alpha)^age
+	velocities = velocities / (1 - (1 - alpha) ** np.maximum(ages, 1))
+	velocities[velocities < MIN_VELOCITY] = 0.0
+
+	with np.errstate(divide="ignore"):
+		days_left = np.where(velocities > 0, np.floor(stock / velocities), np.inf)
+	days_left[days_left > MAX_STOCKOUT_DAYS] = np.inf
+	needs_reorder = (days_left <= lead_time) | (stock <= thresholds)
+	targets = np.ceil(velocities * (lead_time + cover_days)) + thresholds
+	reorder_quantities = np.where(needs_reorder, np.maximum(targets - stock, 0), 0).astype(np.int64)
+
+	order = np.lexsort((ids, days_left))
+	if within is not None:
+		order = order[days_left[order] <= within]
+	return [
+		{
+			"id": items[index][0],
+			"product_name": items[index][1],
+			"stock_level": items[index][2],
+			"low_stock_threshold": items[index][3],
+			"daily_sales": round(float(velocities[index]), 2),
+			"days_until_stockout": int(days_left[index]) if np.isfinite(days_left[index]) else None,
+			"stockout_date": (today + timedelta(days=int(days_left[index]))).isoformat() if np.isfinite(days_left[index]) else None,
+			"reorder_quantity": int(reorder_quantities[index]),
+		}
+		for index in order.tolist()
+	]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 23:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0011_alter_inventory_date_added'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventory',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
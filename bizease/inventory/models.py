@@ -1,8 +1,18 @@
 from django.db import models
 from accounts.models import CustomUser
-from django.db.models import Q
+from django.db.models import Q, F
+from bizease.tenancy import TenantQuerySet
+from bizease.conditional import VersionedModel
 
-class Inventory(models.Model):
+class InventoryQuerySet(TenantQuerySet):
+	owner_field = "owner"
+
+	def low_stock(self):
+		""" Items at or below their low stock threshold. The predicate matches inventory_low_stock_idx's condition so it's an index scan """
+		return self.filter(stock_level__lte=F("low_stock_threshold"))
+
+
+class Inventory(VersionedModel):
 	owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
 	product_name = models.CharField(max_length=100)
 	description = models.CharField(max_length=300, blank=True)
@@ -13,6 +23,7 @@ class Inventory(models.Model):
 	last_updated = models.DateTimeField(auto_now=True)
 	date_added = models.DateField()
 
+	objects = InventoryQuerySet.as_manager()
 
 	class Meta:
 		ordering = ["-last_updated"]
@@ -20,6 +31,41 @@ class Inventory(models.Model):
 			models.UniqueConstraint(fields=["owner", "product_name"], name="user_unique_product"), # More than one product should not have the same name
 			models.CheckConstraint(condition=Q(price__gt=0), name="price_greater_than_zero")
 		]
+		indexes = [
+			# partial index of the (usually few) items that are low in stock
+			models.Index(
+				fields=["owner", "-last_updated"], condition=Q(stock_level__lte=F("low_stock_threshold")), name="inventory_low_stock_idx"
+			)
+		]
 
 	def __str__(self):
 		return f"{self.product_name} - {self.price}"
+
+
+class LowStockAlert(models.Model):
+	"""
+	An inventory item that dropped to or below its low stock threshold (see inventory.alerts). An item has at most one
+	open alert, which is resolved once the item is restocked above its threshold.
+	"""
+	owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+	inventory_item = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name="low_stock_alerts")
+	stock_level = models.PositiveIntegerField()
+	low_stock_threshold = models.PositiveIntegerField()
+	detected_at = models.DateTimeField(auto_now_add=True)
+	resolved_at = models.DateTimeField(null=True, blank=True)
+	# when the alert was handled by a low stock digest of its owner
+	digested_at = models.DateTimeField(null=True, blank=True)
+
+	objects = TenantQuerySet.as_manager()
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=["inventory_item"], condition=Q(resolved_at__isnull=True), name="one_open_low_stock_alert")
+		]
+		indexes = [
+			models.Index(fields=["inventory_item", "detected_at"], name="low_stock_alert_item_idx"),
+			models.Index(fields=["owner"], condition=Q(digested_at__isnull=True), name="low_stock_alert_pending_idx"),
+		]
+
+	def __str__(self):
+		return f"{self.inventory_item_id} low in stock ({self.stock_level})"
@@ -1,7 +1,8 @@
 from rest_framework import serializers
 from .models import Inventory
+from bizease.serializers import DynamicFieldsMixin
 
-class InventoryItemSerializer(serializers.ModelSerializer):
+class InventoryItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     price = serializers.DecimalField(default=0, max_digits=14, decimal_places=2, min_value=0)
 
     class Meta:
@@ -0,0 +1,14 @@
+from jobs.queue import task
+from .alerts import detect_low_stock, send_low_stock_digests
+
+
+@task(name="inventory.detect_low_stock")
+def detect_low_stock_task():
+	detect_low_stock()
+
+
+@task(name="inventory.send_low_stock_digests", max_attempts=1)
+def send_low_stock_digests_task():
+	# the alerts detected since the last detection run are included too
+	detect_low_stock()
+	send_low_stock_digests()
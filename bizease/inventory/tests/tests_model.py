@@ -1,7 +1,14 @@
-from django.test import TransactionTestCase
-from inventory.models import Inventory
+from django.test import TransactionTestCase, override_settings
+from django.core import mail
+from django.core.mail import get_connection
+from inventory.models import Inventory, LowStockAlert
+from inventory.alerts import detect_low_stock, send_low_stock_digests
+from unittest.mock import patch
 from accounts.models import CustomUser
 from django.db.utils import IntegrityError
+from django.db.models import Q, F
+from bizease.tenancy import enforce_tenant_scope, UnscopedQueryError
+from bizease.conditional import VersionConflict
 
 class InventorModelTest(TransactionTestCase):
 	def test_user_product_name_combo_uniqueness(self):
@@ -33,4 +40,101 @@ class InventorModelTest(TransactionTestCase):
 		product_1.save()
 		self.assertEqual(str(product_1), "product 2 - 1500")
 
-		
\ No newline at end of file
+	def test_unscoped_queries_raise_when_scope_is_enforced(self):
+		user_1 = CustomUser.objects.create(business_name="business 1", full_name="user 1", email="user1@gmail.com", password="12345678")
+		user_2 = CustomUser.objects.create(business_name="business 2", full_name="user 2", email="user2@gmail.com", password="12345678")
+		Inventory.objects.create(owner=user_1, product_name="product 1", stock_level=30, price=1500, date_added="2025-07-20")
+		Inventory.objects.create(owner=user_2, product_name="product 2", stock_level=30, price=1500, date_added="2025-07-20")
+
+		self.assertEqual(Inventory.objects.count(), 2) # not enforced outside requests
+		with enforce_tenant_scope():
+			self.assertRaises(UnscopedQueryError, list, Inventory.objects.all())
+			self.assertRaises(UnscopedQueryError, Inventory.objects.filter(price=1500).count)
+			self.assertRaises(UnscopedQueryError, Inventory.objects.get, product_name="product 1")
+			self.assertRaises(UnscopedQueryError, Inventory.objects.update, stock_level=0)
+			self.assertEqual(Inventory.objects.for_owner(user_1).filter(price=1500).count(), 1)
+			self.assertEqual([item.product_name for item in Inventory.objects.for_owner(user_2.id)], ["product 2"])
+			self.assertEqual(Inventory.objects.unscoped().count(), 2)
+
+	def test_saving_a_stale_instance_raises_version_conflict(self):
+		user = CustomUser.objects.create(business_name="business 1", full_name="user 1", email="user1@gmail.com", password="12345678")
+		product = Inventory.objects.create(owner=user, product_name="product 1", stock_level=30, price=1500, date_added="2025-07-20")
+		self.assertEqual(product.version, 1)
+		stale_copy = Inventory.objects.get(pk=product.id)
+
+		product.stock_level = 25
+		product.save()
+		self.assertEqual(product.version, 2)
+
+		stale_copy.price = 2000
+		self.assertRaises(VersionConflict, stale_copy.save)
+		product.refresh_from_db()
+		self.assertEqual((product.stock_level, product.price, product.version), (25, 1500, 2))
+
+
+class LowStockAlertTest(TransactionTestCase):
+	def setUp(self):
+		self.user = CustomUser.objects.create(business_name="Boots inc.", full_name="user 1", email="user1@gmail.com", password="12345678", is_active=True)
+		self.opted_out_user = CustomUser.objects.create(
+			business_name="Tape inc.", full_name="user 2", email="user2@gmail.com", password="12345678", is_active=True, rcv_mail_for_low_stocks=False
+		)
+		self.boots = Inventory.objects.create(owner=self.user, product_name="Boots", stock_level=3, low_stock_threshold=5, price=65000, date_added="2025-07-20")
+		self.helmet = Inventory.objects.create(owner=self.user, product_name="Helmet", stock_level=20, low_stock_threshold=5, price=6000, date_added="2025-07-20")
+		Inventory.objects.create(owner=self.opted_out_user, product_name="Tape", stock_level=1, low_stock_threshold=5, price=4000, date_added="2025-07-20")
+
+	def test_low_stock_items(self):
+		Inventory.objects.create(owner=self.user, product_name="Gloves", stock_level=5, low_stock_threshold=5, price=2000, date_added="2025-07-20")
+		self.assertEqual(sorted(Inventory.objects.for_owner(self.user).low_stock().values_list("product_name", flat=True)), ["Boots", "Gloves"])
+		Inventory.objects.filter(pk=self.boots.pk).update(stock_level=6)
+		self.assertEqual(list(Inventory.objects.for_owner(self.user).low_stock().values_list("product_name", flat=True)), ["Gloves"])
+
+		# the partial index only covers the rows low_stock() selects if their conditions stay the same
+		index = next(index for index in Inventory._meta.indexes if index.name == "inventory_low_stock_idx")
+		self.assertEqual(index.condition, Q(stock_level__lte=F("low_stock_threshold")))
+		self.assertEqual(index.fields, ["owner", "-last_updated"])
+
+	def test_alerts_are_debounced_per_item(self):
+		self.assertEqual(detect_low_stock(), 1)
+		self.assertEqual(detect_low_stock(), 0) # the alert is still open
+
+		Inventory.objects.filter(pk=self.helmet.pk).update(stock_level=2)
+		self.assertEqual(detect_low_stock(), 1)
+		self.assertEqual(set(LowStockAlert.objects.for_owner(self.user).values_list("inventory_item", flat=True)), {self.boots.id, self.helmet.id})
+
+		# restocking resolves the alert but dropping low again soon after doesn't alert again
+		Inventory.objects.filter(pk=self.boots.pk).update(stock_level=50)
+		self.assertEqual(detect_low_stock(), 0)
+		self.assertIsNotNone(LowStockAlert.objects.get(inventory_item=self.boots).resolved_at)
+		Inventory.objects.filter(pk=self.boots.pk).update(stock_level=4)
+		self.assertEqual(detect_low_stock(), 0)
+		with override_settings(LOW_STOCK_ALERT_DEBOUNCE=0):
+			self.assertEqual(detect_low_stock(), 1)
+
+	def test_digests_are_sent_per_tenant_over_one_connection_per_batch(self):
+		other_user = CustomUser.objects.create(business_name="Helmets inc.", full_name="user 3", email="user3@gmail.com", password="12345678", is_active=True)
+		Inventory.objects.create(owner=other_user, product_name="Helmet", stock_level=0, low_stock_threshold=5, price=6000, date_added="2025-07-20")
+		Inventory.objects.filter(pk=self.helmet.pk).update(stock_level=2)
+		detect_low_stock()
+
+		with patch("inventory.alerts.get_connection", wraps=get_connection) as connections:
+			self.assertEqual(send_low_stock_digests(), 2)
+		self.assertEqual(connections.call_count, 1)
+		self.assertEqual(sorted(message.to[0] for message in mail.outbox), ["user1@gmail.com", "user3@gmail.com"])
+		digest = next(message for message in mail.outbox if message.to == ["user1@gmail.com"])
+		self.assertEqual(digest.subject, "2 products are running low in Boots inc.")
+		self.assertIn("- Boots: 3 left (threshold 5)", digest.body)
+		self.assertIn("- Helmet: 2 left (threshold 5)", digest.body)
+
+		# digested alerts aren't sent again
+		self.assertEqual(send_low_stock_digests(), 0)
+		self.assertEqual(len(mail.outbox), 2)
+
+		with override_settings(LOW_STOCK_ALERT_DEBOUNCE=0):
+			Inventory.objects.filter(pk=self.boots.pk).update(stock_level=50)
+			detect_low_stock()
+			Inventory.objects.filter(pk=self.boots.pk).update(stock_level=1)
+			Inventory.objects.create(owner=other_user, product_name="Boots", stock_level=0, low_stock_threshold=5, price=6000, date_added="2025-07-20")
+			self.assertEqual(detect_low_stock(), 2)
+		with patch("inventory.alerts.get_connection", wraps=get_connection) as connections:
+			self.assertEqual(send_low_stock_digests(batch_size=1), 2)
+		self.assertEqual(connections.call_count, 2)
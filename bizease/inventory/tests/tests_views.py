@@ -1,12 +1,22 @@
 from inventory.models import Inventory
 from inventory.serializers import InventoryItemSerializer
+from inventory.forecast import clear_cache, smoothing_factor
+from orders.models import Order, OrderedProduct, OrderBuilder
+from bizease import metrics
 from rest_framework.test import APITransactionTestCase
 from datetime import datetime
 from accounts.models import CustomUser
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.urls import reverse
 from rest_framework import status
-from datetime import date
+from datetime import date, timedelta
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import override_settings
+from django.utils import timezone
+from bizease.serializers import rows_to_dicts
+import json
+import math
 
 
 class InventoryViewsTest(APITransactionTestCase):
@@ -132,6 +142,82 @@ class InventoryViewsTest(APITransactionTestCase):
 		self.assertEqual(response.data["data"]["products"][1]["product_name"], "Helmet")
 		self.assertEqual(response.data["data"]["products"][2]["product_name"], "Safety Boots")
 
+	def test_conditional_get_inventory_items(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		response = self.client.get(reverse("inventory", args=["v1"]) + "?order=id")
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		etag = response.headers["ETag"]
+
+		with self.assertNumQueries(2): # the user's lookup by the jwt authentication and the list's ETag
+			response = self.client.get(reverse("inventory", args=["v1"]) + "?order=id", HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+		self.assertEqual(response.content, b"")
+
+		# different query parameters select a different list
+		response = self.client.get(reverse("inventory", args=["v1"]) + "?order=-id", HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+		for change in [lambda: Inventory.objects.filter(pk=self.item_1.id).update(stock_level=1, version=2), self.item_2.delete]:
+			change()
+			response = self.client.get(reverse("inventory", args=["v1"]) + "?order=id", HTTP_IF_NONE_MATCH=etag)
+			self.assertEqual(response.status_code, status.HTTP_200_OK)
+			self.assertNotEqual(response.headers["ETag"], etag)
+			etag = response.headers["ETag"]
+
+	def test_get_inventory_items_with_sparse_fieldset(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(reverse("inventory", args=["v1"]) + "?fields=product_name,price&order=id")
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data["data"]["products"][0], {"id": self.item_1.id, "product_name": "Glasses", "price": "10000.00"})
+		self.assertEqual(response.data["data"]["length"], 6)
+		self.assertNotIn("description", queries[-1]["sql"])
+
+		response = self.client.get(reverse("inventory", args=["v1"]) + "?fields=product_name,password")
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+		self.assertEqual(response.data["detail"], "Invalid value for fields parameter. Unknown field(s): password")
+
+	def test_columnar_inventory_items_round_trip(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		for query in ["?order=id", "?order=-price&page=1&fields=product_name,price,last_updated", "?category=ppe"]:
+			default = json.loads(self.client.get(reverse("inventory", args=["v1"]) + query).content)["data"]
+			columnar = json.loads(self.client.get(reverse("inventory", args=["v1"]) + query + "&format=columnar").content)["data"]
+			self.assertEqual(rows_to_dicts(columnar.pop("products")), default.pop("products"))
+			self.assertEqual(columnar, default)
+
+		# different representations of the same list have different ETags
+		default_etag = self.client.get(reverse("inventory", args=["v1"])).headers["ETag"]
+		response = self.client.get(reverse("inventory", args=["v1"]), HTTP_ACCEPT="application/vnd.bizease.columnar+json", HTTP_IF_NONE_MATCH=default_etag)
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(list(response.data["data"]["products"]), ["fields", "rows"])
+
+	def test_large_inventory_lists_are_streamed(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		for query in ["?order=id", "?fields=product_name,price&category=ppe"]:
+			response = self.client.get(reverse("inventory", args=["v1"]) + query)
+			self.assertFalse(response.streaming)
+			with override_settings(JSON_STREAMING_MIN_ITEMS=2):
+				streamed_response = self.client.get(reverse("inventory", args=["v1"]) + query)
+			self.assertTrue(streamed_response.streaming)
+			self.assertEqual(streamed_response.headers["ETag"], response.headers["ETag"])
+			self.assertEqual(json.loads(b"".join(streamed_response.streaming_content)), response.json())
+
+		# paginated lists and other formats aren't streamed
+		with override_settings(JSON_STREAMING_MIN_ITEMS=2):
+			for query in ["?page=1", "?format=columnar", "?order=id&category=nothing"]:
+				self.assertFalse(self.client.get(reverse("inventory", args=["v1"]) + query).streaming)
+
+	def test_conditional_get_single_inventory_item(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		response = self.client.get(reverse("inventory-item", args=["v1", str(self.item_1.id)]), HTTP_IF_NONE_MATCH='"1"')
+		self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+		self.item_1.price = 12000
+		self.item_1.save()
+		response = self.client.get(reverse("inventory-item", args=["v1", str(self.item_1.id)]), HTTP_IF_NONE_MATCH='"1"')
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.headers["ETag"], '"2"')
+
 	def test_get_inventory_items_without_credentials(self):
 		response = self.client.get(reverse("inventory", args=["v1"]))
 		self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -146,6 +232,19 @@ class InventoryViewsTest(APITransactionTestCase):
 		self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 		self.assertEqual(response.data["detail"], "Item not found")
 
+	def test_get_inventory_item_of_another_user(self):
+		other_user = CustomUser.objects.create(business_name="Business 2", full_name="Business Woman", email="businessWoman@email.com", password="12345678")
+		other_item = Inventory.objects.create(owner=other_user, product_name="Glasses", price=10000, stock_level=15, date_added="2025-07-20")
+
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		response = self.client.get(reverse("inventory-item", args=["v1", str(other_item.id)]))
+		self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+		response = self.client.put(reverse("inventory-item", args=["v1", str(other_item.id)]), {"stock_level": 1}, format="json")
+		self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+		response = self.client.delete(reverse("inventory-item", args=["v1", str(other_item.id)]))
+		self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+		self.assertEqual(Inventory.objects.get(pk=other_item.id).stock_level, 15)
+
 	def test_get_single_inventory_item_without_credentials(self):
 		response = self.client.get(reverse("inventory-item", args=["v1", "1"]))
 		self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -204,6 +303,26 @@ class InventoryViewsTest(APITransactionTestCase):
 		self.update_item_with_invalid_data()
 		self.update_nonexistent_inventory_item()
 
+	def test_update_inventory_item_with_if_match(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		response = self.client.get(reverse("inventory-item", args=["v1", str(self.item_2.id)]))
+		etag = response.headers["ETag"]
+		self.assertEqual(etag, '"1"')
+
+		# the item changes after it was retrieved, e.g its stock level is decreased by an order
+		self.item_2.stock_level = 90
+		self.item_2.save()
+
+		response = self.client.put(reverse("inventory-item", args=["v1", str(self.item_2.id)]), {"stock_level": 120}, format='json', HTTP_IF_MATCH=etag)
+		self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+		self.assertEqual(response.headers["ETag"], '"2"')
+		self.assertEqual(Inventory.objects.get(pk=self.item_2.id).stock_level, 90)
+
+		response = self.client.put(reverse("inventory-item", args=["v1", str(self.item_2.id)]), {"stock_level": 120}, format='json', HTTP_IF_MATCH='"2"')
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.headers["ETag"], '"3"')
+		self.assertEqual(Inventory.objects.get(pk=self.item_2.id).stock_level, 120)
+
 	def test_delete_inventory_item_with_credentials(self):
 		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
 		response = self.client.delete(reverse("inventory-item", args=["v1", str(self.item_3.id)]))
@@ -215,6 +334,130 @@ class InventoryViewsTest(APITransactionTestCase):
 		self.assertEqual(response.data["detail"], "Item not found")
 		self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+	def test_get_items_ordered_together_with_an_item(self):
+		for names in [("Glasses", "Helmet"), ("Glasses", "Helmet", "Biscuits"), ("Biscuits",)]:
+			order = Order(product_owner_id=self.test_user, client_name="Client", order_date="2025-07-21")
+			prices = {"Glasses": 10000, "Helmet": 8000, "Biscuits": 100}
+			OrderBuilder(order, [OrderedProduct(name=name, quantity=1, price=prices[name]) for name in names]).save()
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+
+		response = self.client.get(reverse("inventory-item-related", args=["v1", self.item_1.id]))
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual((response.data["data"]["product_name"], response.data["data"]["order_count"]), ("Glasses", 2))
+		self.assertEqual(response.data["data"]["related"], [
+			{"id": self.item_5.id, "product_name": "Helmet", "order_count": 2, "confidence": 1, "lift": 1.5},
+			{"id": self.item_6.id, "product_name": "Biscuits", "order_count": 1, "confidence": 0.5, "lift": 0.75},
+		])
+		response = self.client.get(reverse("inventory-item-related", args=["v1", self.item_1.id]), {"limit": 1})
+		self.assertEqual([item["product_name"] for item in response.data["data"]["related"]], ["Helmet"])
+		response = self.client.get(reverse("inventory-item-related", args=["v1", self.item_2.id])) # never ordered
+		self.assertEqual((response.data["data"]["order_count"], response.data["data"]["related"]), (0, []))
+
+		response = self.client.get(reverse("inventory-item-related", args=["v1", self.item_1.id]), {"limit": 51})
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+		response = self.client.get(reverse("inventory-item-related", args=["v1", 999999999]))
+		self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
 	def test_delete_inventory_item_without_credentials(self):
 		response = self.client.delete(reverse("inventory-item", args=["v1", '3']))
-		self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
\ No newline at end of file
+		self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class InventoryForecastViewTest(APITransactionTestCase):
+	def setUp(self):
+		clear_cache()
+		metrics.reset()
+		self.test_user = CustomUser.objects.create(
+			business_name="Business 1", full_name="Business Man", email="businessMan@email.com", password="12345678", is_active=True
+		)
+		self.access_token = str(RefreshToken.for_user(self.test_user).access_token)
+		self.today = timezone.now().date()
+		self.glasses = Inventory.objects.create(
+			owner=self.test_user, product_name="Glasses", price=10000, stock_level=40, date_added=self.today - timedelta(days=60)
+		)
+		self.chair = Inventory.objects.create(owner=self.test_user, product_name="Plastic Chair", price=7000, stock_level=100, date_added="2025-07-20")
+		self.boots = Inventory.objects.create(
+			owner=self.test_user, product_name="Safety Boots", price=45000, stock_level=3, low_stock_threshold=5, date_added="2025-07-20"
+		)
+		self.sales = [(1, 4), (3, 6), (10, 2)] # (days ago, units of glasses)
+		for days_ago, quantity in self.sales:
+			self.add_order(days_ago, quantity, "Delivered")
+
+	def add_order(self, days_ago, quantity, order_status):
+		order = Order(product_owner_id=self.test_user, client_name="Client", status=order_status, order_date=self.today - timedelta(days=days_ago))
+		OrderBuilder(order, [OrderedProduct(name="Glasses", quantity=quantity, price=10000)]).save()
+		return order
+
+	def get_forecast(self, params=None):
+		response = self.client.get(reverse("inventory-forecast", args=["v1"]), params or {})
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		return response.data["data"]
+
+	def expected_velocity(self, sales, age):
+		alpha = smoothing_factor()
+		return alpha * sum(quantity * (1 - alpha) ** days_ago for days_ago, quantity in sales) / (1 - (1 - alpha) ** age)
+
+	def test_get_forecast_without_credentials(self):
+		response = self.client.get(reverse("inventory-forecast", args=["v1"]))
+		self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+	def test_forecast_stockout_dates_and_reorder_suggestions(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		velocity = self.expected_velocity(self.sales, 61)
+		days_left = math.floor(28 / velocity) # 12 of the 40 glasses were sold
+
+		data = self.get_forecast()
+		self.assertEqual(data["as_of"], self.today.isoformat())
+		self.assertEqual((data["lead_time"], data["cover_days"], data["length"]), (7, 30, 3))
+		self.assertEqual([product["id"] for product in data["products"]], [self.glasses.id, self.chair.id, self.boots.id])
+		glasses, chair, boots = data["products"]
+		self.assertEqual(glasses["daily_sales"], round(velocity, 2))
+		self.assertEqual(glasses["days_until_stockout"], days_left)
+		self.assertEqual(glasses["stockout_date"], (self.today + timedelta(days=days_left)).isoformat())
+		self.assertEqual(glasses["reorder_quantity"], 0) # it doesn't run out within the lead time
+		self.assertEqual((chair["daily_sales"], chair["stockout_date"], chair["reorder_quantity"]), (0, None, 0))
+		self.assertEqual((boots["days_until_stockout"], boots["reorder_quantity"]), (None, 2)) # low in stock
+
+		data = self.get_forecast({"lead_time": 30, "cover_days": 10})
+		self.assertEqual(data["products"][0]["reorder_quantity"], math.ceil(velocity * 40) + 5 - 28)
+		self.assertEqual(self.get_forecast({"within": days_left})["length"], 1)
+		self.assertEqual(self.get_forecast({"within": days_left - 1})["length"], 0)
+
+		data = self.get_forecast({"page": 1})
+		self.assertEqual((data["page_count"], data["next_page"], data["length"]), (1, None, 3))
+		response = self.client.get(reverse("inventory-forecast", args=["v1"]), {"page": 2})
+		self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+		for params in ({"lead_time": "soon"}, {"cover_days": 400}, {"within": -1}):
+			response = self.client.get(reverse("inventory-forecast", args=["v1"]), params)
+			self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+	def test_forecast_is_refreshed_incrementally_as_orders_are_delivered(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+
+		def assert_fresh(data):
+			clear_cache()
+			self.assertEqual(data["products"], self.get_forecast()["products"])
+
+		self.get_forecast()
+		self.get_forecast()
+		self.assertEqual(metrics.snapshot("forecast."), {"forecast.velocity.loads": 1, "forecast.velocity.hits": 1})
+
+		self.add_order(0, 5, "Delivered")
+		pending = self.add_order(2, 3, "Pending")
+		data = self.get_forecast()
+		self.assertEqual(metrics.snapshot("forecast.velocity.updates"), {"forecast.velocity.updates": 1})
+		self.assertEqual(data["products"][0]["daily_sales"], round(self.expected_velocity(self.sales + [(0, 5)], 61), 2))
+		assert_fresh(data)
+
+		Order.objects.for_owner(self.test_user.id).filter(pk=pending.pk).mark_delivered()
+		data = self.get_forecast()
+		self.assertEqual(metrics.snapshot("forecast.velocity.updates"), {"forecast.velocity.updates": 2})
+		self.assertEqual(data["products"][0]["daily_sales"], round(self.expected_velocity(self.sales + [(0, 5), (2, 3)], 61), 2))
+		assert_fresh(data)
+
+		# deleting a delivered order can't be applied incrementally
+		loads = metrics.snapshot("forecast.velocity.loads")["forecast.velocity.loads"]
+		Order.objects.for_owner(self.test_user.id).filter(pk=pending.pk).delete()
+		data = self.get_forecast()
+		self.assertEqual(metrics.snapshot("forecast.velocity.loads"), {"forecast.velocity.loads": loads + 1})
+		self.assertEqual(data["products"][0]["daily_sales"], round(self.expected_velocity(self.sales + [(0, 5)], 61), 2))
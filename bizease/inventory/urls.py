@@ -4,5 +4,7 @@ from django.urls import path
 urlpatterns = [
 	path('', views.InventoryView.as_view(), name="inventory"),
 	path('stats', views.InventoryStatsView.as_view(), name="inventory-stats"),
+	path('forecast', views.InventoryForecastView.as_view(), name="inventory-forecast"),
 	path('<int:item_id>', views.InventoryItemView.as_view(), name="inventory-item"),
+	path('<int:item_id>/related', views.InventoryRelatedView.as_view(), name="inventory-item-related"),
 ]
\ No newline at end of file
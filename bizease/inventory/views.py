@@ -1,12 +1,24 @@
 from .models import Inventory
+from .forecast import forecast
+from orders.models import OrderedProduct, ProductSalesStats, ProductAffinity, TenantOrderCount
 from rest_framework.views import APIView
 from .serializers import InventoryItemSerializer
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.parsers import JSONParser
+from bizease.parsers import JSONParser
 from rest_framework.response import Response
 from rest_framework import status
 from django.db.models import Sum, F, Q
 from django.db.utils import IntegrityError
+from bizease.conditional import (
+	VersionConflict, etag_for, if_match_failed, precondition_failed_response, version_conflict_response,
+	list_etag, if_none_match, cache_headers, not_modified_response
+)
+from bizease.serializers import parse_sparse_fieldset, columnar
+from bizease.transactions import run_in_transaction
+from bizease.renderers import ColumnarJSONRenderer, columnar_requested, streamed_length, StreamingJSONResponse, STREAMED_ARRAY
+from rest_framework.settings import api_settings
+from django.conf import settings
+from django.utils import timezone
 import math
 
 
@@ -16,15 +28,70 @@ class InventoryStatsView(APIView):
 	
 	def get(self, request, **kwargs):
 		data = {
-			"total_stock_value": Inventory.objects.filter(owner=request.user.id).aggregate(total=Sum(F("stock_level") * F("price")))["total"],
-			"low_stock_count": Inventory.objects.filter(owner=request.user.id).filter(stock_level__lte=F("low_stock_threshold")).count(),
-			"total_products":  Inventory.objects.filter(owner=request.user.id).count(),
+			"total_stock_value": Inventory.objects.for_owner(request.user.id).aggregate(total=Sum(F("stock_level") * F("price")))["total"],
+			"low_stock_count": Inventory.objects.for_owner(request.user.id).low_stock().count(),
+			"total_products":  Inventory.objects.for_owner(request.user.id).count(),
+		}
+		return Response({"data": data}, status=status.HTTP_200_OK)
+
+def days_parameter(params, name, default):
+	""" A number of days (0 to 365) from the query parameters. Raises ValueError for invalid values """
+	value = params.get(name)
+	if value is None:
+		return default
+	try:
+		days = int(value)
+	except ValueError:
+		raise ValueError(f"Invalid value for {name} parameter")
+	if not 0 <= days <= 365 or len(params.getlist(name)) != 1:
+		raise ValueError(f"Invalid value for {name} parameter. It must be a number of days from 0 to 365")
+	return days
+
+
+class InventoryForecastView(APIView):
+	permission_classes = [IsAuthenticated]
+	parser_classes = [JSONParser]
+	page_size = 20
+
+	def get(self, request, **kwargs):
+		try:
+			lead_time = days_parameter(request.GET, "lead_time", getattr(settings, "FORECAST_LEAD_TIME_DAYS", 7))
+			cover_days = days_parameter(request.GET, "cover_days", getattr(settings, "FORECAST_COVER_DAYS", 30))
+			within = days_parameter(request.GET, "within", None)
+		except ValueError as err:
+			return Response({"detail": str(err)}, status=status.HTTP_400_BAD_REQUEST)
+
+		try:
+			page = int(request.GET["page"]) if len(request.GET.getlist("page")) == 1 else None
+		except ValueError:
+			page = None
+
+		today = timezone.now().date()
+		products = forecast(request.user.id, lead_time=lead_time, cover_days=cover_days, within=within, today=today)
+		page_count = max(math.ceil(len(products)/self.page_size), 1)
+		if page:
+			if page_count < page or page <= 0:
+				return Response({"detail": "Page Not found", "data": None}, status=status.HTTP_404_NOT_FOUND)
+			products = products[(page-1) * self.page_size:page * self.page_size]
+		else:
+			page_count = 1
+
+		data = {
+			"as_of": today.isoformat(),
+			"lead_time": lead_time,
+			"cover_days": cover_days,
+			"page_count": page_count,
+			"next_page": page + 1 if page and page + 1 <= page_count else None,
+			"prev_page": page - 1 if page and page - 1 >= 1 else None,
+			"length": len(products),
+			"products": products
 		}
 		return Response({"data": data}, status=status.HTTP_200_OK)
 
 class InventoryView(APIView):
 	permission_classes = [IsAuthenticated]
 	parser_classes = [JSONParser]
+	renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, ColumnarJSONRenderer]
 	page_size = 20
 	curr_queryset = None
 
@@ -69,17 +136,28 @@ class InventoryView(APIView):
 		if 'low_stock' not in self.request.GET:
 			return self
 
-		self.curr_queryset = self.curr_queryset.filter(stock_level__lte=F("low_stock_threshold"))
+		self.curr_queryset = self.curr_queryset.low_stock()
 		return self
 
 	def get(self, request, **kwargs):
-		self.curr_queryset = Inventory.objects.filter(owner=request.user.id)
+		try:
+			fields, expand = parse_sparse_fieldset(request, InventoryItemSerializer.Meta.fields)
+		except ValueError as err:
+			return Response({"detail": str(err)}, status=status.HTTP_400_BAD_REQUEST)
+
+		self.curr_queryset = Inventory.objects.for_owner(request.user.id)
 		self.filter_by_query_param().filter_by_category_param().filter_low_Stock().order_by_query()
+		if fields:
+			self.curr_queryset = self.curr_queryset.only(*fields) # only the requested columns are selected
+
+		etag = list_etag(request, self.curr_queryset)
+		if if_none_match(request, etag):
+			return not_modified_response(etag)
 
 		page_param = self.get_page_param()
 
 		if page_param:
-			page_count = math.ceil(len(self.curr_queryset)/self.page_size)
+			page_count = math.ceil(self.curr_queryset.count()/self.page_size)
 			if (page_count < page_param) or (page_param <= 0):
 				return Response({"detail": "Page Not found", "data": None}, status=status.HTTP_404_NOT_FOUND)
 
@@ -87,7 +165,19 @@ class InventoryView(APIView):
 			self.curr_queryset = self.curr_queryset[offset:offset+self.page_size]
 		else:
 			page_count = 1
-		inventory_serializer = InventoryItemSerializer(list(self.curr_queryset), many=True)
+			length = streamed_length(request, self.curr_queryset)
+			if length is not None:
+				data = {"page_count": 1, "next_page": None, "prev_page": None, "length": length, "products": STREAMED_ARRAY}
+				return StreamingJSONResponse(
+					{"data": data}, self.curr_queryset.iterator(chunk_size=500),
+					lambda batch: InventoryItemSerializer(batch, many=True, fields=fields).data, headers=cache_headers(etag)
+				)
+		if columnar_requested(request):
+			products = columnar(self.curr_queryset, InventoryItemSerializer(), fields or InventoryItemSerializer.Meta.fields)
+			product_count = len(products["rows"])
+		else:
+			products = InventoryItemSerializer(list(self.curr_queryset), many=True, fields=fields).data
+			product_count = len(products)
 
 
 		if page_param and (page_param+1 <= page_count):
@@ -104,10 +194,10 @@ class InventoryView(APIView):
 			"page_count": page_count,
 			"next_page": next_page,
 			"prev_page": prev_page,
-			"length": len(inventory_serializer.data),
-			"products": inventory_serializer.data
+			"length": product_count,
+			"products": products
 		}
-		return Response({"data": data}, status=status.HTTP_200_OK)
+		return Response({"data": data}, status=status.HTTP_200_OK, headers=cache_headers(etag))
 
 	def post(self, request, **kwargs):
 		serializer = InventoryItemSerializer(data=request.data)
@@ -130,23 +220,28 @@ class InventoryItemView(APIView):
 
 	def get(self, request, item_id, **kwargs):
 		try:
-			item = Inventory.objects.get(pk=item_id)
+			item = Inventory.objects.for_owner(request.user.id).get(pk=item_id)
 		except Inventory.DoesNotExist:
 			return Response({"detail": "Item not found"}, status=status.HTTP_404_NOT_FOUND)
 		except Inventory.MultipleObjectsReturned: # This shouldn't be possible but it's handled anyways
 			return Response({"detail": "Something went wrong! Please try again"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+		if if_none_match(request, etag_for(item)):
+			return not_modified_response(etag_for(item))
 		inventory_item = InventoryItemSerializer(item)
-		return Response({"data": inventory_item.data}, status=status.HTTP_200_OK)
+		return Response({"data": inventory_item.data}, status=status.HTTP_200_OK, headers=cache_headers(etag_for(item)))
 
 	def put(self, request, item_id, **kwargs):
 		try:
-			item = Inventory.objects.get(pk=item_id)
+			item = Inventory.objects.for_owner(request.user.id).get(pk=item_id)
 		except Inventory.DoesNotExist:
 			return Response({"detail": "Item not found"}, status=status.HTTP_404_NOT_FOUND)
 		except Inventory.MultipleObjectsReturned: # This shouldn't be possible but it's handled anyways
 			return Response({"detail": "Something went wrong! Please try again"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+		if if_match_failed(request, item):
+			return precondition_failed_response(item)
+
 		productDataUpdate = InventoryItemSerializer(item, data=request.data, partial=True)
 		if productDataUpdate.is_valid():
 			if productDataUpdate.validated_data.get("field_errors"):
@@ -158,26 +253,81 @@ class InventoryItemView(APIView):
 					return Response({"detail": "Multiple inventory items with the same 'product_name' are not allowed"}, status=status.HTTP_400_BAD_REQUEST)
 				else: # check-constraint "price_greater_than_zero" violated (probably)
 					return Response({"detail": "An inventory item's price must be greater than zero"}, status=status.HTTP_400_BAD_REQUEST)
+			except VersionConflict: # the item was changed (e.g by an order) after it was read above
+				return version_conflict_response(request)
 				
-			return Response({"detail": "Product data updated successful"}, status=status.HTTP_200_OK)
+			return Response({"detail": "Product data updated successful"}, status=status.HTTP_200_OK, headers={"ETag": etag_for(item)})
 		else:
 			return Response(
 				{"detail": productDataUpdate.errors}, 
 				status=status.HTTP_400_BAD_REQUEST
 			)
 
+	def delete_item(self, item):
+		"""
+		Deletes the item and moves its sales stats to the names of the ordered products it was sold as, which is how
+		ordered products without an inventory item are grouped
+		"""
+		sold_names = list(
+			OrderedProduct.objects.for_owner(item.owner_id).filter(inventory_item=item, order_id__status="Delivered")
+			.order_by().values_list("name", flat=True).distinct()
+		)
+		del_count, del_dict = item.delete()
+		if sold_names:
+			ProductSalesStats.objects.refresh(item.owner_id, names=sold_names)
+		return del_count
+
 	def delete(self, request, item_id, **kwargs):
 		try:
-			item = Inventory.objects.get(pk=item_id)
+			item = Inventory.objects.for_owner(request.user.id).get(pk=item_id)
 		except Inventory.DoesNotExist:
 			return Response({"detail": "Item not found"}, status=status.HTTP_404_NOT_FOUND)
 		except Inventory.MultipleObjectsReturned: # This shouldn't be possible but it's handled anyways
 			return Response({"detail": "Something went wrong! Please try again"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-		del_count, del_dict = item.delete()
+		del_count = run_in_transaction(self.delete_item, item, name="inventory_item_delete")
 		if (del_count > 0):
 			return Response({"detail": "Inventory Item deleted successfully"}, status=status.HTTP_200_OK)
 		else: # What could go wrong?
 			return Response(
 				{"detail": "Delete operation incomplete. Something went wrong while deleting inventory Item"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
-			)
\ No newline at end of file
+			)
+
+class InventoryRelatedView(APIView):
+	""" The inventory items most often ordered together with an item, with their confidence and lift, for "frequently bought together" suggestions """
+	permission_classes = [IsAuthenticated]
+	parser_classes = [JSONParser]
+	max_limit = 50
+
+	def get(self, request, item_id, **kwargs):
+		try:
+			limit = int(request.GET.get("limit", 10))
+		except ValueError:
+			limit = 0
+		if not 1 <= limit <= self.max_limit or len(request.GET.getlist("limit")) > 1:
+			return Response({"detail": f"Invalid value for limit parameter. It must be a number from 1 to {self.max_limit}"}, status=status.HTTP_400_BAD_REQUEST)
+		try:
+			item = Inventory.objects.for_owner(request.user.id).only("id", "product_name").get(pk=item_id)
+		except Inventory.DoesNotExist:
+			return Response({"detail": "Item not found"}, status=status.HTTP_404_NOT_FOUND)
+
+		affinities = ProductAffinity.objects.for_owner(request.user.id)
+		item_orders = affinities.filter(inventory_item=item.id, related_item=item.id).values_list("order_count", flat=True).first() or 0
+		total_orders = 0
+		if item_orders:
+			total_orders = TenantOrderCount.objects.for_owner(request.user.id).values_list("order_count", flat=True).first() or 0
+		related = [
+			{
+				"id": related_id,
+				"product_name": product_name,
+				"order_count": together,
+				# the share of the item's orders that have the related item, and how much more often they're ordered
+				# together than if they were ordered independently
+				"confidence": round(together / item_orders, 4),
+				"lift": round(together * total_orders / (item_orders * related_orders), 4),
+			}
+			for related_id, product_name, together, related_orders in affinities.related(item.id, limit)
+		]
+		data = {"id": item.id, "product_name": item.product_name, "order_count": item_orders, "related": related}
+		return Response({"data": data}, status=status.HTTP_200_OK)
+
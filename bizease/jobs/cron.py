@@ -0,0 +1,114 @@
+"""
+Cron style schedules for periodic jobs.
+
+The PERIODIC_JOBS setting maps a name to a task, a cron expression and optionally the task's kwargs and priority:
+
+    PERIODIC_JOBS = {
+        "precompute-report-snapshots": {"task": "reports.precompute_report_snapshots", "cron": "5 0 * * *"},
+    }
+
+Every worker runs a PeriodicScheduler. Each run of a periodic job is enqueued with a unique key made of its name and
+scheduled time so it's enqueued once however many workers are running. Runs missed while no worker was running aren't
+made up for, and runs missed while a worker was busy are coalesced into one, the same as cron.
+"""
+from django.utils import timezone
+from .queue import TASKS, enqueue
+from datetime import timedelta
+
+
+# (lowest, highest) value of each field. 7 is also accepted for sunday in the day of week field
+FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+def parse_field(field, lowest, highest):
+    """ The values a cron field matches. Supports '*', single values, ranges, lists and steps ('*/15', '1-5/2') """
+    values = set()
+    for part in field.split(","):
+        expression, _, step = part.partition("/")
+        try:
+            step = int(step) if step else 1
+            if expression == "*":
+                start, end = lowest, highest
+            elif "-" in expression:
+                start, end = (int(value) for value in expression.split("-", 1))
+            else:
+                start = int(expression)
+                end = highest if step != 1 else start # '5/15' means every 15 from 5
+        except ValueError:
+            raise ValueError(f"Invalid cron field '{field}'")
+        if not lowest <= start <= end <= highest or step < 1:
+            raise ValueError(f"Invalid cron field '{field}'")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """ A 5 field cron expression: minute, hour, day of month, month and day of week (0 or 7 is sunday) """
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Invalid cron expression '{expression}'. It must have 5 fields")
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            parse_field(field, *FIELD_RANGES[index]) for index, field in enumerate(fields)
+        )
+        if 7 in self.weekdays:
+            self.weekdays = (self.weekdays - {7}) | {0}
+        self.any_day, self.any_weekday = fields[2] == "*", fields[4] == "*"
+
+    def day_matches(self, moment):
+        day_matches = moment.day in self.days
+        weekday_matches = (moment.weekday() + 1) % 7 in self.weekdays
+        # when both day fields are restricted either may match, the same as cron
+        if not self.any_day and not self.any_weekday:
+            return day_matches or weekday_matches
+        return day_matches and weekday_matches
+
+    def matches(self, moment):
+        return moment.minute in self.minutes and moment.hour in self.hours and moment.month in self.months and self.day_matches(moment)
+
+    def next_after(self, moment):
+        """ The first minute after 'moment' the schedule matches, in moment's timezone """
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        give_up_at = candidate + timedelta(days=5 * 366) # e.g '0 0 31 2 *' never matches
+        while candidate < give_up_at:
+            if candidate.month not in self.months:
+                next_month = candidate.replace(day=1, hour=0, minute=0) + timedelta(days=32)
+                candidate = next_month.replace(day=1)
+            elif not self.day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError("The schedule never matches")
+
+
+class PeriodicScheduler:
+    """ Enqueues the runs of periodic jobs that became due since the previous tick """
+
+    def __init__(self, periodic_jobs, now=None):
+        self.entries = []
+        for name, entry in periodic_jobs.items():
+            if entry["task"] not in TASKS:
+                raise ValueError(f"Unknown task '{entry['task']}' for periodic job '{name}'")
+            self.entries.append((name, entry, CronSchedule(entry["cron"])))
+        self.last_tick = timezone.localtime(now)
+
+    def tick(self, now=None):
+        """ Returns the jobs enqueued """
+        now = timezone.localtime(now)
+        enqueued = []
+        for name, entry, schedule in self.entries:
+            latest_run, run = None, schedule.next_after(self.last_tick)
+            while run <= now:
+                latest_run, run = run, schedule.next_after(run)
+            if latest_run is not None:
+                enqueued.append(enqueue(
+                    entry["task"], entry.get("kwargs"), priority=entry.get("priority"),
+                    unique_key=f"periodic:{name}:{latest_run.isoformat()}"
+                ))
+        self.last_tick = now
+        return enqueued
@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from jobs.queue import claim_jobs, run_job, requeue_stale_jobs, purge_finished_jobs
+from jobs.cron import PeriodicScheduler
+import os
+import socket
+import threading
+import time
+
+
+class Command(BaseCommand):
+    help = "Runs background jobs and enqueues the periodic jobs of the PERIODIC_JOBS setting when they're due"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=1, help="Number of jobs run at the same time (worker threads)")
+        parser.add_argument("--batch-size", type=int, default=1, help="Number of jobs a worker thread claims at a time")
+        parser.add_argument("--interval", type=float, default=1.0, help="Seconds to wait before polling an empty queue again")
+        parser.add_argument("--once", action="store_true", help="Exit once there are no due jobs left")
+        parser.add_argument("--no-scheduler", action="store_true", help="Don't enqueue periodic jobs")
+
+    def run_jobs(self, worker_id, options):
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                jobs = claim_jobs(worker_id, options["batch_size"])
+                for job in jobs:
+                    run_job(job)
+                if not jobs:
+                    if options["once"]:
+                        return
+                    self.stopping.wait(options["interval"])
+        finally:
+            connection.close()
+
+    def run_maintenance(self, scheduler):
+        close_old_connections()
+        if scheduler is not None:
+            scheduler.tick()
+        if time.monotonic() - self.last_cleanup >= 60:
+            requeue_stale_jobs()
+            purge_finished_jobs()
+            self.last_cleanup = time.monotonic()
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1 or options["batch_size"] < 1:
+            raise CommandError("--concurrency and --batch-size must be at least 1")
+
+        scheduler = None if options["no_scheduler"] else PeriodicScheduler(getattr(settings, "PERIODIC_JOBS", {}))
+        self.last_cleanup = float("-inf")
+        if options["once"]:
+            self.run_maintenance(None)
+
+        self.stopping = threading.Event()
+        worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        threads = [
+            threading.Thread(target=self.run_jobs, args=(f"{worker_prefix}:{index}", options), daemon=True)
+            for index in range(options["concurrency"])
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                # the scheduler and the cleanup of stale and finished jobs run in this thread, between joins
+                for thread in threads:
+                    thread.join(timeout=options["interval"] / len(threads))
+                if not options["once"]:
+                    self.run_maintenance(scheduler)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping workers once their current jobs are done")
+            self.stopping.set()
+            for thread in threads:
+                thread.join()
+        finally:
+            connection.close()
@@ -0,0 +1,33 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    A call of a registered task (see jobs.queue) with JSON keyword arguments, run in the background by a worker
+    (python manage.py run_worker). Jobs with a higher priority run first and a job doesn't run before run_at.
+    """
+    STATUSES = {"Queued": "Queued", "Running": "Running", "Completed": "Completed", "Failed": "Failed"}
+
+    task = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict, blank=True)
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(choices=STATUSES, default="Queued")
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    last_error = models.TextField(blank=True)
+    # a job enqueued with a key that's already taken isn't enqueued again, e.g each run of a periodic job
+    unique_key = models.CharField(max_length=200, null=True, blank=True, unique=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_at"], name="job_queue_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.task} job {self.id} - {self.status}"
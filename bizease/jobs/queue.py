@@ -0,0 +1,180 @@
+"""
+A job queue on the application's database, so background work runs wherever the app runs, without a broker.
+
+Tasks are functions registered with @task in an app's tasks.py (the tasks module of every installed app is imported
+when the jobs app is ready). enqueue() stores a Job for a task and workers (python manage.py run_worker) claim due jobs,
+highest priority first, and run them.
+
+On databases that support SELECT ... FOR UPDATE SKIP LOCKED (postgres) a worker locks the jobs it claims and skips the
+ones other workers have locked, so workers never wait on each other. Elsewhere (sqlite) a worker claims each job with
+a conditional UPDATE (... WHERE status = 'Queued'), which only one worker can win.
+
+A run that raises is retried with exponential backoff until the job's max_attempts is reached. While a job runs its
+worker refreshes the job's locked_at every JOBS_HEARTBEAT seconds, so jobs whose locked_at is older than JOBS_TIMEOUT
+seconds belong to a worker that died. They're queued again (or failed if they're out of attempts).
+"""
+from django.conf import settings
+from django.db import connection, transaction, DatabaseError, IntegrityError
+from django.db.models import F
+from django.utils import timezone
+from bizease import metrics
+from bizease.transactions import run_in_transaction
+from .models import Job
+from datetime import timedelta
+import threading
+
+
+TASKS = {}
+
+
+def task(func=None, *, name=None, max_attempts=3, priority=0):
+    """
+    Registers a function as a task. Its name defaults to '<app>.<function name>'. Tasks are called with the keyword
+    arguments they were enqueued with, which must be JSON serializable, and must be safe to run more than once
+    """
+    def register(func):
+        task_name = name or f"{func.__module__.split('.')[0]}.{func.__name__}"
+        TASKS[task_name] = {"func": func, "max_attempts": max_attempts, "priority": priority}
+        func.task_name = task_name
+        return func
+
+    return register(func) if func is not None else register
+
+
+def enqueue(task, kwargs=None, *, priority=None, run_at=None, delay=None, max_attempts=None, unique_key=None):
+    """
+    Queues a job for a task (a registered function or its name). run_at or delay (seconds) postpones it. If unique_key
+    is already taken the existing job is returned instead of queuing another one
+    """
+    task_name = getattr(task, "task_name", task)
+    if task_name not in TASKS:
+        raise ValueError(f"Unknown task '{task_name}'")
+    options = TASKS[task_name]
+    if run_at is None:
+        run_at = timezone.now() + timedelta(seconds=delay or 0)
+
+    fields = {
+        "task": task_name,
+        "kwargs": kwargs or {},
+        "priority": options["priority"] if priority is None else priority,
+        "run_at": run_at,
+        "max_attempts": options["max_attempts"] if max_attempts is None else max_attempts,
+    }
+    if unique_key is None:
+        return Job.objects.create(**fields)
+    try:
+        with transaction.atomic():
+            return Job.objects.create(unique_key=unique_key, **fields)
+    except IntegrityError:
+        return Job.objects.get(unique_key=unique_key)
+
+
+def due_jobs(now):
+    return Job.objects.filter(status="Queued", run_at__lte=now).order_by("-priority", "run_at", "id")
+
+
+def claim_jobs(worker_id, limit=1):
+    """ Claims up to 'limit' due jobs for a worker and returns them, highest priority first """
+    now = timezone.now()
+    claim = {"status": "Running", "locked_by": worker_id, "locked_at": now, "attempts": F("attempts") + 1}
+
+    def claim_due_jobs():
+        if connection.features.has_select_for_update_skip_locked:
+            job_ids = list(due_jobs(now).select_for_update(skip_locked=True).values_list("id", flat=True)[:limit])
+            Job.objects.filter(id__in=job_ids).update(**claim)
+            return job_ids
+        return [
+            job_id for job_id in due_jobs(now).values_list("id", flat=True)[:limit]
+            if Job.objects.filter(pk=job_id, status="Queued").update(**claim) == 1
+        ]
+
+    # claims made at the same time by other workers (e.g sqlite's "database is locked") are retried
+    job_ids = run_in_transaction(claim_due_jobs, name="jobs_claim")
+    return list(Job.objects.filter(id__in=job_ids).order_by("-priority", "run_at", "id"))
+
+
+def retry_delay(attempts):
+    base_delay = getattr(settings, "JOBS_RETRY_DELAY", 10)
+    return min(base_delay * (2 ** (attempts - 1)), getattr(settings, "JOBS_RETRY_MAX_DELAY", 3600))
+
+
+def beat(job):
+    """ Refreshes the locked_at of a running job. Returns False if its worker no longer holds the claim """
+    claimed = Job.objects.filter(pk=job.pk, status="Running", locked_by=job.locked_by)
+    return run_in_transaction(claimed.update, name="jobs_heartbeat", locked_at=timezone.now()) == 1
+
+
+class Heartbeat(threading.Thread):
+    """ Calls beat() for a job every JOBS_HEARTBEAT seconds until stopped, so a job that runs long isn't taken for stale """
+
+    def __init__(self, job):
+        super().__init__(name=f"job-{job.pk}-heartbeat", daemon=True)
+        self.job = job
+        self.stopped = threading.Event()
+
+    def run(self):
+        interval = getattr(settings, "JOBS_HEARTBEAT", 60)
+        try:
+            while not self.stopped.wait(interval):
+                try:
+                    if not beat(self.job):
+                        return
+                except DatabaseError:
+                    # a missed beat is retried at the next one, the job only goes stale after JOBS_TIMEOUT
+                    pass
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_job(job):
+    """
+    Runs a claimed job and records the outcome. The outcome is only saved if the job is still claimed by the same
+    worker, i.e it wasn't requeued as stale in the meantime
+    """
+    registered = TASKS.get(job.task)
+    heartbeat = Heartbeat(job)
+    heartbeat.start()
+    try:
+        if registered is None:
+            raise LookupError(f"Unknown task '{job.task}'")
+        registered["func"](**job.kwargs)
+    except Exception as err:
+        job.last_error = f"{err.__class__.__name__}: {err}"
+        if job.attempts < job.max_attempts:
+            job.status = "Queued"
+            job.run_at = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+            metrics.incr(f"jobs.{job.task}.retries")
+        else:
+            job.status, job.finished_at = "Failed", timezone.now()
+            metrics.incr(f"jobs.{job.task}.failed")
+    else:
+        job.status, job.finished_at, job.last_error = "Completed", timezone.now(), ""
+        metrics.incr(f"jobs.{job.task}.completed")
+    finally:
+        heartbeat.stop()
+
+    run_in_transaction(
+        Job.objects.filter(pk=job.pk, status="Running", locked_by=job.locked_by).update, name="jobs_finish",
+        status=job.status, run_at=job.run_at, finished_at=job.finished_at, last_error=job.last_error, locked_by="", locked_at=None
+    )
+    return job
+
+
+def requeue_stale_jobs():
+    """ Queues jobs whose worker stopped beating (see Heartbeat) again, or fails them if they're out of attempts """
+    stale = Job.objects.filter(status="Running", locked_at__lt=timezone.now() - timedelta(seconds=getattr(settings, "JOBS_TIMEOUT", 600)))
+    failed = stale.filter(attempts__gte=F("max_attempts")).update(
+        status="Failed", finished_at=timezone.now(), last_error="Timed out", locked_by="", locked_at=None
+    )
+    requeued = stale.update(status="Queued", locked_by="", locked_at=None)
+    return requeued, failed
+
+
+def purge_finished_jobs():
+    """ Deletes the jobs that finished more than JOBS_RETENTION seconds ago """
+    finished_before = timezone.now() - timedelta(seconds=getattr(settings, "JOBS_RETENTION", 7 * 24 * 3600))
+    return Job.objects.filter(status__in=["Completed", "Failed"], finished_at__lt=finished_before).delete()[0]
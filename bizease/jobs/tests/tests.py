@@ -0,0 +1,137 @@
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.management import call_command
+from django.db import connection
+from django.utils import timezone
+from jobs.models import Job
+from jobs.queue import task, enqueue, claim_jobs, run_job, requeue_stale_jobs
+from jobs.cron import CronSchedule, PeriodicScheduler
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest.mock import patch
+import time
+
+calls = []
+
+@task(name="tests.record", priority=1)
+def record(value):
+	calls.append(value)
+
+@task(name="tests.fail", max_attempts=2)
+def fail():
+	raise RuntimeError("broken")
+
+@task(name="tests.long_run")
+def long_run():
+	# runs as if it started long ago, until its worker's heartbeat refreshes it
+	running = Job.objects.filter(task="tests.long_run", status="Running")
+	running.update(locked_at=timezone.now() - timedelta(hours=1))
+	deadline = time.monotonic() + 5
+	while running.filter(locked_at__lt=timezone.now() - timedelta(minutes=1)).exists() and time.monotonic() < deadline:
+		time.sleep(0.01)
+	calls.append(requeue_stale_jobs())
+
+
+class JobQueueTest(TransactionTestCase):
+	def setUp(self):
+		calls.clear()
+
+	def test_jobs_run_by_priority(self):
+		enqueue(record, {"value": "low"}, priority=0)
+		enqueue("tests.record", {"value": "default"})
+		enqueue(record, {"value": "high"}, priority=5)
+		enqueue(record, {"value": "later"}, delay=3600)
+
+		call_command("run_worker", "--once", "--no-scheduler")
+		self.assertEqual(calls, ["high", "default", "low"])
+		self.assertEqual(Job.objects.filter(status="Completed").count(), 3)
+		self.assertEqual(Job.objects.get(status="Queued").kwargs, {"value": "later"})
+
+		with self.assertRaises(ValueError):
+			enqueue("tests.missing")
+
+	def test_failed_jobs_are_retried_with_backoff(self):
+		job = enqueue(fail)
+		started = timezone.now()
+		call_command("run_worker", "--once", "--no-scheduler")
+		job.refresh_from_db()
+		self.assertEqual((job.status, job.attempts, job.last_error), ("Queued", 1, "RuntimeError: broken"))
+		self.assertGreaterEqual(job.run_at, started + timedelta(seconds=10))
+
+		Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+		call_command("run_worker", "--once", "--no-scheduler")
+		job.refresh_from_db()
+		self.assertEqual((job.status, job.attempts), ("Failed", 2))
+		self.assertIsNotNone(job.finished_at)
+
+	def test_jobs_are_claimed_once(self):
+		job = enqueue(record, {"value": 1})
+		self.assertEqual(claim_jobs("worker-1", 5), [job])
+		self.assertEqual(claim_jobs("worker-2", 5), [])
+
+		# the SKIP LOCKED path. sqlite doesn't lock rows so only the claiming logic is exercised here
+		other_job = enqueue(record, {"value": 2})
+		with patch.object(connection.features, "has_select_for_update_skip_locked", True):
+			claimed = claim_jobs("worker-2", 5)
+			self.assertEqual(claimed, [other_job])
+			self.assertEqual(claim_jobs("worker-1", 5), [])
+		self.assertEqual((claimed[0].status, claimed[0].locked_by, claimed[0].attempts), ("Running", "worker-2", 1))
+
+	def test_unique_jobs_are_enqueued_once(self):
+		job = enqueue(record, {"value": 1}, unique_key="record-1")
+		self.assertEqual(enqueue(record, {"value": 1}, unique_key="record-1"), job)
+		self.assertEqual(Job.objects.count(), 1)
+
+	@override_settings(JOBS_TIMEOUT=60)
+	def test_stale_jobs_are_requeued(self):
+		job = enqueue(record, {"value": 1})
+		claimed = claim_jobs("dead-worker")[0]
+		Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(minutes=5))
+		self.assertEqual(requeue_stale_jobs(), (1, 0))
+
+		# the outcome of the dead worker's run can't overwrite the requeued job
+		run_job(claimed)
+		job.refresh_from_db()
+		self.assertEqual(job.status, "Queued")
+
+	@override_settings(JOBS_TIMEOUT=60, JOBS_HEARTBEAT=0.05)
+	def test_running_jobs_with_a_heartbeat_arent_requeued(self):
+		job = enqueue(long_run)
+		run_job(claim_jobs("worker-1")[0])
+		self.assertEqual(calls, [(0, 0)])
+		job.refresh_from_db()
+		self.assertEqual((job.status, job.attempts), ("Completed", 1))
+
+
+class CronTest(TestCase):
+	def test_next_run(self):
+		moment = datetime(2025, 3, 20, 10, 7, 30, tzinfo=dt_timezone.utc) # a thursday
+		self.assertEqual(CronSchedule("*/15 * * * *").next_after(moment), moment.replace(minute=15, second=0))
+		self.assertEqual(CronSchedule("5 0 * * *").next_after(moment), datetime(2025, 3, 21, 0, 5, tzinfo=dt_timezone.utc))
+		self.assertEqual(CronSchedule("0 9 * * 1-5").next_after(moment), datetime(2025, 3, 21, 9, 0, tzinfo=dt_timezone.utc))
+		self.assertEqual(CronSchedule("0 9 * * 7").next_after(moment), datetime(2025, 3, 23, 9, 0, tzinfo=dt_timezone.utc))
+		self.assertEqual(CronSchedule("30 6 1 */3 *").next_after(moment), datetime(2025, 4, 1, 6, 30, tzinfo=dt_timezone.utc))
+		# either day field may match when both are restricted
+		self.assertEqual(CronSchedule("0 0 1 * 6").next_after(moment), datetime(2025, 3, 22, 0, 0, tzinfo=dt_timezone.utc))
+
+		for expression in ["* * * *", "60 * * * *", "*/0 * * * *", "a * * * *", "5-1 * * * *"]:
+			with self.assertRaises(ValueError):
+				CronSchedule(expression)
+		with self.assertRaises(ValueError):
+			CronSchedule("0 0 31 2 *").next_after(moment)
+
+	def test_periodic_runs_are_enqueued_once(self):
+		periodic_jobs = {"every-15-minutes": {"task": "tests.record", "cron": "*/15 * * * *", "kwargs": {"value": "tick"}}}
+		started = datetime(2025, 3, 20, 10, 7, tzinfo=dt_timezone.utc)
+		schedulers = [PeriodicScheduler(periodic_jobs, started), PeriodicScheduler(periodic_jobs, started)]
+
+		self.assertEqual(schedulers[0].tick(started + timedelta(minutes=5)), [])
+		# both workers see the 10:15 run but only one job is enqueued
+		jobs = [scheduler.tick(started + timedelta(minutes=9)) for scheduler in schedulers]
+		self.assertEqual(jobs[0], jobs[1])
+		self.assertEqual(Job.objects.get().unique_key, "periodic:every-15-minutes:2025-03-20T10:15:00+00:00")
+
+		# the runs a busy worker missed are coalesced into the latest one
+		self.assertEqual(len(schedulers[0].tick(started + timedelta(hours=1))), 1)
+		self.assertEqual(Job.objects.latest("id").unique_key, "periodic:every-15-minutes:2025-03-20T11:00:00+00:00")
+
+		with self.assertRaises(ValueError):
+			PeriodicScheduler({"broken": {"task": "tests.missing", "cron": "* * * * *"}})
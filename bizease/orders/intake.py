@@ -0,0 +1,122 @@
+"""
+Applies the orders accepted during asynchronous intake.
+
+Queuing an intake queues an 'orders.process_tenant_intakes' background job (see jobs.queue) for its tenant, run by
+python manage.py run_worker. A tenant's intakes are applied one at a time, in the order they were received, however
+many workers are running: an intake is only claimed while no other intake of its tenant is 'Processing', and claims lock
+the tenant's user row so two workers can't both claim one. Claims record the worker and the time they were made, and
+intakes still 'Processing' ORDER_INTAKE_TIMEOUT seconds later are assumed to belong to a worker that died and are
+queued again by the 'orders.requeue_stale_intakes' periodic job. An intake's order is created in the transaction that
+records its outcome, and only while the worker still holds the claim, so an intake that was queued again is never
+applied twice.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+from accounts.models import CustomUser
+from bizease.transactions import run_in_transaction, lock_rows
+from jobs.queue import enqueue
+from .models import OrderIntake
+from .serializers import OrderSerializer
+from datetime import timedelta
+import os
+import socket
+import threading
+
+
+def worker_name():
+	return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def queue_intake_processing(owner_id):
+	enqueue("orders.process_tenant_intakes", {"owner_id": owner_id})
+
+
+def claim_next_intake(owner_id, worker_id):
+	""" Claims the tenant's oldest queued intake. Returns None if there is none or another intake of the tenant is being applied """
+	return run_in_transaction(_claim_next_intake, owner_id, worker_id, name="order_intake_claim")
+
+
+def _claim_next_intake(owner_id, worker_id):
+	lock_rows(CustomUser.objects.filter(pk=owner_id))
+	intakes = OrderIntake.objects.for_owner(owner_id)
+	if intakes.filter(status="Processing").exists():
+		return None
+	intake = intakes.filter(status="Queued").select_related("owner").order_by("id").first()
+	if intake is None:
+		return None
+	intake.status, intake.claimed_by, intake.claimed_at = "Processing", worker_id, timezone.now()
+	intake.save(update_fields=["status", "claimed_by", "claimed_at"])
+	return intake
+
+
+def apply_intake(intake):
+	"""
+	Creates the order described by a claimed intake the same way OrdersView.post would and records the outcome.
+	Returns False (and does nothing) if the claim was lost, i.e the intake was queued again as stale
+	"""
+	return run_in_transaction(_apply_intake, intake, name="order_intake_apply")
+
+
+def _apply_intake(intake):
+	claimed = OrderIntake.objects.unscoped().filter(
+		pk=intake.id, status="Processing", claimed_by=intake.claimed_by, claimed_at=intake.claimed_at
+	)
+	if not lock_rows(claimed):
+		return False
+
+	intake.order, intake.errors = None, None
+	serializer = OrderSerializer(data=intake.payload)
+	if not serializer.is_valid():
+		intake.status, intake.errors = "Failed", serializer.errors
+	else:
+		# a failed order is rolled back to here, the intake still records the failure
+		savepoint = transaction.savepoint()
+		response = serializer.save(intake.owner)
+		errors = response.get("errors") or response.get("detail")
+		if errors:
+			transaction.savepoint_rollback(savepoint)
+			intake.status = "Failed"
+			intake.errors = "Something went wrong! Please try again" if errors == "Fatal error" else errors
+		else:
+			transaction.savepoint_commit(savepoint)
+			intake.status, intake.order = "Applied", response["data"]
+
+	intake.processed_at = timezone.now()
+	intake.save(update_fields=["status", "order", "errors", "processed_at"])
+	return True
+
+
+def requeue_stale_intakes():
+	""" Intakes left 'Processing' by a worker that died are queued again so they (and their tenant's later intakes) are applied """
+	stale_after = timedelta(seconds=getattr(settings, "ORDER_INTAKE_TIMEOUT", 300))
+	return OrderIntake.objects.unscoped().filter(
+		Q(claimed_at__lt=timezone.now() - stale_after) | Q(claimed_at__isnull=True), status="Processing"
+	).update(status="Queued", claimed_by="", claimed_at=None)
+
+
+def process_tenant_intakes(owner_id, batch_size=20):
+	"""
+	Applies up to 'batch_size' queued intakes of one tenant in the order they were received and queues another job for
+	the tenant if there may be more. Returns the number applied. Does nothing while another worker applies the tenant's
+	intakes, that worker applies the queued ones once it's done
+	"""
+	worker_id = worker_name()
+	applied = 0
+	while applied < batch_size:
+		intake = claim_next_intake(owner_id, worker_id)
+		if intake is None:
+			return applied
+		apply_intake(intake)
+		applied += 1
+	queue_intake_processing(owner_id)
+	return applied
+
+
+def tenants_with_queued_intakes():
+	""" Owner ids with queued intakes, oldest first """
+	return list(
+		OrderIntake.objects.unscoped().filter(status="Queued").values("owner_id")
+		.annotate(oldest=Min("id")).order_by("oldest").values_list("owner_id", flat=True)
+	)
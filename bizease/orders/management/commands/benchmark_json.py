@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.parsers import JSONParser
+from accounts.models import CustomUser
+from inventory.models import Inventory
+from orders.models import Order, OrderedProduct
+from orders.serializers import OrderSerializer
+from bizease.renderers import FastJSONRenderer, StreamingJSONResponse, STREAMED_ARRAY
+from bizease.parsers import FastJSONParser
+from decimal import Decimal
+import io
+import timeit
+
+
+class Command(BaseCommand):
+	help = "Compares DRF's JSON renderer and parser with the orjson based ones on the serialized data of a list of orders"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--orders", type=int, default=1000, help="Number of orders in the list")
+		parser.add_argument("--products", type=int, default=3, help="Number of ordered products per order")
+		parser.add_argument("--repeat", type=int, default=20, help="Number of times each operation is timed")
+
+	def create_orders(self, order_count, products_per_order):
+		owner = CustomUser.objects.create(business_name="benchmark-biz", full_name="benchmark", email="benchmark@bizease.invalid", is_active=True)
+		today = timezone.now().date()
+		items = Inventory.objects.bulk_create([
+			Inventory(owner=owner, product_name=f"Product {index}", price=Decimal("1250.50") + index, stock_level=100, date_added=today)
+			for index in range(products_per_order)
+		])
+		orders = Order.objects.bulk_create([
+			Order(
+				product_owner_id=owner, client_name=f"Client {index}", client_email=f"client{index}@example.com", client_phone="08012345678",
+				order_date=today, total_price=sum(item.price * 2 for item in items)
+			)
+			for index in range(order_count)
+		])
+		OrderedProduct.objects.bulk_create([
+			OrderedProduct(order_id=order, inventory_item=item, name=item.product_name, quantity=2, price=item.price, cummulative_price=item.price * 2)
+			for order in orders for item in items
+		])
+		return owner
+
+	def time(self, label, func, repeat, baseline=None):
+		seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+		speedup = f" ({baseline / seconds:.1f}x)" if baseline else ""
+		self.stdout.write(f"{label:<40}{seconds * 1000:>10.2f} ms{speedup}")
+		return seconds
+
+	def handle(self, *args, **options):
+		repeat = options["repeat"]
+		# the orders are only created for the benchmark and are rolled back once it's done
+		with transaction.atomic():
+			owner = self.create_orders(options["orders"], options["products"])
+			queryset = Order.objects.for_owner(owner.id)
+			data = {"data": {"length": queryset.count(), "orders": OrderSerializer(list(queryset), many=True).data}}
+
+			self.stdout.write(f"{options['orders']} orders, {options['products']} ordered products each, best of {repeat}")
+			drf_render = self.time("JSONRenderer.render", lambda: JSONRenderer().render(data), repeat)
+			self.time("FastJSONRenderer.render", lambda: FastJSONRenderer().render(data), repeat, drf_render)
+
+			def stream():
+				streamed = {"data": {"length": data["data"]["length"], "orders": STREAMED_ARRAY}}
+				return b"".join(StreamingJSONResponse(streamed, data["data"]["orders"], lambda batch: batch))
+			self.time("StreamingJSONResponse (encoding only)", stream, repeat, drf_render)
+
+			body = JSONRenderer().render(data)
+			drf_parse = self.time("JSONParser.parse", lambda: JSONParser().parse(io.BytesIO(body)), repeat)
+			self.time("FastJSONParser.parse", lambda: FastJSONParser().parse(io.BytesIO(body)), repeat, drf_parse)
+			transaction.set_rollback(True)
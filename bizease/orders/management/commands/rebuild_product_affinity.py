@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from orders.models import ProductAffinity
+from bizease.transactions import run_in_transaction
+
+
+class Command(BaseCommand):
+	help = (
+		"Recounts the product affinity index (how many orders each pair of inventory items is in) from the ordered products. "
+		"It's kept up to date as orders are created and edited so this is only needed after changing orders outside the API"
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument("--owner", type=int, action="append", dest="owners", help="Id of a tenant to rebuild the index of. Can be repeated")
+
+	def handle(self, *args, **options):
+		run_in_transaction(ProductAffinity.objects.rebuild, options["owners"], name="product_affinity_rebuild")
+		affinities = ProductAffinity.objects.unscoped()
+		if options["owners"]:
+			affinities = affinities.filter(owner_id__in=options["owners"])
+		self.stdout.write(f"Rebuilt {affinities.count()} product pairs")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from orders.models import ProductSalesStats
+from bizease.transactions import run_in_transaction
+
+
+class Command(BaseCommand):
+	help = (
+		"Recomputes the product sales stats from the ordered products of delivered orders. They're kept up to date as orders "
+		"are delivered so this is only needed after changing orders or inventory items outside the API (e.g in the admin)"
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument("--owner", type=int, action="append", dest="owners", help="Id of a tenant to rebuild the stats of. Can be repeated")
+
+	def handle(self, *args, **options):
+		run_in_transaction(ProductSalesStats.objects.rebuild, options["owners"], name="product_sales_stats_rebuild")
+		stats = ProductSalesStats.objects.unscoped()
+		if options["owners"]:
+			stats = stats.filter(owner_id__in=options["owners"])
+		self.stdout.write(f"Rebuilt the stats of {stats.count()} products")
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-18 23:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0011_alter_inventory_date_added'),
+        ('orders', '0012_alter_orderedproduct_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderedproduct',
+            name='inventory_item',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ordered_products', to='inventory.inventory'),
+        ),
+    ]
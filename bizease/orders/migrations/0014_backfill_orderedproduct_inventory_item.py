@@ -0,0 +1,48 @@
+# Links existing ordered products to the inventory item they were ordered from
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def backfill_inventory_item(apps, schema_editor):
+    OrderedProduct = apps.get_model('orders', 'OrderedProduct')
+    Inventory = apps.get_model('inventory', 'Inventory')
+
+    last_id = 0
+    while True:
+        batch = list(
+            OrderedProduct.objects.filter(inventory_item__isnull=True, id__gt=last_id)
+            .select_related('order_id')
+            .order_by('id')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        last_id = batch[-1].id
+
+        owner_ids = {item.order_id.product_owner_id_id for item in batch}
+        names = {item.name for item in batch}
+        inventory_ids = {
+            (owner_id, product_name): item_id
+            for item_id, owner_id, product_name in Inventory.objects.filter(owner_id__in=owner_ids, product_name__in=names)
+            .values_list('id', 'owner_id', 'product_name')
+        }
+
+        linked = []
+        for item in batch:
+            inventory_id = inventory_ids.get((item.order_id.product_owner_id_id, item.name))
+            if inventory_id is not None:
+                item.inventory_item_id = inventory_id
+                linked.append(item)
+        OrderedProduct.objects.bulk_update(linked, ['inventory_item'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_orderedproduct_inventory_item'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_inventory_item, migrations.RunPython.noop),
+    ]
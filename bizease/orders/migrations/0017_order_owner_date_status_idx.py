@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 23:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0016_order_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['product_owner_id', 'order_date', 'status'], name='order_owner_date_status_idx'),
+        ),
+    ]
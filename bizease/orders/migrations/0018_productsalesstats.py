@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0013_lowstockalert'),
+        ('orders', '0017_order_owner_date_status_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSalesStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('units_sold', models.PositiveBigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('first_sold', models.DateField()),
+                ('last_sold', models.DateField()),
+                ('inventory_item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sales_stats', to='inventory.inventory')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-units_sold'],
+                'indexes': [models.Index(fields=['owner', '-units_sold'], name='sales_stats_units_idx'), models.Index(fields=['owner', '-revenue'], name='sales_stats_revenue_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('inventory_item__isnull', False)), fields=('owner', 'inventory_item'), name='unique_item_sales_stats'), models.UniqueConstraint(condition=models.Q(('inventory_item__isnull', True)), fields=('owner', 'name'), name='unique_name_sales_stats')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Computes the sales stats of the products of orders delivered before the stats were kept
+
+from django.db import migrations
+from django.db.models import F, Sum, Count, Min, Max, Case, When, Value
+
+BATCH_SIZE = 1000
+
+
+def backfill_product_sales_stats(apps, schema_editor):
+    OrderedProduct = apps.get_model('orders', 'OrderedProduct')
+    ProductSalesStats = apps.get_model('orders', 'ProductSalesStats')
+
+    totals = (
+        OrderedProduct.objects.filter(order_id__status='Delivered')
+        .annotate(
+            owner=F('order_id__product_owner_id'),
+            stats_name=Case(When(inventory_item__isnull=True, then='name'), default=Value('')),
+        )
+        .values('owner', 'inventory_item', 'stats_name')
+        .annotate(
+            units_sold=Sum('quantity'),
+            revenue=Sum('cummulative_price'),
+            order_count=Count('order_id', distinct=True),
+            first_sold=Min('order_id__order_date'),
+            last_sold=Max('order_id__order_date'),
+        )
+        .order_by('owner', 'inventory_item', 'stats_name')
+    )
+    ProductSalesStats.objects.bulk_create(
+        (
+            ProductSalesStats(
+                owner_id=row['owner'], inventory_item_id=row['inventory_item'], name=row['stats_name'],
+                units_sold=row['units_sold'], revenue=row['revenue'], order_count=row['order_count'],
+                first_sold=row['first_sold'], last_sold=row['last_sold'],
+            )
+            for row in totals.iterator()
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0018_productsalesstats'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_product_sales_stats, migrations.RunPython.noop),
+    ]
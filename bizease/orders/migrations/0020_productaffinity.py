@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0013_lowstockalert'),
+        ('orders', '0019_backfill_productsalesstats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductAffinity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('inventory_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='affinities', to='inventory.inventory')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('related_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inventory.inventory')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['inventory_item', '-order_count', 'related_item'], name='product_affinity_top_idx')],
+                'constraints': [models.UniqueConstraint(fields=('inventory_item', 'related_item'), name='unique_product_affinity')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Counts the product pairs of the orders created before the product affinity index was kept
+
+from django.db import migrations
+from django.db.models import F, Count
+
+BATCH_SIZE = 1000
+
+
+def backfill_product_affinity(apps, schema_editor):
+    OrderedProduct = apps.get_model('orders', 'OrderedProduct')
+    ProductAffinity = apps.get_model('orders', 'ProductAffinity')
+
+    pair_counts = (
+        OrderedProduct.objects.filter(inventory_item__isnull=False, order_id__ordered_products__inventory_item__isnull=False)
+        .annotate(owner=F('order_id__product_owner_id'), related_item=F('order_id__ordered_products__inventory_item'))
+        .values('owner', 'inventory_item', 'related_item')
+        .annotate(order_count=Count('order_id', distinct=True))
+        .order_by('owner', 'inventory_item', 'related_item')
+    )
+    ProductAffinity.objects.bulk_create(
+        (
+            ProductAffinity(
+                owner_id=row['owner'], inventory_item_id=row['inventory_item'], related_item_id=row['related_item'],
+                order_count=row['order_count'],
+            )
+            for row in pair_counts.iterator()
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0020_productaffinity'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_product_affinity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0021_backfill_productaffinity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderintake',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderintake',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
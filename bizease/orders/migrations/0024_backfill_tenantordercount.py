@@ -0,0 +1,28 @@
+# Counts the orders created before the tenants' order counts were kept with the product affinity index
+
+from django.db import migrations
+from django.db.models import Count
+
+BATCH_SIZE = 1000
+
+
+def backfill_tenant_order_count(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    TenantOrderCount = apps.get_model('orders', 'TenantOrderCount')
+
+    order_counts = Order.objects.values('product_owner_id').annotate(order_count=Count('id')).order_by('product_owner_id')
+    TenantOrderCount.objects.bulk_create(
+        (TenantOrderCount(owner_id=row['product_owner_id'], order_count=row['order_count']) for row in order_counts.iterator()),
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0023_tenantordercount'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_tenant_order_count, migrations.RunPython.noop),
+    ]
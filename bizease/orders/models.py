@@ -1,10 +1,71 @@
-from django.db import models, transaction
+from django.db import models, transaction, IntegrityError
 from accounts.models import CustomUser
-from django.db.models import Q
+from django.db.models import Q, F, Sum, Count, Min, Max, Case, When, Value, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Least, Greatest
 from inventory.models import Inventory
 from django.utils import timezone
-
-class Order(models.Model):
+from bizease.tenancy import TenantQuerySet
+from bizease.transactions import run_in_transaction, lock_rows
+from bizease.conditional import VersionedModel
+from itertools import groupby
+
+
+class OrderQuerySet(TenantQuerySet):
+	owner_field = "product_owner_id"
+	default_prefetch_related = ("ordered_products",)
+
+	def mark_delivered(self, delivery_date=None):
+		"""
+		Moves every Pending order in the queryset to Delivered with a single UPDATE statement and adds their sales to
+		the product sales stats
+		"""
+		if delivery_date is None:
+			delivery_date = timezone.now().date()
+		return run_in_transaction(self._mark_delivered, delivery_date, name="orders_mark_delivered")
+
+	def _mark_delivered(self, delivery_date):
+		# the orders are locked so an order delivered by a concurrent request isn't counted twice
+		order_ids = [order.id for order in lock_rows(self.filter(status="Pending").prefetch_related(None).only("id"))]
+		if not order_ids:
+			return 0
+		Order.objects.unscoped().filter(id__in=order_ids).update(status="Delivered", delivery_date=delivery_date, version=F("version") + 1)
+		ProductSalesStats.objects.add_delivered_orders(order_ids)
+		return len(order_ids)
+
+	def delete_and_restock(self):
+		"""
+		Deletes every Pending order in the queryset and returns the quantities of their ordered products to the inventory.
+		Stock is restored with one aggregated UPDATE per product instead of one per ordered product.
+		"""
+		return run_in_transaction(self._delete_and_restock, name="orders_delete_and_restock")
+
+	def _delete_and_restock(self):
+		# the orders are locked by the same query that filters them, so an order delivered by a concurrent request is
+		# never restocked and deleted. Orders are locked before inventory rows, the same order OrderedProduct.delete locks them in
+		order_ids = [order.id for order in lock_rows(self.filter(status="Pending").prefetch_related(None).only("id"))]
+		if not order_ids:
+			return 0
+
+		restock_rows = (
+			OrderedProduct.objects.unscoped().filter(order_id__in=order_ids, inventory_item__isnull=False) # items removed from the inventory have nothing to restock
+			.values("inventory_item")
+			.annotate(quantity=Sum("quantity"))
+			.order_by("inventory_item")
+		)
+		now = timezone.now()
+		for row in restock_rows:
+			Inventory.objects.unscoped().filter(pk=row["inventory_item"]).update(
+				stock_level=F("stock_level") + row["quantity"], last_updated=now, version=F("version") + 1
+			)
+
+		# the order ids come from this (scoped) queryset so the deletes below can't reach other tenants' rows
+		ProductAffinity.objects.remove_orders(order_ids)
+		OrderedProduct.objects.unscoped().filter(order_id__in=order_ids).delete()
+		Order.objects.unscoped().filter(id__in=order_ids).delete()
+		return len(order_ids)
+
+
+class Order(VersionedModel):
 	product_owner_id = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
 	client_name = models.CharField(max_length=150)
 	client_email = models.CharField(max_length=150, blank=True)
@@ -13,26 +74,46 @@ class Order(models.Model):
 	order_date = models.DateField()
 	delivery_date = models.DateField(null=True)
 	total_price = models.DecimalField(max_digits=14, decimal_places=2, null=True)
-	ordered_products_objects = []
+	objects = OrderQuerySet.as_manager()
 
 	class Meta:
 		ordering = ["-order_date"]
 		constraints = [
 			models.CheckConstraint(condition=Q(total_price__gt=0), name="total_price_gt_zero")
 		]
+		indexes = [
+			# date range (and status) filters of a tenant's orders are index range scans
+			models.Index(fields=["product_owner_id", "order_date", "status"], name="order_owner_date_status_idx")
+		]
 
 	def __str__(self):
 		return f"{self.client_name} - {self.id}"
 
-	@transaction.atomic
-	def save_order_to_db(self, products_err_dict, **kwargs):
+	def delete(self, **kwargs):
+		""" Deletes the order and uncounts it from the product affinity index """
+		pk = self.pk
+
+		def attempt():
+			self.pk = pk
+			ProductAffinity.objects.remove_orders([pk])
+			return super(Order, self).delete(**kwargs)
+
+		return run_in_transaction(attempt, name="order_delete")
+
+	def lock_inventory_products(self, ordered_products):
+		""" Locks the inventory items of the products being ordered up front and in order of their ids """
+		product_names = {product.name.title() for product in ordered_products}
+		if product_names:
+			lock_rows(Inventory.objects.for_owner(self.product_owner_id).filter(product_name__in=product_names))
+
+	def save_order_to_db(self, ordered_products, products_err_dict, **kwargs):
 		super().save(**kwargs) # Allows the model instance to get a db generated id that's required when saving ordered products that have a foreign key to it
 
-		if len(self.ordered_products_objects) > 0: # new order
+		if len(ordered_products) > 0: # new order
 			self.total_price = 0
 			
 		non_unique_order_err = "Ordered products must be unique. Use the quantity field to specify multiple orders of same item."
-		for product in self.ordered_products_objects:
+		for product in ordered_products:
 			product.name = product.name.title()
 			if products_err_dict.get(product.name) == None:
 				products_err_dict[product.name] = []
@@ -55,12 +136,16 @@ class Order(models.Model):
 		if products_err_dict:
 			raise ValueError("Ordered item has one or more invalid attributes")
 
-	@transaction.atomic
 	def update_total_price(self, **kwargs):
 		super().save(update_fields=['total_price'], **kwargs)
 
-	def save(self, **kwargs):
-		ordered_products = self.ordered_products_objects # An array of OrderedProducts instance whose data haven't been saved to the db
+	def save(self, ordered_products=None, **kwargs):
+		"""
+		'ordered_products' is a list of OrderedProduct instances whose data haven't been saved to the db. It's required
+		when saving a new order and is usually passed in by an OrderBuilder.
+		"""
+		if ordered_products is None:
+			ordered_products = []
 
 		actual_status_val = self.status
 		self.status = self.status.title()
@@ -76,9 +161,32 @@ class Order(models.Model):
 		if (not self.id and ((type(ordered_products) != list) or not ordered_products)):
 			raise ValueError('An Order must have at least one ordered product', "custom")
 
+		new_order = self._state.adding
+		new_products = [product for product in ordered_products if product.id is None]
+		version = self.version
+
+		def attempt():
+			if new_order: # a failed attempt may have left db generated ids that were rolled back on the instances
+				self.pk, self._state.adding = None, True
+			for product in new_products:
+				product.pk, product._state.adding = None, True
+			self.version = version
+			products_err_dict.clear()
+
+			# read in the transaction. A concurrent delivery of the order bumps its version so the save below fails if it's stale
+			was_delivered = not new_order and Order.objects.unscoped().filter(pk=self.pk, status="Delivered").exists()
+			self.lock_inventory_products(ordered_products)
+			self.save_order_to_db(ordered_products, products_err_dict, **kwargs)
+			if ordered_products:
+				self.update_total_price()
+			if self.status == "Delivered" and not was_delivered:
+				ProductSalesStats.objects.add_delivered_orders([self.pk])
+			if new_order:
+				ProductAffinity.objects.add_order(self, ordered_products)
+
 		products_err_dict = {}
 		try:
-			self.save_order_to_db(products_err_dict, **kwargs)
+			run_in_transaction(attempt, name="order_save")
 		except ValueError as val_err:
 			# The error checked below might have been raised from the function in 
 			# the try block intentionally to rollback current transaction
@@ -90,17 +198,50 @@ class Order(models.Model):
 		if products_err_dict:
 			return products_err_dict
 
-		self.ordered_products_objects = []
-		self.update_total_price()
+
+class OrderBuilder:
+	"""
+	Collects the ordered products of a new Order and saves them together with it. The ordered products are owned
+	by the builder, so orders built at the same time (e.g by different request threads) never share line items.
+	"""
+
+	def __init__(self, order, ordered_products=None):
+		self.order = order
+		self.ordered_products = list(ordered_products) if ordered_products else []
+
+	def add_product(self, ordered_product):
+		self.ordered_products.append(ordered_product)
+		return self
+
+	def save(self, **kwargs):
+		""" Returns the same errors Order.save does """
+		return self.order.save(ordered_products=self.ordered_products, **kwargs)
+
+
+class OrderedProductQuerySet(TenantQuerySet):
+	owner_field = "order_id__product_owner_id"
+
+	def group_by_product(self):
+		"""
+		Groups ordered products by the inventory item they were sold from so sales are still attributed correctly after
+		the item is renamed. Ordered products whose inventory item no longer exists are grouped by their own name.
+		"""
+		return (
+			self.annotate(product_name=Coalesce("inventory_item__product_name", "name"))
+			.values("inventory_item", "product_name")
+		)
 
 
 class OrderedProduct(models.Model):
 	name = models.CharField(max_length=100)
 	order_id = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="ordered_products")
+	inventory_item = models.ForeignKey(Inventory, on_delete=models.SET_NULL, null=True, blank=True, related_name="ordered_products")
 	quantity = models.PositiveIntegerField()
 	price = models.DecimalField(default=0, max_digits=14, decimal_places=2)
 	cummulative_price = models.DecimalField(max_digits=14, decimal_places=2)
 
+	objects = OrderedProductQuerySet.as_manager()
+
 	class Meta:
 		ordering = ["id"]
 		constraints = [
@@ -135,12 +276,7 @@ class OrderedProduct(models.Model):
 		if (currentDbInstance.cummulative_price != self.cummulative_price):
 			return ["Only 'quantity' field can be updated"]
 
-	def update(self, inventory_product):
-		currentDbInstance = OrderedProduct.objects.get(pk=self.id)
-		errors = self.assert_only_quantity_is_updated(currentDbInstance)
-		if errors:
-			return errors
-
+	def update(self, inventory_product, currentDbInstance):
 		prev_quantity = currentDbInstance.quantity
 		if self.quantity > (inventory_product.stock_level + prev_quantity):
 			return [f"Not enough products in stock to satisfy order for '{self.name}'"]
@@ -150,42 +286,93 @@ class OrderedProduct(models.Model):
 		order_obj = self.order_id
 		order_obj.total_price = order_obj.total_price - (prev_quantity * self.price) + self.cummulative_price
 
-	@transaction.atomic
+	def get_inventory_product(self, product_owner_id):
+		""" Fetches (and locks) the inventory item of the ordered product. Must be called in a transaction """
+		inventory_items = Inventory.objects.for_owner(product_owner_id).select_for_update()
+		if self.inventory_item_id is not None:
+			return inventory_items.get(pk=self.inventory_item_id)
+		# ordered products that have not been linked to an inventory item yet (i.e new ones) are resolved by name
+		return inventory_items.filter(product_name=self.name).get()
+
 	def save(self, *, new_order=True, **kwargs):
+		"""
+		Returns a list of errors if the ordered product couldn't be saved. 'new_order' is False when the product is added to
+		(or updated in) an existing order, in which case the order's total price is updated as well. The order is updated
+		only if it hasn't changed since it was read, otherwise VersionConflict is raised.
+		"""
+		adding = self._state.adding
+		order_state = None if new_order else (self.order_id.total_price, self.order_id.version)
+
+		def attempt():
+			if adding:
+				self.pk, self._state.adding = None, True
+			if order_state:
+				self.order_id.total_price, self.order_id.version = order_state
+			return self.save_to_db(new_order, **kwargs)
+
+		return run_in_transaction(attempt, name="ordered_product_save")
+
+	def save_to_db(self, new_order, **kwargs):
 		try:
 			if type(self.order_id) == int:
-				self.order_id = Order.objects.get(pk=self.order_id)
+				self.order_id = Order.objects.unscoped().get(pk=self.order_id)
 
 			product_owner_id = self.order_id.product_owner_id
-			inventory_product = Inventory.objects.filter(owner_id=product_owner_id).filter(product_name=self.name).get()
+			if not new_order:
+				# the order is locked before the inventory row, the same order delete_from_db and bulk deletes lock them in
+				Order.objects.for_owner(product_owner_id).select_for_update().prefetch_related(None).only("id").get(pk=self.order_id.id)
+			inventory_product = self.get_inventory_product(product_owner_id)
 		except (Inventory.DoesNotExist, Inventory.MultipleObjectsReturned):
 			return [f"'{self.name}' doesn't exist in the Inventory."]
 		except (Order.DoesNotExist, Order.MultipleObjectsReturned):
 			return [f"'{self.name}' Order doesn't exist."]
+		if self.id != None:
+			# checked before validating against the inventory item because the item is resolved through
+			# inventory_item and not through the (possibly edited) name
+			currentDbInstance = OrderedProduct.objects.for_owner(product_owner_id).get(pk=self.id)
+			errors = self.assert_only_quantity_is_updated(currentDbInstance)
+			if errors:
+				return errors
+
 		errors = self.validate_data(inventory_product)
 		if errors:
 			return errors
 
 		if self.id == None:
+			self.inventory_item = inventory_product
 			self.create(inventory_product)
 		else:
-			update_errors = self.update(inventory_product)
+			update_errors = self.update(inventory_product, currentDbInstance)
 			if update_errors:
 				return update_errors
 
+		adding = self._state.adding
 		inventory_product.save()
 		super().save(**kwargs)
 		if new_order == False: # this is an existing Order
+			if adding:
+				order_item_ids = self.order_id.ordered_products.values_list("inventory_item", flat=True)
+				ProductAffinity.objects.record(product_owner_id.id, order_item_ids, [inventory_product.id], 1)
 			 # Updating the quantity of any of the ordered product of an order
 			 # means the total_price will also increase
 			self.order_id.update_total_price()
+			if self.order_id.status == "Delivered":
+				ProductSalesStats.objects.refresh(product_owner_id, inventory_item_ids=[inventory_product.id])
 
-	@transaction.atomic
 	def delete(self, **kwargs):
+		pk = self.pk
+
+		def attempt():
+			self.pk = pk
+			return self.delete_from_db(**kwargs)
+
+		return run_in_transaction(attempt, name="ordered_product_delete")
+
+	def delete_from_db(self, **kwargs):
 		item_in_stock = True
 		try:
-			order_obj = Order.objects.get(pk=self.order_id.id)
-			inventory_product = Inventory.objects.filter(owner_id=order_obj.product_owner_id).filter(product_name=self.name).get()
+			order_obj = Order.objects.for_owner(self.order_id.product_owner_id_id).select_for_update().get(pk=self.order_id.id)
+			inventory_product = self.get_inventory_product(order_obj.product_owner_id)
 		except (Order.DoesNotExist, Order.MultipleObjectsReturned):
 			raise ValueError("Unexpected Error! ordered item to delete has no Order")
 		except (Inventory.DoesNotExist, Inventory.MultipleObjectsReturned):
@@ -200,7 +387,322 @@ class OrderedProduct(models.Model):
 			inventory_product.stock_level += self.quantity
 			inventory_product.save()
 
-		super().delete(**kwargs)
+		order_item_ids = order_obj.ordered_products.values_list("inventory_item", flat=True)
+		ProductAffinity.objects.record(order_obj.product_owner_id_id, order_item_ids, [self.inventory_item_id], -1)
+		deleted = super().delete(**kwargs)
+		if order_obj.status == "Delivered":
+			ProductSalesStats.objects.refresh(order_obj.product_owner_id, **ProductSalesStats.product_key(self.inventory_item_id, self.name))
+		return deleted
+
+	def __str__(self):
+		return f"{self.name}({self.quantity})"
+
+
+class ProductSalesStatsQuerySet(TenantQuerySet):
+	def with_product_name(self):
+		""" Names the products the same way OrderedProductQuerySet.group_by_product does """
+		return self.annotate(product_name=Coalesce("inventory_item__product_name", "name"))
+
+	def add_delivered_orders(self, order_ids):
+		"""
+		Adds the sales of newly delivered orders to the stats of their products. Must be called in the transaction that
+		delivers the orders. Each product's stats row is updated in place, with its totals incremented by the database,
+		so concurrent deliveries of the same product don't lose updates.
+		"""
+		totals = ProductSalesStats.sales_totals(OrderedProduct.objects.unscoped().filter(order_id__in=order_ids))
+		for row in totals: # in the same order in every transaction so concurrent deliveries lock stats rows in the same order
+			key = {"owner_id": row["owner"], **ProductSalesStats.product_key(row["inventory_item"], row["stats_name"], lookup=False)}
+			increments = {
+				"units_sold": F("units_sold") + row["units_sold"],
+				"revenue": F("revenue") + row["revenue"],
+				"order_count": F("order_count") + row["order_count"],
+				"first_sold": Least("first_sold", Value(row["first_sold"])),
+				"last_sold": Greatest("last_sold", Value(row["last_sold"])),
+			}
+			if self.unscoped().filter(**key).update(**increments):
+				continue
+			try:
+				with transaction.atomic(): # a savepoint so a failed insert doesn't break the outer transaction
+					self.create(**key, **{field: row[field] for field in ProductSalesStats.TOTALS})
+			except IntegrityError: # a concurrent delivery created the row first
+				self.unscoped().filter(**key).update(**increments)
+
+	def refresh(self, owner_id, inventory_item_ids=(), names=()):
+		"""
+		Recomputes the stats of some of an owner's products (products still in the inventory by id, others by name) from
+		their delivered ordered products. Used when the ordered products of delivered orders are edited
+		"""
+		delivered = OrderedProduct.objects.for_owner(owner_id).filter(order_id__status="Delivered")
+		products = Q(inventory_item__in=inventory_item_ids) | Q(inventory_item__isnull=True, name__in=names)
+		self.for_owner(owner_id).filter(products).delete()
+		self.bulk_create(ProductSalesStats.from_totals(ProductSalesStats.sales_totals(delivered.filter(products))))
+
+	def rebuild(self, owner_ids=None, batch_size=1000):
+		""" Recomputes the stats of every product (of the given owners) from scratch """
+		delivered = OrderedProduct.objects.unscoped().filter(order_id__status="Delivered")
+		stats = self.unscoped()
+		if owner_ids is not None:
+			delivered = delivered.filter(order_id__product_owner_id__in=owner_ids)
+			stats = stats.filter(owner_id__in=owner_ids)
+		stats.delete()
+		self.bulk_create(ProductSalesStats.from_totals(ProductSalesStats.sales_totals(delivered).iterator()), batch_size=batch_size)
+
+
+class ProductSalesStats(models.Model):
+	"""
+	The all time sales of a product (delivered orders only), kept up to date as orders are delivered so top selling
+	product and per product sales queries read at most one row per product instead of aggregating every ordered product.
+	Products are keyed the same way OrderedProductQuerySet.group_by_product groups ordered products: by inventory item,
+	or by name for the products of ordered products whose inventory item no longer exists.
+	"""
+	TOTALS = ("units_sold", "revenue", "order_count", "first_sold", "last_sold")
+
+	owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+	inventory_item = models.ForeignKey(Inventory, on_delete=models.CASCADE, null=True, blank=True, related_name="sales_stats")
+	name = models.CharField(max_length=100, blank=True) # only set when there's no inventory item
+	units_sold = models.PositiveBigIntegerField(default=0)
+	revenue = models.DecimalField(default=0, max_digits=16, decimal_places=2)
+	order_count = models.PositiveIntegerField(default=0)
+	first_sold = models.DateField()
+	last_sold = models.DateField()
+
+	objects = ProductSalesStatsQuerySet.as_manager()
+
+	class Meta:
+		ordering = ["-units_sold"]
+		constraints = [
+			models.UniqueConstraint(
+				fields=["owner", "inventory_item"], condition=Q(inventory_item__isnull=False), name="unique_item_sales_stats"
+			),
+			models.UniqueConstraint(fields=["owner", "name"], condition=Q(inventory_item__isnull=True), name="unique_name_sales_stats"),
+		]
+		indexes = [
+			# top N products by units sold or by revenue are index scans
+			models.Index(fields=["owner", "-units_sold"], name="sales_stats_units_idx"),
+			models.Index(fields=["owner", "-revenue"], name="sales_stats_revenue_idx"),
+		]
+
+	@staticmethod
+	def product_key(inventory_item_id, name, lookup=True):
+		""" The product an ordered product is counted under, as refresh() arguments or (lookup=False) as field values """
+		if lookup:
+			return {"inventory_item_ids": [inventory_item_id]} if inventory_item_id is not None else {"names": [name]}
+		return {"inventory_item_id": inventory_item_id, "name": "" if inventory_item_id is not None else name}
+
+	@staticmethod
+	def sales_totals(ordered_products):
+		""" The sales totals of 'ordered_products' per owner and product """
+		return (
+			ordered_products
+			.annotate(
+				owner=F("order_id__product_owner_id"),
+				stats_name=Case(When(inventory_item__isnull=True, then="name"), default=Value("")),
+			)
+			.values("owner", "inventory_item", "stats_name")
+			.annotate(
+				units_sold=Sum("quantity"),
+				revenue=Sum("cummulative_price"),
+				order_count=Count("order_id", distinct=True),
+				first_sold=Min("order_id__order_date"),
+				last_sold=Max("order_id__order_date"),
+			)
+			.order_by("owner", "inventory_item", "stats_name")
+		)
+
+	@staticmethod
+	def from_totals(totals):
+		return (
+			ProductSalesStats(
+				owner_id=row["owner"], **ProductSalesStats.product_key(row["inventory_item"], row["stats_name"], lookup=False),
+				**{field: row[field] for field in ProductSalesStats.TOTALS}
+			)
+			for row in totals
+		)
+
+	def __str__(self):
+		return f"{self.inventory_item_id or self.name} - {self.units_sold} sold"
+
+
+class ProductAffinityQuerySet(TenantQuerySet):
+	def record(self, owner_id, item_ids, changed_item_ids, delta):
+		"""
+		Counts (delta=1) or uncounts (delta=-1) one order in the pairs of its products' inventory items 'item_ids' that
+		involve the items 'changed_item_ids', i.e the items added to or removed from the order. The pair of a changed item
+		with itself counts the orders the item is in. Must be called in the transaction that changes the order
+		"""
+		item_ids = sorted(set(item_ids) - {None})
+		changed_item_ids = sorted(set(changed_item_ids) - {None})
+		if not changed_item_ids:
+			return
+		pairs = self.unscoped().filter(
+			Q(inventory_item__in=changed_item_ids, related_item__in=item_ids) | Q(inventory_item__in=item_ids, related_item__in=changed_item_ids)
+		)
+		if delta > 0:
+			# missing pairs are created with a count of 0 and then incremented with the others, so concurrent orders of the
+			# same products never overwrite each other's counts
+			changed = set(changed_item_ids)
+			self.bulk_create(
+				[
+					ProductAffinity(owner_id=owner_id, inventory_item_id=item_id, related_item_id=related_id, order_count=0)
+					for item_id in item_ids for related_id in item_ids if item_id in changed or related_id in changed
+				],
+				ignore_conflicts=True
+			)
+			pairs.update(order_count=F("order_count") + delta)
+		else:
+			pairs.filter(order_count__gte=-delta).update(order_count=F("order_count") + delta)
+			pairs.filter(order_count__lte=0).delete()
+
+	def count_orders(self, owner_id, delta):
+		""" Adds 'delta' to the tenant's TenantOrderCount. Must be called in the transaction that creates or deletes the orders """
+		order_count = TenantOrderCount.objects.unscoped().filter(owner_id=owner_id)
+		if delta > 0:
+			TenantOrderCount.objects.bulk_create([TenantOrderCount(owner_id=owner_id, order_count=0)], ignore_conflicts=True)
+			order_count.update(order_count=F("order_count") + delta)
+		else:
+			order_count.filter(order_count__gte=-delta).update(order_count=F("order_count") + delta)
+
+	def add_order(self, order, ordered_products):
+		item_ids = [product.inventory_item_id for product in ordered_products]
+		self.record(order.product_owner_id_id, item_ids, item_ids, 1)
+		self.count_orders(order.product_owner_id_id, 1)
+
+	def remove_orders(self, order_ids):
+		""" Uncounts the orders before they're deleted """
+		order_counts = (
+			Order.objects.unscoped().filter(id__in=order_ids).values("product_owner_id")
+			.annotate(orders=Count("id")).order_by("product_owner_id")
+		)
+		for row in order_counts:
+			self.count_orders(row["product_owner_id"], -row["orders"])
+		rows = (
+			OrderedProduct.objects.unscoped().filter(order_id__in=order_ids, inventory_item__isnull=False)
+			.order_by("order_id").values_list("order_id", "order_id__product_owner_id", "inventory_item")
+		)
+		for (_, owner_id), order_rows in groupby(rows, key=lambda row: row[:2]):
+			item_ids = [item_id for _, _, item_id in order_rows]
+			self.record(owner_id, item_ids, item_ids, -1)
+
+	def related(self, inventory_item_id, limit):
+		"""
+		(item id, name, orders with the item, orders of its own) of the 'limit' items most often ordered with an item. It's
+		the first entries of the item's range of product_affinity_top_idx and one unique index lookup per entry
+		"""
+		related_orders = ProductAffinity.objects.unscoped().filter(inventory_item=OuterRef("related_item"), related_item=OuterRef("related_item"))
+		return (
+			self.filter(inventory_item=inventory_item_id).exclude(related_item=inventory_item_id)
+			.order_by("-order_count", "related_item")
+			.annotate(related_name=F("related_item__product_name"), related_orders=Subquery(related_orders.values("order_count")[:1]))
+			.values_list("related_item", "related_name", "order_count", "related_orders")[:limit]
+		)
+
+	def rebuild(self, owner_ids=None, batch_size=1000):
+		""" Recounts the pairs and the order counts of every order (of the given owners) from scratch """
+		ordered_products = OrderedProduct.objects.unscoped().filter(inventory_item__isnull=False, order_id__ordered_products__inventory_item__isnull=False)
+		orders = Order.objects.unscoped()
+		affinities = self.unscoped()
+		order_counts = TenantOrderCount.objects.unscoped()
+		if owner_ids is not None:
+			ordered_products = ordered_products.filter(order_id__product_owner_id__in=owner_ids)
+			orders = orders.filter(product_owner_id__in=owner_ids)
+			affinities = affinities.filter(owner_id__in=owner_ids)
+			order_counts = order_counts.filter(owner_id__in=owner_ids)
+		affinities.delete()
+		order_counts.delete()
+		self.bulk_create(ProductAffinity.from_pair_counts(ProductAffinity.pair_counts(ordered_products).iterator()), batch_size=batch_size)
+		TenantOrderCount.objects.bulk_create(
+			[
+				TenantOrderCount(owner_id=row["product_owner_id"], order_count=row["orders"])
+				for row in orders.values("product_owner_id").annotate(orders=Count("id")).order_by("product_owner_id")
+			],
+			batch_size=batch_size
+		)
+
+
+class ProductAffinity(models.Model):
+	"""
+	The number of a tenant's orders that contain both of two inventory items, the index behind "frequently bought
+	together" suggestions. Pairs are counted as orders are created and edited (see ProductAffinityQuerySet.record) and
+	only pairs that were ordered together have a row. Each pair is stored in both directions so the items most often
+	bought with an item are the first rows of an index range scan, and the row of an item with itself counts the orders
+	it's in, which the lift of its pairs is computed from.
+	"""
+	owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+	inventory_item = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name="affinities")
+	related_item = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name="+")
+	order_count = models.PositiveIntegerField(default=0)
+
+	objects = ProductAffinityQuerySet.as_manager()
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=["inventory_item", "related_item"], name="unique_product_affinity")
+		]
+		indexes = [
+			# the top K items bought with an item are the first K entries of the item's range
+			models.Index(fields=["inventory_item", "-order_count", "related_item"], name="product_affinity_top_idx")
+		]
+
+	@staticmethod
+	def pair_counts(ordered_products):
+		""" The number of orders of 'ordered_products' each pair of inventory items is in, including an item with itself """
+		return (
+			ordered_products
+			.annotate(owner=F("order_id__product_owner_id"), related_item=F("order_id__ordered_products__inventory_item"))
+			.values("owner", "inventory_item", "related_item")
+			.annotate(order_count=Count("order_id", distinct=True))
+			.order_by("owner", "inventory_item", "related_item")
+		)
+
+	@staticmethod
+	def from_pair_counts(pair_counts):
+		return (
+			ProductAffinity(
+				owner_id=row["owner"], inventory_item_id=row["inventory_item"], related_item_id=row["related_item"], order_count=row["order_count"]
+			)
+			for row in pair_counts
+		)
+
+	def __str__(self):
+		return f"{self.inventory_item_id} and {self.related_item_id} - {self.order_count} orders"
+
+
+class TenantOrderCount(models.Model):
+	"""
+	The number of a tenant's orders, kept with the product affinity index (see ProductAffinityQuerySet.count_orders) so
+	the lift of a pair is computed without counting the tenant's orders
+	"""
+	owner = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True)
+	order_count = models.PositiveIntegerField(default=0)
+
+	objects = TenantQuerySet.as_manager()
+
+	def __str__(self):
+		return f"{self.owner_id} - {self.order_count} orders"
+
+
+class OrderIntake(models.Model):
+	""" An order payload accepted during asynchronous intake that is yet to be (or has been) applied to the db by a worker """
+	owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+	payload = models.JSONField()
+	status = models.CharField(
+		choices={"Queued": "Queued", "Processing": "Processing", "Applied": "Applied", "Failed": "Failed"}, default="Queued"
+	)
+	order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True)
+	errors = models.JSONField(null=True, blank=True)
+	# the worker applying a 'Processing' intake and when it claimed it (see orders.intake)
+	claimed_by = models.CharField(max_length=100, blank=True)
+	claimed_at = models.DateTimeField(null=True, blank=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+	processed_at = models.DateTimeField(null=True, blank=True)
+
+	objects = TenantQuerySet.as_manager()
+
+	class Meta:
+		ordering = ["id"]
+		indexes = [
+			models.Index(fields=["status", "owner", "id"], name="order_intake_queue_idx")
+		]
 
 	def __str__(self):
-		return f"{self.name}({self.quantity})"
\ No newline at end of file
+		return f"Order intake {self.id} - {self.status}"
@@ -1,10 +1,12 @@
 from rest_framework import serializers
-from .models import Order, OrderedProduct
+from .models import Order, OrderedProduct, OrderBuilder
 from inventory.models import Inventory
 from datetime import datetime
 from django.db.utils import IntegrityError
 from decimal import Decimal
 from django.utils import timezone
+from bizease.conditional import VersionConflict
+from bizease.serializers import DynamicFieldsMixin
 
 def validate_decimal(value):
 	if type(value) != int and type(value) != float and type(value) != Decimal:
@@ -59,7 +61,7 @@ class OrderedProductSerializer(serializers.ModelSerializer):
 			return self.create(order)
 		return super().save()
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
 	class Meta:
 		model = Order
 		fields = [
@@ -82,13 +84,13 @@ class OrderSerializer(serializers.ModelSerializer):
 
 		new_order = Order(**self.validated_data)
 		new_order.product_owner_id = product_owner
-		new_order.ordered_products_objects = []
+		order_builder = OrderBuilder(new_order)
 
 		for item in ordered_products:
-			new_order.ordered_products_objects.append(OrderedProduct(**item))
+			order_builder.add_product(OrderedProduct(**item))
 
 		try:
-			errors = new_order.save()
+			errors = order_builder.save()
 		except ValueError as err:
 			if (err.args[1] == "custom"):
 				return {"errors": {"ordered_products": err.args[0]}}
@@ -117,6 +119,8 @@ class OrderSerializer(serializers.ModelSerializer):
 
 		try:
 			errors = self.instance.save()
+		except VersionConflict:
+			raise
 		except:
 			return {"errors": "Fatal error"}
 			
@@ -130,3 +134,39 @@ class OrderSerializer(serializers.ModelSerializer):
 			return self.update(product_owner)
 		else:
 			return self.create(product_owner)
+
+
+class BulkOrderFilterSerializer(serializers.Serializer):
+	status = serializers.ChoiceField(choices=["Pending", "Delivered"], required=False)
+	order_date_from = serializers.DateField(required=False)
+	order_date_to = serializers.DateField(required=False)
+
+
+class BulkOrderSelectionSerializer(serializers.Serializer):
+	""" Selects the orders a bulk operation applies to, either by their ids or by a filter """
+	max_ids = 1000
+
+	ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False, max_length=max_ids)
+	filter = BulkOrderFilterSerializer(required=False)
+
+	def validate(self, data):
+		if ("ids" in data) == ("filter" in data):
+			raise serializers.ValidationError("Exactly one of 'ids' or 'filter' must be provided")
+		return data
+
+	def filter_queryset(self, queryset):
+		if "ids" in self.validated_data:
+			return queryset.filter(id__in=self.validated_data["ids"])
+
+		order_filter = self.validated_data["filter"]
+		if order_filter.get("status"):
+			queryset = queryset.filter(status=order_filter["status"])
+		if order_filter.get("order_date_from"):
+			queryset = queryset.filter(order_date__gte=order_filter["order_date_from"])
+		if order_filter.get("order_date_to"):
+			queryset = queryset.filter(order_date__lte=order_filter["order_date_to"])
+		return queryset
+
+
+class BulkOrderStatusSerializer(BulkOrderSelectionSerializer):
+	status = serializers.ChoiceField(choices=["Delivered"]) # Delivered orders can't be edited so Pending -> Delivered is the only valid transition
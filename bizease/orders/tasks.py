@@ -0,0 +1,15 @@
+from jobs.queue import task
+from .intake import process_tenant_intakes, requeue_stale_intakes, tenants_with_queued_intakes, queue_intake_processing
+
+
+@task(name="orders.process_tenant_intakes", priority=10)
+def process_tenant_intakes_task(owner_id):
+	process_tenant_intakes(owner_id)
+
+
+@task(name="orders.requeue_stale_intakes", max_attempts=1)
+def requeue_stale_intakes_task():
+	# every tenant with queued intakes gets a job, the jobs of requeued intakes have already run
+	if requeue_stale_intakes():
+		for owner_id in tenants_with_queued_intakes():
+			queue_intake_processing(owner_id)
@@ -1,8 +1,19 @@
-from django.test import TestCase
-from orders.models import Order, OrderedProduct
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.db import connection, transaction, OperationalError
+import random
+import threading
+from unittest import mock
+from bizease import metrics
+from bizease.transactions import run_in_transaction
+from bizease.conditional import VersionConflict
+from orders import models
+from orders.models import Order, OrderedProduct, OrderBuilder, ProductSalesStats, ProductAffinity, TenantOrderCount
+from inventory.views import InventoryItemView
 from accounts.models import CustomUser
 from inventory.models import Inventory
 from django.db.utils import IntegrityError
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
 from datetime import date
 
 
@@ -16,14 +27,12 @@ class OrderModelTest(TestCase):
 
 		cls.order = Order(product_owner_id=cls.test_user, client_name="naive client", client_email="n_client@gmail.com", client_phone="09012367903", order_date="2025-07-20")
 		cls.item = OrderedProduct(name="Sneakers", quantity=2, price=25000)
-		cls.order.ordered_products_objects = [cls.item]
-		cls.order.save()
+		OrderBuilder(cls.order, [cls.item]).save()
 
 		cls.order_1 = Order(product_owner_id=cls.test_user, client_name="person", client_email="person@gmail.com", client_phone="09012367903", order_date="2025-07-20")
 		cls.item_1 = OrderedProduct(name="Satchet Water", quantity=20, price=30)
 		cls.item_2 = OrderedProduct(name="A3 Paper", quantity=2, price=50)
-		cls.order_1.ordered_products_objects = [cls.item_1, cls.item_2]
-		cls.order_1.save()
+		OrderBuilder(cls.order_1, [cls.item_1, cls.item_2]).save()
 		# test max_length is enforced
 
 	def test_save_new_order_instance(self):
@@ -31,8 +40,7 @@ class OrderModelTest(TestCase):
 		self.assertRaises(ValueError, order_1.save)
 		ordered_product_1 = OrderedProduct(name="Satchet Water", quantity=4, price=30)
 		ordered_product_2 = OrderedProduct(name="A3 Paper", quantity=4, price=50)
-		order_1.ordered_products_objects = [ordered_product_1, ordered_product_2]
-		order_1.save()
+		OrderBuilder(order_1, [ordered_product_1, ordered_product_2]).save()
 		order_1 = Order.objects.get(pk=order_1.id)
 		self.assertEqual(order_1.client_name, "customer1")
 		self.assertEqual(order_1.client_email, "customer1@gmail.com")
@@ -49,13 +57,13 @@ class OrderModelTest(TestCase):
 	def test_save_new_order_with_invalid_ordered_item(self):
 		order = Order(product_owner_id=self.test_user, client_name="customer1", client_email="customer1@gmail.com", client_phone="08149672890", order_date="2025-07-20")
 		ordered_product = OrderedProduct(name="Invalid item", quantity=4, price=30)
-		order.ordered_products_objects = [ordered_product]
-		self.assertEqual(order.save(), {"Invalid Item": ["'Invalid Item' doesn't exist in the Inventory."]})
+		order_builder = OrderBuilder(order, [ordered_product])
+		self.assertEqual(order_builder.save(), {"Invalid Item": ["'Invalid Item' doesn't exist in the Inventory."]})
 
 		order = Order(product_owner_id=self.test_user, client_name="customer1", client_email="customer1@gmail.com", client_phone="08149672890", order_date="2025-07-20")
 		ordered_product = OrderedProduct(name="Satchet Water", quantity=501, price=20)
-		order.ordered_products_objects = [ordered_product]
-		self.assertEqual(order.save(), {
+		order_builder = OrderBuilder(order, [ordered_product])
+		self.assertEqual(order_builder.save(), {
 			"Satchet Water": [
 				"Not enough products in stock to satisfy order for 'Satchet Water'",
 				"Price isn't the same as that of inventory item for 'Satchet Water'"
@@ -64,8 +72,7 @@ class OrderModelTest(TestCase):
 
 	def test_add_new_valid_product_to_order(self):
 		order = Order(product_owner_id=self.test_user, client_name="customer3", client_email="customer3@gmail.com", client_phone="07146372890", order_date="2025-07-20")
-		order.ordered_products_objects = [OrderedProduct(name="Sneakers", quantity=2, price=25000)]
-		order.save()
+		OrderBuilder(order, [OrderedProduct(name="Sneakers", quantity=2, price=25000)]).save()
 		self.assertEqual(Order.objects.get(pk=order.id).total_price, 50000)
 
 		new_ordered_product = OrderedProduct(name="A3 Paper", quantity=5, price=50, order_id=order)
@@ -78,8 +85,7 @@ class OrderModelTest(TestCase):
 	def test_add_constraint_violating_product_to_order(self):
 		order = Order(product_owner_id=self.test_user, client_name="customer2", client_email="customer2@gmail.com", client_phone="08146272890", order_date="2025-07-20")
 		ordered_product_1 = OrderedProduct(name="Satchet Water", quantity=5, price=30)
-		order.ordered_products_objects = [ordered_product_1]
-		order.save()
+		OrderBuilder(order, [ordered_product_1]).save()
 		ordered_product_2 = OrderedProduct(name="Satchet Water", order_id=order, quantity=1, price=30)
 		self.assertRaises(IntegrityError, ordered_product_2.save)
 
@@ -96,8 +102,7 @@ class OrderedProductModelTest(TestCase):
 
 		cls.test_order = Order(product_owner_id=cls.test_user, client_name="melon-client", order_date="2025-06-15")
 		cls.item = OrderedProduct(name="Water Melon", quantity=2, price=1500)
-		cls.test_order.ordered_products_objects = [cls.item]
-		cls.test_order.save()
+		OrderBuilder(cls.test_order, [cls.item]).save()
 
 	def test_create_valid_ordered_product(self):
 		new_ordered_item = OrderedProduct(name="Cantaloupe", quantity=4, price=1000)
@@ -112,8 +117,7 @@ class OrderedProductModelTest(TestCase):
 
 	def test_create_invalid_ordered_product(self):
 		new_order = Order(product_owner_id=self.test_user, client_name="bob", order_date="2025-07-21")
-		new_order.ordered_products_objects = [OrderedProduct(name="Winter Melon", quantity=4, price=2000)]
-		new_order.save()
+		OrderBuilder(new_order, [OrderedProduct(name="Winter Melon", quantity=4, price=2000)]).save()
 
 		item = OrderedProduct(name="Cantaloupe", quantity=204, price=1200)
 		item_1 = OrderedProduct(name="Bitter Melon", quantity=4, price=1000)
@@ -146,8 +150,7 @@ class OrderedProductModelTest(TestCase):
 
 		new_order = Order(product_owner_id=self.test_user, client_name="Ace", order_date="2025-06-20")
 		new_ordered_product = OrderedProduct(name="Water Melon", quantity=2, price=1500)
-		new_order.ordered_products_objects = [new_ordered_product]
-		new_order.save()
+		OrderBuilder(new_order, [new_ordered_product]).save()
 
 		existing_ordered_item.order_id = new_order
 		update_errors = existing_ordered_item.save()
@@ -168,14 +171,26 @@ class OrderedProductModelTest(TestCase):
 		self.assertEqual(update_errors, ["Only 'quantity' field can be updated"])
 		self.assertEqual(existing_ordered_item.name, "Water Melon")
 
+	def test_ordered_product_linked_to_inventory_item(self):
+		ordered_item = OrderedProduct.objects.get(pk=self.item.id)
+		inventory_item = Inventory.objects.get(product_name="Water Melon")
+		self.assertEqual(ordered_item.inventory_item_id, inventory_item.id)
+
+		# the link survives renaming the inventory item
+		inventory_item.product_name = "Watermelon"
+		inventory_item.save()
+		ordered_item.quantity = 3
+		self.assertEqual(ordered_item.save(new_order=False), None)
+		self.assertEqual(Inventory.objects.get(pk=inventory_item.id).stock_level, 197)
+		self.assertEqual(Order.objects.get(pk=self.test_order.id).total_price, 4500)
+
 	def test_delete_only_ordered_item_of_order(self):
 		self.assertRaises(ValueError, OrderedProduct.objects.get(pk=self.item.id).delete)
 
 	def test_valid_ordered_item_delete(self):
 		new_order = Order(product_owner_id=self.test_user, client_name="bob", order_date="2025-07-20")
 		item_to_delete = OrderedProduct(name="Winter Melon", quantity=2, price=2000)
-		new_order.ordered_products_objects = [OrderedProduct(name="Cantaloupe", quantity=4, price=1000), item_to_delete]
-		new_order.save()
+		OrderBuilder(new_order, [OrderedProduct(name="Cantaloupe", quantity=4, price=1000), item_to_delete]).save()
 
 		self.assertEqual(new_order.total_price, 8000)
 		self.assertEqual(Inventory.objects.get(product_name="Winter Melon").stock_level, 198)
@@ -191,8 +206,7 @@ class OrderedProductModelTest(TestCase):
 		product = Inventory.objects.create(owner=self.test_user, product_name="Snap Melon", price=500, stock_level=100, date_added="2025-05-15")
 		new_order = Order(product_owner_id=self.test_user, client_name="Marla", order_date="2025-04-20")
 		item_to_delete = OrderedProduct(name="Snap Melon", quantity=10, price=500)
-		new_order.ordered_products_objects = [OrderedProduct(name="Cantaloupe", quantity=4, price=1000), item_to_delete]
-		new_order.save()
+		OrderBuilder(new_order, [OrderedProduct(name="Cantaloupe", quantity=4, price=1000), item_to_delete]).save()
 		product.delete()
 		self.assertEqual(new_order.total_price, 9000)
 
@@ -201,4 +215,372 @@ class OrderedProductModelTest(TestCase):
 		self.assertRaises(OrderedProduct.DoesNotExist, OrderedProduct.objects.get, pk=target_id)
 		new_order = Order.objects.get(pk=new_order.id)
 		self.assertEqual(new_order.total_price, 4000)
-	
+
+
+class ProductSalesStatsTest(TestCase):
+	def setUp(self):
+		self.test_user = CustomUser.objects.create(business_name="stats inc.", full_name="Stat Man", email="statman@gmail.com", password="12345678")
+		self.pen = Inventory.objects.create(owner=self.test_user, product_name="Pen", price=100, stock_level=500, date_added="2025-05-15")
+		self.book = Inventory.objects.create(owner=self.test_user, product_name="Book", price=1000, stock_level=500, date_added="2025-05-15")
+
+	def place_order(self, order_date, products, status="Pending"):
+		order = Order(product_owner_id=self.test_user, client_name="client", order_date=order_date, status=status)
+		OrderBuilder(order, [OrderedProduct(name=name, quantity=quantity, price=price) for name, quantity, price in products]).save()
+		return order
+
+	def stats(self):
+		return {
+			row["product_name"]: (row["units_sold"], row["revenue"], row["order_count"], str(row["first_sold"]), str(row["last_sold"]))
+			for row in ProductSalesStats.objects.for_owner(self.test_user).with_product_name().values(
+				"product_name", "units_sold", "revenue", "order_count", "first_sold", "last_sold"
+			)
+		}
+
+	def assertStatsMatchOrderedProducts(self):
+		totals = (
+			OrderedProduct.objects.for_owner(self.test_user).filter(order_id__status="Delivered")
+			.group_by_product().annotate(units_sold=Sum("quantity"), revenue=Sum("cummulative_price"))
+		)
+		self.assertEqual(
+			{row["product_name"]: (row["units_sold"], row["revenue"]) for row in totals},
+			{name: stats[:2] for name, stats in self.stats().items()}
+		)
+
+	def test_stats_are_updated_when_orders_are_delivered(self):
+		order_1 = self.place_order("2025-06-10", [("Pen", 5, 100), ("Book", 1, 1000)])
+		order_2 = self.place_order("2025-06-01", [("Pen", 2, 100)])
+		self.place_order("2025-06-20", [("Book", 3, 1000)], status="Delivered")
+		self.assertEqual(self.stats(), {"Book": (3, 3000, 1, "2025-06-20", "2025-06-20")})
+
+		order_1.status = "Delivered"
+		order_1.save()
+		order_1.save() # saving a delivered order again doesn't count it twice
+		self.assertEqual(self.stats(), {
+			"Book": (4, 4000, 2, "2025-06-10", "2025-06-20"), "Pen": (5, 500, 1, "2025-06-10", "2025-06-10")
+		})
+
+		self.assertEqual(Order.objects.for_owner(self.test_user).mark_delivered(), 1)
+		self.assertEqual(Order.objects.for_owner(self.test_user).mark_delivered(), 0)
+		self.assertEqual(self.stats()["Pen"], (7, 700, 2, "2025-06-01", "2025-06-10"))
+		self.assertStatsMatchOrderedProducts()
+
+	def test_stats_are_recomputed_when_delivered_orders_are_edited(self):
+		order = self.place_order("2025-06-10", [("Pen", 5, 100)], status="Delivered")
+		ordered_product = order.ordered_products.get()
+		ordered_product.quantity = 8
+		ordered_product.save(new_order=False)
+		OrderedProduct(name="Book", quantity=2, price=1000, order_id=order).save(new_order=False)
+		self.assertEqual(self.stats(), {
+			"Pen": (8, 800, 1, "2025-06-10", "2025-06-10"), "Book": (2, 2000, 1, "2025-06-10", "2025-06-10")
+		})
+		self.assertStatsMatchOrderedProducts()
+
+	def test_stats_of_deleted_inventory_items_move_to_their_names(self):
+		self.place_order("2025-06-10", [("Pen", 5, 100), ("Book", 1, 1000)], status="Delivered")
+		Inventory.objects.filter(pk=self.book.id).update(product_name="Notebook") # sales are attributed to the renamed item
+		self.book.refresh_from_db()
+		self.place_order("2025-06-12", [("Notebook", 2, 1000)], status="Delivered")
+		self.assertEqual(self.stats()["Notebook"], (3, 3000, 2, "2025-06-10", "2025-06-12"))
+
+		InventoryItemView().delete_item(self.book)
+		self.assertEqual(self.stats()["Book"], (1, 1000, 1, "2025-06-10", "2025-06-10"))
+		self.assertEqual(self.stats()["Notebook"], (2, 2000, 1, "2025-06-12", "2025-06-12"))
+		self.assertStatsMatchOrderedProducts()
+
+		incremental_stats = self.stats()
+		ProductSalesStats.objects.rebuild([self.test_user.id])
+		self.assertEqual(self.stats(), incremental_stats)
+
+	def test_orders_delivered_during_a_bulk_delete_are_kept(self):
+		order = self.place_order("2025-06-10", [("Pen", 5, 100)])
+		lock_rows = models.lock_rows
+		delivered = []
+
+		def deliver_then_lock(queryset):
+			# another request delivers the order just before the bulk delete locks the orders it selected
+			if not delivered:
+				delivered.append(order.id)
+				Order.objects.for_owner(self.test_user).filter(pk=order.id).mark_delivered()
+			return lock_rows(queryset)
+
+		with mock.patch("orders.models.lock_rows", deliver_then_lock):
+			self.assertEqual(Order.objects.for_owner(self.test_user).delete_and_restock(), 0)
+		self.assertEqual(delivered, [order.id])
+		self.assertEqual(Order.objects.get(pk=order.id).status, "Delivered")
+		self.assertEqual(Inventory.objects.get(pk=self.pen.id).stock_level, 495) # not restocked
+		self.assertEqual(self.stats()["Pen"], (5, 500, 1, "2025-06-10", "2025-06-10"))
+		self.assertStatsMatchOrderedProducts()
+
+
+class ProductAffinityTest(TestCase):
+	def setUp(self):
+		self.test_user = CustomUser.objects.create(business_name="stats inc.", full_name="Stat Man", email="statman@gmail.com", password="12345678")
+		self.pen = Inventory.objects.create(owner=self.test_user, product_name="Pen", price=100, stock_level=500, date_added="2025-05-15")
+		self.book = Inventory.objects.create(owner=self.test_user, product_name="Book", price=1000, stock_level=500, date_added="2025-05-15")
+		self.ink = Inventory.objects.create(owner=self.test_user, product_name="Ink", price=50, stock_level=500, date_added="2025-05-15")
+
+	def place_order(self, *names):
+		order = Order(product_owner_id=self.test_user, client_name="client", order_date="2025-06-10")
+		prices = {"Pen": 100, "Book": 1000, "Ink": 50}
+		OrderBuilder(order, [OrderedProduct(name=name, quantity=1, price=prices[name]) for name in names]).save()
+		return order
+
+	def affinities(self):
+		return {
+			(item, related): order_count for item, related, order_count in ProductAffinity.objects.for_owner(self.test_user)
+			.values_list("inventory_item__product_name", "related_item__product_name", "order_count")
+		}
+
+	def order_count(self):
+		return TenantOrderCount.objects.for_owner(self.test_user).values_list("order_count", flat=True).first() or 0
+
+	def assertAffinities(self, expected):
+		""" expected has each pair once. The counts (and the tenant's order count) must also be what a rebuild counts """
+		expected = {**expected, **{(related, item): count for (item, related), count in expected.items()}}
+		order_count = Order.objects.filter(product_owner_id=self.test_user).count()
+		self.assertEqual((self.affinities(), self.order_count()), (expected, order_count))
+		ProductAffinity.objects.rebuild([self.test_user.id])
+		self.assertEqual((self.affinities(), self.order_count()), (expected, order_count))
+
+	def test_pairs_are_counted_as_orders_are_created_and_edited(self):
+		order_1 = self.place_order("Pen", "Book")
+		self.place_order("Pen", "Ink")
+		order_3 = self.place_order("Pen", "Book", "Ink")
+		self.assertAffinities({
+			("Pen", "Pen"): 3, ("Book", "Book"): 2, ("Ink", "Ink"): 2, ("Pen", "Book"): 2, ("Pen", "Ink"): 2, ("Book", "Ink"): 1
+		})
+		self.assertEqual(list(ProductAffinity.objects.for_owner(self.test_user).related(self.book.id, 5)), [
+			(self.pen.id, "Pen", 2, 3), (self.ink.id, "Ink", 1, 2)
+		])
+
+		OrderedProduct(name="Ink", quantity=1, price=50, order_id=Order.objects.get(pk=order_1.pk)).save(new_order=False)
+		self.assertAffinities({
+			("Pen", "Pen"): 3, ("Book", "Book"): 2, ("Ink", "Ink"): 3, ("Pen", "Book"): 2, ("Pen", "Ink"): 3, ("Book", "Ink"): 2
+		})
+		OrderedProduct.objects.get(order_id=order_3, name="Book").delete()
+		self.assertAffinities({
+			("Pen", "Pen"): 3, ("Book", "Book"): 1, ("Ink", "Ink"): 3, ("Pen", "Book"): 1, ("Pen", "Ink"): 3, ("Book", "Ink"): 1
+		})
+
+		Order.objects.get(pk=order_1.pk).delete()
+		self.assertAffinities({("Pen", "Pen"): 2, ("Ink", "Ink"): 2, ("Pen", "Ink"): 2})
+		Order.objects.for_owner(self.test_user).delete_and_restock()
+		self.assertAffinities({})
+
+
+@override_settings(TRANSACTION_MAX_ATTEMPTS=50, TRANSACTION_RETRY_MAX_DELAY=0.05)
+class OrderBuilderConcurrencyTest(TransactionTestCase):
+	thread_count = 8
+
+	def setUp(self):
+		self.users = []
+		for index in range(self.thread_count):
+			user = CustomUser.objects.create(business_name=f"Business {index}", full_name=f"owner {index}", email=f"owner{index}@gmail.com", password="12345678")
+			Inventory.objects.create(owner=user, product_name=f"Product {index}", price=100 + index, stock_level=1000, date_added="2025-05-15")
+			self.users.append(user)
+
+	def test_orders_built_in_many_threads_dont_share_ordered_products(self):
+		self.assertFalse(hasattr(Order, "ordered_products_objects"))
+		building_done = threading.Barrier(self.thread_count)
+		failures = []
+
+		def create_orders(index):
+			try:
+				for quantity in range(1, 6):
+					order = Order(product_owner_id=self.users[index], client_name=f"client {index}", order_date="2025-07-20")
+					builder = OrderBuilder(order).add_product(OrderedProduct(name=f"Product {index}", quantity=quantity, price=100 + index))
+					if quantity == 1:
+						building_done.wait() # make every thread build its first order before any of them is saved
+					errors = builder.save() # saves that collide (e.g sqlite's "database table is locked") are retried
+					if errors:
+						failures.append(errors)
+			except Exception as err:
+				failures.append(err)
+			finally:
+				connection.close()
+
+		threads = [threading.Thread(target=create_orders, args=(index,)) for index in range(self.thread_count)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+		self.assertEqual(failures, [])
+		for index, user in enumerate(self.users):
+			ordered_products = OrderedProduct.objects.filter(order_id__product_owner_id=user)
+			self.assertEqual(ordered_products.count(), 5)
+			self.assertEqual(set(ordered_products.values_list("name", flat=True)), {f"Product {index}"})
+			self.assertEqual(Inventory.objects.get(owner=user).stock_level, 1000 - 15)
+			for order in Order.objects.filter(product_owner_id=user):
+				self.assertEqual(order.ordered_products.count(), 1)
+				self.assertEqual(order.total_price, order.ordered_products.get().cummulative_price)
+
+
+
+@override_settings(TRANSACTION_MAX_ATTEMPTS=50, TRANSACTION_RETRY_MAX_DELAY=0.05)
+class OrderedProductLockingTest(TransactionTestCase):
+	def setUp(self):
+		self.user = CustomUser.objects.create(business_name="Lock inc.", full_name="Lock Smith", email="locksmith@gmail.com", password="12345678")
+		self.items = {
+			name: Inventory.objects.create(owner=self.user, product_name=name, price=price, stock_level=100, date_added="2025-05-15")
+			for name, price in [("Melon", 1500), ("Mango", 500), ("Kiwi", 300)]
+		}
+
+	def place_order(self):
+		order = Order(product_owner_id=self.user, client_name="client", order_date="2025-06-15")
+		OrderBuilder(order, [OrderedProduct(name="Melon", quantity=2, price=1500), OrderedProduct(name="Mango", quantity=3, price=500)]).save()
+		return order
+
+	def locked_tables(self, func):
+		""" The tables of the rows func reads (and locks) by primary key, in the order it reads them """
+		with CaptureQueriesContext(connection) as queries:
+			func()
+		tables = []
+		for query in queries:
+			for table in ["orders_order", "inventory_inventory"]:
+				if query["sql"].startswith("SELECT") and f'FROM "{table}" WHERE' in query["sql"] and table not in tables:
+					tables.append(table)
+		return tables
+
+	def test_orders_are_locked_before_inventory_items(self):
+		order = self.place_order()
+		add = OrderedProduct(name="Kiwi", quantity=1, price=300, order_id=Order.objects.get(pk=order.pk))
+		self.assertEqual(self.locked_tables(lambda: add.save(new_order=False)), ["orders_order", "inventory_inventory"])
+		update = OrderedProduct.objects.get(order_id=order, name="Melon")
+		update.quantity = 4
+		self.assertEqual(self.locked_tables(lambda: update.save(new_order=False)), ["orders_order", "inventory_inventory"])
+		delete = OrderedProduct.objects.get(order_id=order, name="Mango")
+		self.assertEqual(self.locked_tables(delete.delete), ["orders_order", "inventory_inventory"])
+
+	def test_concurrent_changes_to_the_products_of_an_order(self):
+		outcomes, failures = [], []
+
+		def run(started, change):
+			try:
+				started.wait()
+				outcomes.append(change())
+			except VersionConflict: # the other change updated the order after this one read it
+				outcomes.append("conflict")
+			except Exception as err:
+				failures.append(err)
+			finally:
+				connection.close()
+
+		for round in range(5):
+			order = self.place_order()
+			added = OrderedProduct(name="Kiwi", quantity=1, price=300, order_id=Order.objects.get(pk=order.pk))
+			updated = OrderedProduct.objects.get(order_id=order, name="Melon")
+			updated.quantity = 5
+			deleted = OrderedProduct.objects.get(order_id=order, name="Mango")
+			changes = [lambda: added.save(new_order=False) or "added", lambda: deleted.delete() and "deleted"]
+			if round % 2:
+				changes[0] = lambda: updated.save(new_order=False) or "updated"
+			started = threading.Barrier(len(changes))
+			threads = [threading.Thread(target=run, args=(started, change)) for change in changes]
+			for thread in threads:
+				thread.start()
+			for thread in threads:
+				thread.join()
+
+		self.assertEqual(failures, [])
+		self.assertIn("deleted", outcomes)
+		for order in Order.objects.filter(product_owner_id=self.user):
+			self.assertEqual(order.total_price, order.ordered_products.aggregate(total=Sum("cummulative_price"))["total"])
+		for item in self.items.values():
+			sold = OrderedProduct.objects.filter(inventory_item=item).aggregate(total=Sum("quantity"))["total"] or 0
+			self.assertEqual(Inventory.objects.get(pk=item.pk).stock_level + sold, 100, item.product_name)
+
+
+@override_settings(TRANSACTION_RETRY_BASE_DELAY=0)
+class TransactionRunnerTest(TransactionTestCase):
+	def setUp(self):
+		metrics.reset()
+
+	def test_retryable_errors_are_retried(self):
+		attempts = []
+
+		def flaky():
+			attempts.append(1)
+			if len(attempts) < 3:
+				raise OperationalError("database is locked")
+			return "done"
+
+		self.assertEqual(run_in_transaction(flaky, name="test"), "done")
+		self.assertEqual(len(attempts), 3)
+		self.assertEqual(metrics.snapshot("transactions.test"), {"transactions.test.retries": 2})
+
+	def test_other_errors_are_not_retried(self):
+		attempts = []
+
+		def broken():
+			attempts.append(1)
+			raise OperationalError("no such table: orders_order")
+
+		with self.assertRaises(OperationalError):
+			run_in_transaction(broken, name="test")
+		self.assertEqual(len(attempts), 1)
+		self.assertEqual(metrics.snapshot("transactions.test"), {})
+
+	def test_nested_transactions_are_not_retried(self):
+		attempts = []
+
+		def locked():
+			attempts.append(1)
+			raise OperationalError("database is locked")
+
+		with self.assertRaises(OperationalError):
+			with transaction.atomic():
+				run_in_transaction(locked, name="test")
+		self.assertEqual(len(attempts), 1)
+
+
+@override_settings(TRANSACTION_MAX_ATTEMPTS=100, TRANSACTION_RETRY_BASE_DELAY=0.005, TRANSACTION_RETRY_MAX_DELAY=0.05)
+class OverlappingCartsStressTest(TransactionTestCase):
+	thread_count = 8
+	orders_per_thread = 5
+	product_names = ["Product A", "Product B", "Product C", "Product D"]
+
+	def setUp(self):
+		metrics.reset()
+		self.user = CustomUser.objects.create(business_name="Business", full_name="owner", email="owner@gmail.com", password="12345678")
+		for product_name in self.product_names:
+			Inventory.objects.create(owner=self.user, product_name=product_name, price=100, stock_level=1000, date_added="2025-05-15")
+
+	def test_concurrent_overlapping_carts_keep_stock_consistent(self):
+		start = threading.Barrier(self.thread_count)
+		failures = []
+
+		def place_orders(index):
+			rand = random.Random(index)
+			try:
+				start.wait()
+				for _ in range(self.orders_per_thread):
+					# every cart holds 3 of the 4 products, listed in a random order
+					cart = rand.sample(self.product_names, 3)
+					order = Order(product_owner_id=self.user, client_name=f"client {index}", order_date="2025-07-20")
+					builder = OrderBuilder(order)
+					for product_name in cart:
+						builder.add_product(OrderedProduct(name=product_name, quantity=2, price=100))
+					errors = builder.save()
+					if errors:
+						failures.append(errors)
+			except Exception as err:
+				failures.append(err)
+			finally:
+				connection.close()
+
+		threads = [threading.Thread(target=place_orders, args=(index,)) for index in range(self.thread_count)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+		self.assertEqual(failures, [])
+		self.assertEqual(Order.objects.count(), self.thread_count * self.orders_per_thread)
+		for item in Inventory.objects.filter(owner=self.user):
+			sold = sum(OrderedProduct.objects.filter(inventory_item=item).values_list("quantity", flat=True))
+			self.assertEqual(item.stock_level, 1000 - sold)
+		for order in Order.objects.all():
+			self.assertEqual(order.ordered_products.count(), 3)
+			self.assertEqual(order.total_price, 600)
+		self.assertNotIn("transactions.order_save.exhausted", metrics.snapshot())
@@ -1,9 +1,17 @@
 from django.test import TestCase
-from orders.models import Order, OrderedProduct
+from orders.models import Order, OrderedProduct, OrderBuilder
 from orders.serializers import OrderedProductSerializer, OrderSerializer
 from accounts.models import CustomUser
 from inventory.models import Inventory
-from datetime import date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.parsers import JSONParser
+from rest_framework.exceptions import ParseError
+from bizease.renderers import FastJSONRenderer
+from bizease.parsers import FastJSONParser
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+from decimal import Decimal
+import io
 
 
 class OrderSerializersTest(TestCase):
@@ -20,8 +28,7 @@ class OrderSerializersTest(TestCase):
 		cls.ordered_product_1 = OrderedProduct(name="Pen", quantity=40, price=100)
 		cls.ordered_product_2 = OrderedProduct(name="Bread", quantity=6, price=500)
 		cls.ordered_product_3 = OrderedProduct(name="Detergent", quantity=3, price=800)
-		cls.test_order.ordered_products_objects = [cls.ordered_product_1, cls.ordered_product_2, cls.ordered_product_3]
-		cls.test_order.save()
+		OrderBuilder(cls.test_order, [cls.ordered_product_1, cls.ordered_product_2, cls.ordered_product_3]).save()
 
 	def test_order_serialization(self):
 		expected_output = {
@@ -59,6 +66,42 @@ class OrderSerializersTest(TestCase):
 		}
 		self.assertEqual(OrderSerializer(self.test_order).data, expected_output)
 
+	def test_fast_json_renderer_matches_drf_renderer(self):
+		values = [
+			OrderSerializer(Order.objects.all(), many=True).data,
+			{"price": Decimal("2400.50"), "order_date": date(2025, 7, 20), "created_at": datetime(2025, 7, 20, 8, 30, tzinfo=timezone.utc)},
+			{"naive": datetime(2025, 7, 20, 8, 30, 0, 1500), "duration": timedelta(hours=1), 1: "non-string key", "note": "a\u2028b"},
+			{"big_int": 2 ** 70, "nested": [[Decimal("0.1"), None, True]]}
+		]
+		for value in values:
+			self.assertEqual(FastJSONRenderer().render(value), JSONRenderer().render(value))
+		self.assertEqual(FastJSONRenderer().render(None), b"")
+
+	def test_fast_json_renderer_matches_drf_renderer_for_dates_and_times(self):
+		values = [
+			datetime(2025, 7, 20, 8, 30, 15, 123456, tzinfo=timezone.utc),
+			datetime(2025, 7, 20, 8, 30, 15, 999999, tzinfo=ZoneInfo("Africa/Lagos")),
+			datetime(1890, 7, 20, 8, 30, tzinfo=ZoneInfo("Africa/Lagos")), # local mean time, a UTC offset with seconds
+			datetime(2025, 7, 20, 8, 30, tzinfo=timezone(-timedelta(hours=3, minutes=30))),
+			datetime(2025, 7, 20, 23, 59, 59, 999999),
+			date(2025, 7, 20),
+			time(8, 30, 15, 1500),
+			time(8, 30),
+		]
+		for value in values:
+			self.assertEqual(FastJSONRenderer().render({"value": value}), JSONRenderer().render({"value": value}), repr(value))
+		self.assertEqual(FastJSONRenderer().render({"value": values[0]}), b'{"value":"2025-07-20T08:30:15.123456Z"}')
+		for renderer in [FastJSONRenderer(), JSONRenderer()]:
+			with self.assertRaises(ValueError):
+				renderer.render({"value": time(8, 30, tzinfo=timezone.utc)})
+
+	def test_fast_json_parser(self):
+		body = JSONRenderer().render(OrderSerializer(self.test_order).data)
+		self.assertEqual(FastJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+		for invalid_body in [b'{"client_name": ', b'{"total_price": NaN}']:
+			with self.assertRaises(ParseError):
+				FastJSONParser().parse(io.BytesIO(invalid_body))
+
 	def test_create_new_order(self):
 		data = {
 			"client_name": "good_customer",
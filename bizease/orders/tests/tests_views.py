@@ -1,12 +1,23 @@
 from rest_framework.test import APITransactionTestCase
-from orders.models import Order, OrderedProduct
+from orders.models import Order, OrderedProduct, OrderIntake, OrderBuilder
+from orders.intake import claim_next_intake, apply_intake
+from jobs.models import Job
+from jobs.queue import enqueue
 from orders.serializers import OrderSerializer
+from orders.views import OrdersView
 from accounts.models import CustomUser
 from inventory.models import Inventory
 from django.urls import reverse
+from django.core.management import call_command
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
-from datetime import date
+from datetime import date, timedelta
+from django.utils import timezone
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import override_settings
+from bizease.serializers import rows_to_dicts
+import json
 
 
 class OrdersViewsTest(APITransactionTestCase):
@@ -24,8 +35,7 @@ class OrdersViewsTest(APITransactionTestCase):
 		self.test_order = Order(product_owner_id=self.test_user, client_name="bob", client_email="bob@gmail.com", order_date="2025-07-20")
 		self.ordered_product_1 = OrderedProduct(name="Calculator", quantity=1, price=10000)
 		self.ordered_product_2 = OrderedProduct(name="Helmet", quantity=5, price=6000)
-		self.test_order.ordered_products_objects = [self.ordered_product_1, self.ordered_product_2]
-		self.test_order.save()
+		OrderBuilder(self.test_order, [self.ordered_product_1, self.ordered_product_2]).save()
 
 
 	def create_valid_new_order_req(self):
@@ -259,6 +269,63 @@ class OrdersViewsTest(APITransactionTestCase):
 		self.assertEqual(response.data["data"]["orders"][3]["client_name"], "gumball")
 		self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+	def get_orders_by_ranges(self):
+		response = self.client.get(reverse("orders", args=["v1"]), query_params={"order_date_from": "2025-07-16", "order_date_to": "2025-07-17"})
+		self.assertEqual([order["client_name"] for order in response.data["data"]["orders"]], ["Batman", "gumball"])
+
+		response = self.client.get(reverse("orders", args=["v1"]), query_params={"order_date_from": "2025-07-16", "status": "pending"})
+		self.assertEqual([order["client_name"] for order in response.data["data"]["orders"]], ["bob", "gumball"])
+
+		response = self.client.get(reverse("orders", args=["v1"]), query_params={"min_total": "40000", "max_total": "150000.50"})
+		self.assertEqual([order["client_name"] for order in response.data["data"]["orders"]], ["bob", "Batman"])
+
+		today = date.today().isoformat()
+		response = self.client.get(reverse("orders", args=["v1"]), query_params={"delivery_date_from": today, "delivery_date_to": today})
+		self.assertEqual([order["client_name"] for order in response.data["data"]["orders"]], ["Batman", "prismo"])
+
+		response = self.client.get(reverse("orders", args=["v1"]), query_params={"order_date_from": "2025-13-01"})
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+		self.assertEqual(response.data["detail"], "Invalid value for order_date_from parameter")
+		response = self.client.get(reverse("orders", args=["v1"]), query_params={"min_total": "a lot"})
+		self.assertEqual(response.data["detail"], "Invalid value for min_total parameter")
+
+	def get_columnar_orders(self):
+		queries = [
+			"?order=id", "?status=delivered&page=1", "?fields=client_name,total_price", "?fields=status&expand=ordered_products",
+			"?cursor=&order=total_price", "?cursor=&fields=client_name&order=-order_date"
+		]
+		for query in queries:
+			default = json.loads(self.client.get(reverse("orders", args=["v1"]) + query).content)["data"]
+			columnar = json.loads(self.client.get(reverse("orders", args=["v1"]) + query + "&format=columnar").content)["data"]
+			self.assertEqual(rows_to_dicts(columnar.pop("orders")), default.pop("orders"))
+			self.assertEqual(columnar, default)
+
+	def get_orders_with_cursor(self):
+		OrdersView.page_size, page_size = 1, OrdersView.page_size
+		try:
+			client_names, cursor = [], ""
+			while cursor is not None:
+				response = self.client.get(reverse("orders", args=["v1"]), query_params={"cursor": cursor, "order": "total_price", "max_total": "150000"})
+				self.assertEqual(response.status_code, status.HTTP_200_OK)
+				self.assertLessEqual(response.data["data"]["length"], 1)
+				client_names += [order["client_name"] for order in response.data["data"]["orders"]]
+				cursor = response.data["data"]["next_cursor"]
+			self.assertEqual(client_names, ["gumball", "bob", "Batman"])
+
+			response = self.client.get(reverse("orders", args=["v1"]), query_params={"cursor": "not-a-cursor"})
+			self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+			self.assertEqual(response.data["detail"], "Invalid cursor")
+		finally:
+			OrdersView.page_size = page_size
+
+	def get_streamed_orders(self):
+		for query in ["?order=id", "?status=delivered", "?fields=client_name&expand=ordered_products"]:
+			response = self.client.get(reverse("orders", args=["v1"]) + query)
+			with override_settings(JSON_STREAMING_MIN_ITEMS=2):
+				streamed_response = self.client.get(reverse("orders", args=["v1"]) + query)
+			self.assertTrue(streamed_response.streaming)
+			self.assertEqual(json.loads(b"".join(streamed_response.streaming_content)), response.json())
+
 	def test_get_orders_with_credentials_and_query_params(self):
 		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
 
@@ -270,18 +337,19 @@ class OrdersViewsTest(APITransactionTestCase):
 		order_2 = Order(product_owner_id=self.test_user, client_name="gumball", client_email="gumballwatterson@elmoremail.com", order_date="2025-07-16")
 		order_3 = Order(product_owner_id=self.test_user, client_name="Batman", client_email="brucewayne@wayne.gotham", status="Delivered", order_date="2025-07-17")
 
-		order_1.ordered_products_objects = [OrderedProduct(name="Bag", quantity=12, price=16000), OrderedProduct(name="Head Phones", quantity=1, price=9000)]
-		order_1.save()
-		order_2.ordered_products_objects = [OrderedProduct(name="Head Phones", quantity=1, price=9000)]
-		order_2.save()
-		order_3.ordered_products_objects = [OrderedProduct(name="Tape", quantity=10, price=6000), OrderedProduct(name="Head Phones", quantity=5, price=9000)]
-		order_3.save()
+		OrderBuilder(order_1, [OrderedProduct(name="Bag", quantity=12, price=16000), OrderedProduct(name="Head Phones", quantity=1, price=9000)]).save()
+		OrderBuilder(order_2, [OrderedProduct(name="Head Phones", quantity=1, price=9000)]).save()
+		OrderBuilder(order_3, [OrderedProduct(name="Tape", quantity=10, price=6000), OrderedProduct(name="Head Phones", quantity=5, price=9000)]).save()
 
 		self.get_orders_by_status()
 		self.get_orders_by_search()
 		self.get_orders_ordered_by_id()
 		self.get_orders_ordered_by_order_date()
 		self.get_orders_ordered_by_total_price()
+		self.get_orders_by_ranges()
+		self.get_columnar_orders()
+		self.get_orders_with_cursor()
+		self.get_streamed_orders()
 		
 	def test_get_orders_without_credentials(self):
 		response = self.client.get(reverse("orders", args=["v1"]))
@@ -298,6 +366,46 @@ class OrdersViewsTest(APITransactionTestCase):
 		self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 		self.assertEqual(response.data["detail"], "Order not found")
 
+	def test_get_orders_with_sparse_fieldset(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(reverse("orders", args=["v1"]) + "?fields=client_name,total_price")
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data["data"]["orders"], [{"id": self.test_order.id, "client_name": "bob", "total_price": 40000}])
+		self.assertFalse(any("orders_orderedproduct" in query["sql"] for query in queries))
+
+		response = self.client.get(reverse("orders", args=["v1"]) + "?fields=client_name&expand=ordered_products")
+		self.assertEqual(list(response.data["data"]["orders"][0]), ["id", "client_name", "ordered_products"])
+		self.assertEqual([product["name"] for product in response.data["data"]["orders"][0]["ordered_products"]], ["Calculator", "Helmet"])
+
+		# the full representation is returned when 'fields' isn't specified
+		response = self.client.get(reverse("orders", args=["v1"]))
+		self.assertEqual(len(response.data["data"]["orders"][0]["ordered_products"]), 2)
+
+		response = self.client.get(reverse("orders", args=["v1"]) + "?expand=inventory")
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+	def test_conditional_get_orders(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		etag = self.client.get(reverse("orders", args=["v1"])).headers["ETag"]
+		response = self.client.get(reverse("orders", args=["v1"]), HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+		self.client.put(reverse("order", args=["v1", str(self.test_order.id)]), {"client_name": "sam"}, format="json")
+		response = self.client.get(reverse("orders", args=["v1"]), HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data["data"]["orders"][0]["client_name"], "sam")
+
+	def test_conditional_get_single_order(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		etag = self.client.get(reverse("order", args=["v1", str(self.test_order.id)])).headers["ETag"]
+		with self.assertNumQueries(2): # the user's lookup by the jwt authentication and the order's version
+			response = self.client.get(reverse("order", args=["v1", str(self.test_order.id)]), HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+		response = self.client.get(reverse("order", args=["v1", "99999999"]), HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
 	def test_get_single_order_without_credentials(self):
 		response = self.client.get(reverse("order", args=["v1", "1"]), format="json")
 		self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -307,8 +415,7 @@ class OrdersViewsTest(APITransactionTestCase):
 		order = Order(product_owner_id=self.test_user, client_name="Tim", client_email="timilehin@tmail.com", order_date="2025-03-2")
 		ordered_product_1 = OrderedProduct(name="Safety Boots", quantity=1, price=65000)
 		ordered_product_2 = OrderedProduct(name="Helmet", quantity=5, price=6000)
-		order.ordered_products_objects = [ordered_product_1, ordered_product_2]
-		order.save()
+		OrderBuilder(order, [ordered_product_1, ordered_product_2]).save()
 
 		self.assertEqual(order.client_name, "Tim")
 		self.assertRegex(order.order_date, "2025-03-2")
@@ -332,14 +439,26 @@ class OrdersViewsTest(APITransactionTestCase):
 		self.assertEqual(order.order_date, date.fromisoformat("2025-04-08"))
 		self.assertRegex(order.delivery_date.isoformat(), r'^\d{4}-\d{2}-\d{2}')
 
+	def test_update_order_with_if_match(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		response = self.client.get(reverse("order", args=["v1", str(self.test_order.id)]), format="json")
+		etag = response.headers["ETag"]
+
+		response = self.client.put(reverse("order", args=["v1", str(self.test_order.id)]), {"client_name": "sam"}, format="json", HTTP_IF_MATCH=etag)
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertNotEqual(response.headers["ETag"], etag)
+
+		# a second client editing the order with the version it retrieved earlier
+		response = self.client.put(reverse("order", args=["v1", str(self.test_order.id)]), {"client_name": "tom"}, format="json", HTTP_IF_MATCH=etag)
+		self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+		self.assertEqual(Order.objects.get(pk=self.test_order.id).client_name, "sam")
 
 	def test_delete_order_with_credentials(self):
 		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
 
 		order_to_delete = Order(product_owner_id=self.test_user, client_name="Damola", order_date="2025-06-02")
 		ordered_product = OrderedProduct(name="Safety Boots", quantity=1, price=65000)
-		order_to_delete.ordered_products_objects = [ordered_product]
-		order_to_delete.save()
+		OrderBuilder(order_to_delete, [ordered_product]).save()
 
 		response = self.client.delete(reverse("order", args=["v1", str(order_to_delete.id)]), format="json")
 		self.assertRaises(Order.DoesNotExist, Order.objects.get, pk=self.item_3.id)
@@ -357,8 +476,7 @@ class OrdersViewsTest(APITransactionTestCase):
 	def test_get_order_stats(self):
 		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
 		new_order = Order(product_owner_id=self.test_user, client_name="bmo", client_email="bmo@nomail.com", status="Delivered", order_date="2025-04-15")
-		new_order.ordered_products_objects = [OrderedProduct(name="Calculator", quantity=1, price=10000)]
-		new_order.save()
+		OrderBuilder(new_order, [OrderedProduct(name="Calculator", quantity=1, price=10000)]).save()
 
 		response = self.client.get(reverse("orders-stats", args=["v1"]), format="json")
 		self.assertEqual(response.data["data"]["total_orders"], 2)
@@ -378,8 +496,7 @@ class OrderedProductViewTest(APITransactionTestCase):
 
 		self.order = Order(product_owner_id=self.user, client_name="bob", client_email="bob@gmail.com", order_date="2025-04-15")
 		self.ordered_product = OrderedProduct(name="Cup", quantity=5, price=800)
-		self.order.ordered_products_objects = [self.ordered_product]
-		self.order.save()
+		OrderBuilder(self.order, [self.ordered_product]).save()
 
 	def test_add_new_ordered_product_to_order(self):
 		Inventory.objects.create(owner=self.user, product_name="Plate", price=1500, stock_level=100, date_added="2025-05-15")
@@ -430,6 +547,24 @@ class OrderedProductViewTest(APITransactionTestCase):
 		self.assertEqual(order.total_price, 1600)
 		self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+	def test_update_ordered_product_with_stale_if_match(self):
+		Inventory.objects.create(owner=self.user, product_name="Plate", price=1500, stock_level=100, date_added="2025-05-15")
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		response = self.client.get(reverse("ordered-product", args=["v1", str(self.order.id), str(self.ordered_product.id)]), format="json")
+		etag = response.headers["ETag"]
+
+		# adding a product changes the order (and its total price) the ordered product belongs to
+		self.client.post(reverse("ordered-products", args=["v1", str(self.order.id)]), {"name": "Plate", "quantity": 2, "price": 1500}, format="json")
+
+		url = reverse("ordered-product", args=["v1", str(self.order.id), str(self.ordered_product.id)])
+		response = self.client.put(url, {"quantity": 2}, format="json", HTTP_IF_MATCH=etag)
+		self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+		self.assertEqual(OrderedProduct.objects.get(pk=self.ordered_product.id).quantity, 5)
+
+		response = self.client.put(url, {"quantity": 2}, format="json", HTTP_IF_MATCH=response.headers["ETag"])
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(Order.objects.get(pk=self.order.id).total_price, 4600)
+
 	def test_update_ordered_product_without_credentials(self):
 		response = self.client.put(reverse("ordered-product", args=["v1", str(self.order.id), str(self.ordered_product.id)]), format="json")
 		self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -478,3 +613,164 @@ class OrderedProductViewTest(APITransactionTestCase):
 		response = self.client.delete(reverse("ordered-product", args=["v1", str(self.order.id), str(self.ordered_product.id)]), format="json")
 		self.assertEqual(response.data["detail"], "Only the Ordered products of Pending Orders can be deleted")
 		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BulkOrdersViewTest(APITransactionTestCase):
+	def setUp(self):
+		self.user = CustomUser.objects.create(
+			business_name="Bulk-biz", full_name="finn", email="finn123@gmail.com", password="12345678", is_active=True
+		)
+		self.other_user = CustomUser.objects.create(
+			business_name="Other-biz", full_name="jake", email="jake123@gmail.com", password="12345678", is_active=True
+		)
+		self.access_token = str(RefreshToken.for_user(self.user).access_token)
+
+		self.cup = Inventory.objects.create(owner=self.user, product_name="Cup", price=800, stock_level=100, date_added="2025-05-15")
+		self.plate = Inventory.objects.create(owner=self.user, product_name="Plate", price=1500, stock_level=100, date_added="2025-05-15")
+		other_cup = Inventory.objects.create(owner=self.other_user, product_name="Cup", price=800, stock_level=100, date_added="2025-05-15")
+
+		self.orders = []
+		for day in range(1, 4):
+			order = Order(product_owner_id=self.user, client_name=f"client {day}", order_date=f"2025-04-0{day}")
+			OrderBuilder(order, [OrderedProduct(name="Cup", quantity=day, price=800), OrderedProduct(name="Plate", quantity=2, price=1500)]).save()
+			self.orders.append(order)
+
+		self.other_order = Order(product_owner_id=self.other_user, client_name="other client", order_date="2025-04-02")
+		OrderBuilder(self.other_order, [OrderedProduct(name="Cup", quantity=4, price=800)]).save()
+
+	def test_bulk_operations_without_credentials(self):
+		response = self.client.put(reverse("orders-bulk", args=["v1"]), {"ids": [self.orders[0].id], "status": "Delivered"}, format="json")
+		self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+		response = self.client.delete(reverse("orders-bulk", args=["v1"]), {"ids": [self.orders[0].id]}, format="json")
+		self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+	def test_bulk_mark_delivered_by_ids(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		ids = [self.orders[0].id, self.orders[1].id, self.other_order.id]
+		response = self.client.put(reverse("orders-bulk", args=["v1"]), {"ids": ids, "status": "Delivered"}, format="json")
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data["data"]["updated"], 2)
+		self.assertEqual(Order.objects.filter(product_owner_id=self.user, status="Delivered").count(), 2)
+		self.assertIsNotNone(Order.objects.get(pk=self.orders[0].id).delivery_date)
+		self.assertEqual(Order.objects.get(pk=self.orders[2].id).status, "Pending")
+		self.assertEqual(Order.objects.get(pk=self.other_order.id).status, "Pending") # other users orders are never touched
+
+	def test_bulk_mark_delivered_by_filter(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		data = {"filter": {"status": "Pending", "order_date_from": "2025-04-02"}, "status": "Delivered"}
+		response = self.client.put(reverse("orders-bulk", args=["v1"]), data, format="json")
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data["data"]["updated"], 2)
+		self.assertEqual(Order.objects.get(pk=self.orders[0].id).status, "Pending")
+		self.assertEqual(Order.objects.get(pk=self.orders[1].id).status, "Delivered")
+
+	def test_bulk_operations_with_invalid_selection(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		response = self.client.put(reverse("orders-bulk", args=["v1"]), {"status": "Delivered"}, format="json")
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+		response = self.client.put(reverse("orders-bulk", args=["v1"]), {"ids": [self.orders[0].id], "status": "Pending"}, format="json")
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+		response = self.client.delete(reverse("orders-bulk", args=["v1"]), {"ids": [self.orders[0].id], "filter": {}}, format="json")
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+	def test_bulk_delete_restocks_inventory(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		self.assertEqual(Inventory.objects.get(pk=self.cup.id).stock_level, 94)
+		self.assertEqual(Inventory.objects.get(pk=self.plate.id).stock_level, 94)
+
+		self.client.put(reverse("orders-bulk", args=["v1"]), {"ids": [self.orders[2].id], "status": "Delivered"}, format="json")
+		ids = [order.id for order in self.orders] + [self.other_order.id]
+		response = self.client.delete(reverse("orders-bulk", args=["v1"]), {"ids": ids}, format="json")
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data["data"]["deleted"], 2) # Delivered orders are not deleted
+		self.assertEqual(Order.objects.filter(product_owner_id=self.user).count(), 1)
+		self.assertEqual(OrderedProduct.objects.filter(order_id__product_owner_id=self.user).count(), 2)
+		self.assertEqual(Inventory.objects.get(pk=self.cup.id).stock_level, 97)
+		self.assertEqual(Inventory.objects.get(pk=self.plate.id).stock_level, 98)
+		self.assertTrue(Order.objects.filter(pk=self.other_order.id).exists())
+		self.assertEqual(Inventory.objects.get(owner=self.other_user, product_name="Cup").stock_level, 96)
+
+
+class OrderIntakeViewTest(APITransactionTestCase):
+	def setUp(self):
+		self.user = CustomUser.objects.create(
+			business_name="Flash-biz", full_name="marceline", email="marceline@gmail.com", password="12345678", is_active=True
+		)
+		self.access_token = str(RefreshToken.for_user(self.user).access_token)
+		self.item = Inventory.objects.create(owner=self.user, product_name="Guitar", price=50000, stock_level=3, date_added="2025-05-15")
+
+	def queue_order(self, quantity):
+		data = {"client_name": "client", "order_date": "2025-07-20", "ordered_products": [{"name": "Guitar", "quantity": quantity, "price": 50000}]}
+		return self.client.post(reverse("orders", args=["v1"]), data, format="json", HTTP_PREFER="respond-async")
+
+	def test_queued_order_is_applied_by_worker(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		response = self.queue_order(2)
+		self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+		self.assertEqual(response.data["data"]["status"], "Queued")
+		self.assertEqual(response["Location"], response.data["data"]["status_url"])
+		self.assertEqual(Order.objects.filter(product_owner_id=self.user).count(), 0)
+
+		intake_url = reverse("order-intake", args=["v1", response.data["data"]["id"]])
+		self.assertEqual(self.client.get(intake_url).data["data"]["status"], "Queued")
+
+		self.assertEqual(Job.objects.get().task, "orders.process_tenant_intakes")
+		call_command("run_worker", "--once", "--no-scheduler")
+		response = self.client.get(intake_url)
+		self.assertEqual(response.data["data"]["status"], "Applied")
+		self.assertEqual(response.data["data"]["order"]["total_price"], 100000)
+		self.assertEqual(Inventory.objects.get(pk=self.item.id).stock_level, 1)
+
+	def test_queued_orders_that_cant_be_satisfied_fail(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		first_intake_id = self.queue_order(2).data["data"]["id"]
+		second_intake_id = self.queue_order(2).data["data"]["id"]
+		call_command("run_worker", "--once", "--no-scheduler", "--concurrency", "2")
+
+		self.assertEqual(self.client.get(reverse("order-intake", args=["v1", first_intake_id])).data["data"]["status"], "Applied")
+		response = self.client.get(reverse("order-intake", args=["v1", second_intake_id]))
+		self.assertEqual(response.data["data"]["status"], "Failed")
+		self.assertEqual(response.data["data"]["errors"], {"ordered_products": {"Guitar": ["Not enough products in stock to satisfy order for 'Guitar'"]}})
+
+	def test_intakes_of_a_tenant_are_claimed_one_at_a_time_and_stale_claims_are_requeued(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		first_intake_id = self.queue_order(1).data["data"]["id"]
+		second_intake_id = self.queue_order(1).data["data"]["id"]
+
+		stale_intake = claim_next_intake(self.user.id, "dead-worker")
+		self.assertEqual(stale_intake.id, first_intake_id)
+		self.assertIsNotNone(stale_intake.claimed_at)
+		# later intakes of the tenant wait until the claimed one is applied, whichever worker asks
+		self.assertIsNone(claim_next_intake(self.user.id, "other-worker"))
+		enqueue("orders.requeue_stale_intakes")
+		call_command("run_worker", "--once", "--no-scheduler")
+		self.assertEqual(self.client.get(reverse("order-intake", args=["v1", second_intake_id])).data["data"]["status"], "Queued")
+
+		OrderIntake.objects.filter(pk=first_intake_id).update(claimed_at=timezone.now() - timedelta(hours=1))
+		enqueue("orders.requeue_stale_intakes")
+		call_command("run_worker", "--once", "--no-scheduler")
+		self.assertFalse(apply_intake(stale_intake)) # the worker that lost the claim doesn't apply it again
+
+		intakes = OrderIntake.objects.filter(pk__in=[first_intake_id, second_intake_id]).order_by("id")
+		self.assertEqual([intake.status for intake in intakes], ["Applied", "Applied"])
+		self.assertLess(intakes[0].order_id, intakes[1].order_id)
+		self.assertEqual(Order.objects.filter(product_owner_id=self.user).count(), 2)
+		self.assertEqual(Inventory.objects.get(pk=self.item.id).stock_level, 1)
+
+	def test_invalid_payload_is_rejected_before_queueing(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		response = self.client.post(reverse("orders", args=["v1"]), {"client_name": "client"}, format="json", HTTP_PREFER="respond-async")
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+		self.assertEqual(OrderIntake.objects.count(), 0)
+
+	def test_intake_status_of_another_user(self):
+		other_user = CustomUser.objects.create(business_name="Other-biz", full_name="other", email="other@gmail.com", password="12345678", is_active=True)
+		intake = OrderIntake.objects.create(owner=other_user, payload={})
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		response = self.client.get(reverse("order-intake", args=["v1", intake.id]))
+		self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
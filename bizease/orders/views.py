@@ -1,29 +1,53 @@
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.parsers import JSONParser
+from bizease.parsers import JSONParser
 from rest_framework.views import APIView
-from .serializers import OrderSerializer, OrderedProductSerializer
+from .serializers import OrderSerializer, OrderedProductSerializer, BulkOrderSelectionSerializer, BulkOrderStatusSerializer
 from rest_framework.response import Response
-from .models import Order, OrderedProduct
+from .models import Order, OrderedProduct, OrderIntake
+from .intake import queue_intake_processing
 from rest_framework import status
+from django.db import transaction
 from django.db.models import Sum, F, Q
+from django.conf import settings
+from django.urls import reverse
+from bizease.conditional import (
+	VersionConflict, etag_for, version_etag, if_match_failed, precondition_failed_response, version_conflict_response,
+	list_etag, if_none_match, cache_headers, not_modified_response
+)
+from bizease.serializers import parse_sparse_fieldset, columnar_rows
+from bizease.renderers import ColumnarJSONRenderer, columnar_requested, streamed_length, StreamingJSONResponse, STREAMED_ARRAY
+from rest_framework.settings import api_settings
+from bizease.pagination import keyset_page
+from django.core.exceptions import ValidationError
+from datetime import date
+from decimal import Decimal, InvalidOperation
 import math
 
 
+def async_intake_requested(request):
+	""" Orders are queued instead of created inline when intake mode is enabled or the client asks for it with 'Prefer: respond-async' """
+	if getattr(settings, "ORDER_INTAKE_ASYNC", False):
+		return True
+	preferences = [value.strip().lower() for value in request.headers.get("Prefer", "").split(",")]
+	return "respond-async" in preferences
+
+
 class OrderStatsView(APIView):
 	permission_classes = [IsAuthenticated]
 	parser_classes = [JSONParser]
 
 	def get(self, request, **kwargs):
 		data = {
-			"total_orders": Order.objects.filter(product_owner_id=request.user.id).count(),
-			"total_revenue": Order.objects.filter(product_owner_id=request.user.id).filter(status="Delivered").aggregate(Sum("total_price"))['total_price__sum'],
-			"pending_orders": Order.objects.filter(product_owner_id=request.user.id).filter(status="Pending").count()
+			"total_orders": Order.objects.for_owner(request.user.id).count(),
+			"total_revenue": Order.objects.for_owner(request.user.id).filter(status="Delivered").aggregate(Sum("total_price"))['total_price__sum'],
+			"pending_orders": Order.objects.for_owner(request.user.id).filter(status="Pending").count()
 		}
 		return Response({"data": data}, status=status.HTTP_200_OK)
 
 class OrdersView(APIView):
 	parser_classes = [JSONParser]
 	permission_classes = [IsAuthenticated]
+	renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, ColumnarJSONRenderer]
 	page_size = 20
 	curr_queryset = None
 
@@ -59,6 +83,78 @@ class OrdersView(APIView):
 		self.curr_queryset = self.curr_queryset.filter(status=status)
 		return self
 
+	def filter_data_by_ranges(self):
+		""" Applies the order_date_*, delivery_date_* and min/max_total filters. Raises ValueError for invalid values """
+		range_params = {
+			"order_date_from": ("order_date__gte", date.fromisoformat),
+			"order_date_to": ("order_date__lte", date.fromisoformat),
+			"delivery_date_from": ("delivery_date__gte", date.fromisoformat),
+			"delivery_date_to": ("delivery_date__lte", date.fromisoformat),
+			"min_total": ("total_price__gte", Decimal),
+			"max_total": ("total_price__lte", Decimal),
+		}
+		lookups = {}
+		for param, (lookup, parse) in range_params.items():
+			value = self.request.GET.get(param)
+			if not value:
+				continue
+			try:
+				lookups[lookup] = parse(value)
+			except (ValueError, InvalidOperation):
+				raise ValueError(f"Invalid value for {param} parameter")
+		self.curr_queryset = self.curr_queryset.filter(**lookups)
+		return self
+
+	def columnar_orders(self, rows, field_names):
+		"""
+		Table of order rows (tuples of the values of field_names without 'ordered_products'). If 'ordered_products' is one of
+		the field names, the ordered products of each order are nested in it as a table. They are read with one query
+		"""
+		order_fields = [name for name in field_names if name != "ordered_products"]
+		table = columnar_rows(rows, OrderSerializer(), order_fields)
+		if "ordered_products" in field_names:
+			product_fields = OrderedProductSerializer.Meta.fields
+			products_by_order = {}
+			ordered_products = (
+				OrderedProduct.objects.for_owner(self.request.user.id)
+				.filter(order_id__in=[row[0] for row in rows]).values_list("order_id", *product_fields)
+			)
+			for product_row in ordered_products:
+				products_by_order.setdefault(product_row[0], []).append(product_row[1:])
+			table["fields"].append("ordered_products")
+			for order_row in table["rows"]:
+				order_row.append(columnar_rows(products_by_order.get(order_row[0], []), OrderedProductSerializer(), product_fields))
+		return table
+
+	def get_cursor_page(self, request, fields, etag):
+		ordering = request.GET.get("order")
+		if ordering not in ["id", "-id", "order_date", "-order_date", "-total_price", "total_price"]:
+			ordering = "-order_date"
+		ordering_field = ordering.lstrip("-")
+
+		try:
+			if columnar_requested(request):
+				field_names = fields or OrderSerializer.Meta.fields
+				order_fields = [name for name in field_names if name != "ordered_products"]
+				selected_fields = order_fields + ([ordering_field] if ordering_field not in order_fields else [])
+				position = lambda _, row: (row[selected_fields.index(ordering_field)], row[0])
+				rows, next_cursor = keyset_page(
+					self.curr_queryset.prefetch_related(None).values_list(*selected_fields), ordering, request.GET["cursor"], self.page_size, position
+				)
+				orders = self.columnar_orders([row[:len(order_fields)] for row in rows], field_names)
+				order_count = len(orders["rows"])
+			else:
+				if fields: # the cursor is made from the ordering field of the last order
+					self.curr_queryset = self.curr_queryset.only(*fields, ordering_field)
+				rows, next_cursor = keyset_page(self.curr_queryset, ordering, request.GET["cursor"], self.page_size)
+				orders = OrderSerializer(rows, many=True, fields=fields).data
+				order_count = len(orders)
+		except (ValueError, ValidationError):
+			return Response({"detail": "Invalid cursor", "data": None}, status=status.HTTP_400_BAD_REQUEST)
+
+		data = {"next_cursor": next_cursor, "length": order_count, "orders": orders}
+		return Response({"data": data}, status=status.HTTP_200_OK, headers=cache_headers(etag))
+
 	def get_page_param(self):
 		page_param = self.request.GET.get('page')
 		if not page_param or len(self.request.GET.getlist('page')) != 1:
@@ -69,13 +165,36 @@ class OrdersView(APIView):
 			return None
 
 	def get(self, request, **kwargs):
-		self.curr_queryset = Order.objects.filter(product_owner_id=request.user.id)
-		self.filter_data_by_query().filter_data_by_status().order_data()
+		order_fields = [field for field in OrderSerializer.Meta.fields if field != "ordered_products"]
+		try:
+			fields, expand = parse_sparse_fieldset(request, order_fields, expandable=["ordered_products"])
+		except ValueError as err:
+			return Response({"detail": str(err)}, status=status.HTTP_400_BAD_REQUEST)
+
+		self.curr_queryset = Order.objects.for_owner(request.user.id)
+		try:
+			self.filter_data_by_query().filter_data_by_status().filter_data_by_ranges().order_data()
+		except ValueError as err:
+			return Response({"detail": str(err), "data": None}, status=status.HTTP_400_BAD_REQUEST)
+		if fields:
+			# sparse orders only select the requested columns and their ordered products aren't fetched unless expanded
+			self.curr_queryset = self.curr_queryset.only(*fields)
+			if "ordered_products" in expand:
+				fields = fields + ["ordered_products"]
+			else:
+				self.curr_queryset = self.curr_queryset.prefetch_related(None)
+
+		etag = list_etag(request, self.curr_queryset)
+		if if_none_match(request, etag):
+			return not_modified_response(etag)
+
+		if "cursor" in request.GET: # an empty cursor requests the first page
+			return self.get_cursor_page(request, fields, etag)
 
 		page_param = self.get_page_param()
 
 		if page_param:
-			page_count = math.ceil(len(self.curr_queryset)/self.page_size)
+			page_count = math.ceil(self.curr_queryset.count()/self.page_size)
 			if (page_count < page_param) or (page_param <= 0):
 				return Response({"detail": "Page Not found", "data": None}, status=status.HTTP_404_NOT_FOUND)
 
@@ -83,9 +202,23 @@ class OrdersView(APIView):
 			self.curr_queryset = self.curr_queryset[offset:offset+self.page_size]
 		else:
 			page_count = 1
+			length = streamed_length(request, self.curr_queryset)
+			if length is not None:
+				data = {"page_count": 1, "next_page": None, "prev_page": None, "length": length, "orders": STREAMED_ARRAY}
+				return StreamingJSONResponse(
+					{"data": data}, self.curr_queryset.iterator(chunk_size=500),
+					lambda batch: OrderSerializer(batch, many=True, fields=fields).data, headers=cache_headers(etag)
+				)
+
+		if columnar_requested(request):
+			field_names = fields or OrderSerializer.Meta.fields
+			order_fields = [name for name in field_names if name != "ordered_products"]
+			orders = self.columnar_orders(list(self.curr_queryset.prefetch_related(None).values_list(*order_fields)), field_names)
+			order_count = len(orders["rows"])
+		else:
+			orders = OrderSerializer(list(self.curr_queryset), many=True, fields=fields).data
+			order_count = len(orders)
 
-		serializer = OrderSerializer(list(self.curr_queryset), many=True)
-		
 		if page_param and (page_param+1 <= page_count):
 			next_page = page_param + 1
 		else:
@@ -99,14 +232,29 @@ class OrdersView(APIView):
 			"page_count": page_count,
 			"next_page": next_page,
 			"prev_page": prev_page,
-			"length": len(serializer.data),
-			"orders": serializer.data
+			"length": order_count,
+			"orders": orders
 		}
-		return Response({"data": data}, status=status.HTTP_200_OK)
+		return Response({"data": data}, status=status.HTTP_200_OK, headers=cache_headers(etag))
+
+	def queue_order(self, request):
+		with transaction.atomic():
+			intake = OrderIntake.objects.create(owner=request.user, payload=request.data)
+			queue_intake_processing(request.user.id)
+		status_url = request.build_absolute_uri(reverse("order-intake", args=[request.version, intake.id]))
+		return Response(
+			{
+				"detail": "Order accepted for processing",
+				"data": {"id": intake.id, "status": intake.status, "status_url": status_url}
+			}, status=status.HTTP_202_ACCEPTED, headers={"Location": status_url}
+		)
 
 	def post(self, request, **kwargs):
 		order_serializer = OrderSerializer(data=request.data)
 		if order_serializer.is_valid():
+			if async_intake_requested(request):
+				# Only the payload's syntax is validated here, Inventory checks happen when a worker applies the order
+				return self.queue_order(request)
 			response = order_serializer.save(request.user)
 			errors = response.get("errors")
 			if not errors:
@@ -125,30 +273,81 @@ class OrdersView(APIView):
 			return Response({"detail": order_serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
 
+class OrderIntakeView(APIView):
+	parser_classes = [JSONParser]
+	permission_classes = [IsAuthenticated]
+
+	def get(self, request, intake_id, **kwargs):
+		try:
+			intake = OrderIntake.objects.for_owner(request.user.id).select_related("order").get(pk=intake_id)
+		except OrderIntake.DoesNotExist:
+			return Response({"detail": "Order intake not found"}, status=status.HTTP_404_NOT_FOUND)
+
+		data = {"id": intake.id, "status": intake.status, "errors": intake.errors, "order": None}
+		headers = {}
+		if intake.status == "Applied" and intake.order:
+			data["order"] = OrderSerializer(intake.order).data
+			headers["Location"] = request.build_absolute_uri(reverse("order", args=[request.version, intake.order.id]))
+		return Response({"data": data}, status=status.HTTP_200_OK, headers=headers)
+
+
+class BulkOrdersView(APIView):
+	parser_classes = [JSONParser]
+	permission_classes = [IsAuthenticated]
+
+	def put(self, request, **kwargs):
+		selection = BulkOrderStatusSerializer(data=request.data)
+		if not selection.is_valid():
+			return Response({"detail": selection.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+		orders = selection.filter_queryset(Order.objects.for_owner(request.user.id))
+		updated_count = orders.mark_delivered()
+		return Response({"detail": "Orders updated successfully", "data": {"updated": updated_count}}, status=status.HTTP_200_OK)
+
+	def delete(self, request, **kwargs):
+		selection = BulkOrderSelectionSerializer(data=request.data)
+		if not selection.is_valid():
+			return Response({"detail": selection.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+		orders = selection.filter_queryset(Order.objects.for_owner(request.user.id))
+		deleted_count = orders.delete_and_restock() # Only Pending orders are deleted, same as SingleOrderView.delete
+		return Response({"detail": "Orders deleted successfully", "data": {"deleted": deleted_count}}, status=status.HTTP_200_OK)
+
+
 class SingleOrderView(APIView):
 	parser_classes = [JSONParser]
 	permission_classes = [IsAuthenticated]
 
 	def get(self, request, order_id, **kwargs):
+		if request.headers.get("If-None-Match"):
+			# revalidating a cached copy only needs the version, not the order and its ordered products
+			version = Order.objects.for_owner(request.user.id).filter(pk=order_id).values_list("version", flat=True).first()
+			if version is not None and if_none_match(request, version_etag(version)):
+				return not_modified_response(version_etag(version))
 		try:
-			item = Order.objects.filter(product_owner_id=request.user.id).get(pk=order_id)
+			item = Order.objects.for_owner(request.user.id).get(pk=order_id)
 		except Order.DoesNotExist:
 			return Response({"detail": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
 		except Order.MultipleObjectsReturned: # This shouldn't be possible but it's handled anyways
 			return Response({"detail": "Something went wrong! Please try again"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-		return Response({"data": OrderSerializer(item).data}, status=status.HTTP_200_OK)
+		return Response({"data": OrderSerializer(item).data}, status=status.HTTP_200_OK, headers=cache_headers(etag_for(item)))
 
 	def put(self, request, order_id, **kwargs):
 		try:
-			order_to_edit = Order.objects.filter(product_owner_id=request.user.id).get(pk=order_id)
+			order_to_edit = Order.objects.for_owner(request.user.id).get(pk=order_id)
 		except Order.DoesNotExist:
 			return Response({"detail": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
 		except Order.MultipleObjectsReturned: # This shouldn't be possible but it's handled anyways
 			return Response({"detail": "Something went wrong! Please try again"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+		if if_match_failed(request, order_to_edit):
+			return precondition_failed_response(order_to_edit)
 		order_edits = OrderSerializer(order_to_edit, data=request.data, partial=True)
 
 		if order_edits.is_valid():
-			response = order_edits.save(request.user)
+			try:
+				response = order_edits.save(request.user)
+			except VersionConflict:
+				return version_conflict_response(request)
 			if (response.get("errors")):
 				status_code = status.HTTP_500_INTERNAL_SERVER_ERROR if response["errors"] == "Fatal error" else status.HTTP_400_BAD_REQUEST
 				return Response({"detail": response["errors"]}, status=status_code)
@@ -156,14 +355,14 @@ class SingleOrderView(APIView):
 				{
 					"detail": "Order created successfully",
 					"data": OrderSerializer(response["data"]).data
-				}, status=status.HTTP_200_OK
+				}, status=status.HTTP_200_OK, headers={"ETag": etag_for(response["data"])}
 			)
 		else:
 			return Response({"detail": order_edits.errors}, status=status.HTTP_400_BAD_REQUEST)
 
 	def delete(self, request, order_id, **kwargs):
 		try:
-			item = Order.objects.filter(product_owner_id=request.user.id).get(pk=order_id)
+			item = Order.objects.for_owner(request.user.id).get(pk=order_id)
 		except Order.DoesNotExist:
 			return Response({"detail": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
 		except Order.MultipleObjectsReturned: # This shouldn't be possible but it's handled anyways
@@ -186,13 +385,16 @@ class OrderedProductsView(APIView):
 
 	def post(self, request, order_id, **kwargs):
 		try:
-			order = Order.objects.filter(product_owner_id=request.user.id).get(pk=order_id)
+			order = Order.objects.for_owner(request.user.id).get(pk=order_id)
 		except Order.DoesNotExist:
 			return Response({"detail": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
 
 		ordered_product_serializer = OrderedProductSerializer(data=request.data)
 		if (ordered_product_serializer.is_valid()):
-			save_results = ordered_product_serializer.save(order)
+			try:
+				save_results = ordered_product_serializer.save(order)
+			except VersionConflict:
+				return version_conflict_response(request)
 			if save_results.get("errors"):
 				return Response({"detail": save_results["errors"]}, status=status.HTTP_400_BAD_REQUEST)
 			return Response({"detail": "product added to Order successfully"}, status=status.HTTP_201_CREATED)
@@ -206,7 +408,7 @@ class SingleOrderedProductView(APIView):
 
 	def get(self, request, order_id, product_id, **kwargs):
 		try:
-			order = Order.objects.filter(product_owner_id=request.user.id).get(pk=order_id)
+			order = Order.objects.for_owner(request.user.id).get(pk=order_id)
 			product = order.ordered_products.get(pk=product_id)
 		except Order.DoesNotExist:
 			return Response({"detail": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
@@ -214,11 +416,14 @@ class SingleOrderedProductView(APIView):
 			return Response({"detail": "Ordered Product not found"}, status=status.HTTP_404_NOT_FOUND)
 		except (Order.MultipleObjectsReturned, OrderedProduct.MultipleObjectsReturned): # This shouldn't be possible but it's handled anyways
 			return Response({"detail": "Something went wrong! Please try again"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-		return Response({"data": OrderedProductSerializer(product).data}, status=status.HTTP_200_OK)
+		# ordered products aren't versioned. Their changes are guarded by the version of the order they belong to
+		if if_none_match(request, etag_for(order)):
+			return not_modified_response(etag_for(order))
+		return Response({"data": OrderedProductSerializer(product).data}, status=status.HTTP_200_OK, headers=cache_headers(etag_for(order)))
 
 	def put(self, request, order_id, product_id, **kwargs):
 		try:
-			order = Order.objects.filter(product_owner_id=request.user.id).get(pk=order_id)
+			order = Order.objects.for_owner(request.user.id).get(pk=order_id)
 			product = order.ordered_products.get(pk=product_id)
 		except Order.DoesNotExist:
 			return Response({"detail": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
@@ -226,19 +431,26 @@ class SingleOrderedProductView(APIView):
 			return Response({"detail": "Ordered Product not found"}, status=status.HTTP_404_NOT_FOUND)
 		except (Order.MultipleObjectsReturned, OrderedProduct.MultipleObjectsReturned): # This shouldn't be possible but it's handled anyways
 			return Response({"data": "Something went wrong! Please try again"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+		if if_match_failed(request, order):
+			return precondition_failed_response(order)
 		product_edit = OrderedProductSerializer(product, data=request.data, partial=True)
 
 		if product_edit.is_valid():
-			update_results = product_edit.save()
+			try:
+				update_results = product_edit.save()
+			except VersionConflict:
+				return version_conflict_response(request)
 			if update_results.get("errors"):
 				return Response({"detail": update_results["errors"]}, status=status.HTTP_400_BAD_REQUEST)
-			return Response({"detail": OrderedProductSerializer(update_results["data"]).data}, status=status.HTTP_200_OK)
+			return Response(
+				{"detail": OrderedProductSerializer(update_results["data"]).data}, status=status.HTTP_200_OK, headers={"ETag": etag_for(order)}
+			)
 		else:
 			return Response({"detail": product_edit.errors}, status=status.HTTP_400_BAD_REQUEST)
 
 	def delete(self, request, order_id, product_id, **kwargs):
 		try:
-			item = Order.objects.filter(product_owner_id=request.user.id).get(pk=order_id)
+			item = Order.objects.for_owner(request.user.id).get(pk=order_id)
 			product = item.ordered_products.get(pk=product_id)
 		except Order.DoesNotExist:
 			return Response({"detail": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
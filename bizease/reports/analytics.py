@@ -0,0 +1,285 @@
+"""
+In-memory analytics over a tenant's delivered orders.
+
+A tenant's delivered orders and their ordered products are loaded once into numpy column arrays: order dates as int32
+day numbers (days since 1970-01-01), prices as int64 minor units and products as int32 codes. Revenue series, top
+products, period comparisons and per product summaries are then vectorized group-bys over the arrays instead of one
+aggregate query each. Both sets of arrays are sorted by date, so a date range is two binary searches and the revenue
+of any range is a difference of prefix sums. The columns are only used when the REPORT_ANALYTICS setting is enabled.
+
+The columns are cached per tenant in the process, for at most REPORT_ANALYTICS_CACHE_SIZE tenants, together with the
+version of the data they were loaded from. The version is the fingerprint of the tenant's delivered orders (see
+reports.snapshots) with their revenue and date span, plus the count and max id of its inventory items, since deleting
+an item unlinks its ordered products. Every request checks the version with two aggregate queries and reloads the
+columns if it changed. Product names and stock statuses aren't cached; they're read from the inventory when needed.
+"""
+from django.conf import settings
+from django.db.models import Count, Max, Min, Sum, F, Q, BigIntegerField
+from django.db.models.functions import Cast, Round
+from cachetools import LRUCache
+from inventory.models import Inventory
+from orders.models import Order, OrderedProduct
+from bizease import metrics
+from .snapshots import fingerprint_aggregates, orders_fingerprint
+from datetime import date, timedelta
+from decimal import Decimal
+import numpy as np
+import threading
+
+
+EPOCH = date(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+MINOR_UNITS = 100 # prices have 2 decimal places
+EXACT_FLOAT_LIMIT = 2 ** 53 # integers up to this are exact as float64
+
+
+def analytics_enabled():
+    return getattr(settings, "REPORT_ANALYTICS", False)
+
+
+def day_number(day):
+    return (day - EPOCH).days
+
+
+def from_day_number(number):
+    return EPOCH + timedelta(days=int(number))
+
+
+def from_minor_units(value):
+    return Decimal(int(value)).scaleb(-2)
+
+
+def minor_units(field):
+    """ The value of a decimal field in minor units, converted by the database so no Decimal is made per row """
+    return Cast(Round(F(field) * MINOR_UNITS), BigIntegerField())
+
+
+def column(rows, index, dtype):
+    return np.fromiter((row[index] for row in rows), dtype=dtype, count=len(rows))
+
+
+def product_codes(item_ids, names):
+    """
+    An int32 code per ordered product for the product it's counted under and the (inventory item id, name) of every
+    code. Ordered products are grouped the same way OrderedProductQuerySet.group_by_product groups them: by inventory
+    item, or by name when the item no longer exists. 'item_ids' is -1 for the latter
+    """
+    linked = item_ids >= 0
+    unique_ids, first_lines, codes = np.unique(item_ids[linked], return_index=True, return_inverse=True)
+    line_codes = np.empty(len(item_ids), dtype=np.int32)
+    line_codes[linked] = codes
+    linked_lines = np.flatnonzero(linked)
+    products = [(int(item_id), names[linked_lines[line]]) for item_id, line in zip(unique_ids, first_lines)]
+
+    unlinked_codes = {}
+    for line in np.flatnonzero(~linked).tolist():
+        code = unlinked_codes.get(names[line])
+        if code is None:
+            code = unlinked_codes[names[line]] = len(products)
+            products.append((None, names[line]))
+        line_codes[line] = code
+    return line_codes, products
+
+
+def date_slice(days, start_date, end_date):
+    """ The slice of the sorted day numbers 'days' from start_date to end_date (either may be None for unbounded) """
+    start = 0 if start_date is None else int(np.searchsorted(days, day_number(start_date), side="left"))
+    end = len(days) if end_date is None else int(np.searchsorted(days, day_number(end_date), side="right"))
+    return slice(start, max(start, end))
+
+
+def group_sum(codes, values, size):
+    """ The sums of the int64 'values' per code (0 to size - 1). Exact, bincount is only used while floats are """
+    if len(values) == 0 or int(values.sum()) < EXACT_FLOAT_LIMIT:
+        return np.rint(np.bincount(codes, weights=values, minlength=size)).astype(np.int64)
+    sums = np.zeros(size, dtype=np.int64)
+    np.add.at(sums, codes, values)
+    return sums
+
+
+def bucket_starts(days, bucket):
+    """ The day number of the start of the bucket each day number falls in. Weeks start on monday """
+    if bucket == "week":
+        return days - (days + 3) % 7 # 1970-01-01 was a thursday
+    if bucket == "month":
+        return days.astype("datetime64[D]").astype("datetime64[M]").astype("datetime64[D]").astype(np.int32)
+    return days
+
+
+class TenantColumns:
+    """ The delivered orders and ordered products of a tenant as column arrays, each sorted by order date """
+
+    def __init__(self, owner_id, order_days, order_revenue, line_days, line_products, line_quantities, line_revenue, products):
+        self.owner_id = owner_id
+        self.order_days = order_days
+        self.order_revenue = order_revenue
+        self.revenue_prefix = np.concatenate(([0], np.cumsum(order_revenue, dtype=np.int64)))
+        self.line_days = line_days
+        self.line_products = line_products
+        self.line_quantities = line_quantities
+        self.line_revenue = line_revenue
+        # (inventory item id, name) of every product code. Products are keyed the same way
+        # OrderedProductQuerySet.group_by_product groups ordered products, the name is the one they were first sold as
+        self.products = products
+
+    @classmethod
+    def load(cls, owner_id):
+        orders = list(
+            Order.objects.for_owner(owner_id).filter(status="Delivered").order_by("id")
+            .annotate(revenue=minor_units("total_price")).values_list("id", "order_date", "revenue")
+        )
+        # dates are read once per order, the ordered products get theirs through their order
+        lines = list(
+            OrderedProduct.objects.for_owner(owner_id).filter(order_id__status="Delivered").order_by()
+            .annotate(revenue=minor_units("cummulative_price")).values_list("order_id", "inventory_item", "name", "quantity", "revenue")
+        )
+
+        order_ids = column(orders, 0, np.int64)
+        order_days = np.fromiter((row[1].toordinal() - EPOCH_ORDINAL for row in orders), dtype=np.int32, count=len(orders))
+        order_revenue = column(orders, 2, np.int64)
+
+        line_order_ids = column(lines, 0, np.int64)
+        line_orders = np.searchsorted(order_ids, line_order_ids)
+        # ordered products of orders delivered after the orders were read are left out. The data version read before
+        # loading the columns doesn't count those orders either so the columns are reloaded on the next request
+        loaded = line_orders < len(order_ids)
+        loaded[loaded] = order_ids[line_orders[loaded]] == line_order_ids[loaded]
+        line_products, products = product_codes(
+            np.fromiter((-1 if row[1] is None else row[1] for row in lines), dtype=np.int64, count=len(lines)), [row[2] for row in lines]
+        )
+        line_days = order_days[line_orders[loaded]]
+
+        order_sort = np.argsort(order_days, kind="stable") # by date, then by id
+        line_sort = np.argsort(line_days, kind="stable")
+        return cls(
+            owner_id=owner_id,
+            order_days=order_days[order_sort],
+            order_revenue=order_revenue[order_sort],
+            line_days=line_days[line_sort],
+            line_products=line_products[loaded][line_sort],
+            line_quantities=column(lines, 3, np.int64)[loaded][line_sort],
+            line_revenue=column(lines, 4, np.int64)[loaded][line_sort],
+            products=products,
+        )
+
+    def revenue_sum(self, start_date=None, end_date=None):
+        """ The revenue of the orders from start_date to end_date, None if there are none (the same as an SQL SUM) """
+        rows = date_slice(self.order_days, start_date, end_date)
+        if rows.start == rows.stop:
+            return None
+        return from_minor_units(self.revenue_prefix[rows.stop] - self.revenue_prefix[rows.start])
+
+    def bucketed_revenue(self, bucket, start_date=None, end_date=None):
+        """ (bucket start date, revenue) of every bucket that has orders, oldest first. See reports.timeseries.bucketed_revenue """
+        rows = date_slice(self.order_days, start_date, end_date)
+        buckets = bucket_starts(self.order_days[rows], bucket)
+        if len(buckets) == 0:
+            return []
+        # the days are sorted so the orders of a bucket are contiguous
+        first_rows = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+        sums = np.add.reduceat(self.order_revenue[rows], first_rows)
+        return [(from_day_number(buckets[index]), from_minor_units(total)) for index, total in zip(first_rows, sums)]
+
+    def order_revenue_rows(self, start_date=None, end_date=None):
+        """ (order date, revenue) of every order from start_date to end_date, newest first """
+        rows = date_slice(self.order_days, start_date, end_date)
+        return [
+            (from_day_number(day), from_minor_units(revenue))
+            for day, revenue in zip(self.order_days[rows][::-1], self.order_revenue[rows][::-1])
+        ]
+
+    def product_totals(self, start_date=None, end_date=None):
+        """ The codes of the products sold from start_date to end_date with their units sold and revenue (minor units) """
+        rows = date_slice(self.line_days, start_date, end_date)
+        products = self.line_products[rows]
+        quantities = group_sum(products, self.line_quantities[rows], len(self.products))
+        revenue = group_sum(products, self.line_revenue[rows], len(self.products))
+        sold = np.flatnonzero(quantities)
+        return sold, quantities[sold], revenue[sold]
+
+    def top_products(self, start_date=None, end_date=None, limit=1):
+        """ (code, units sold) of the 'limit' best selling products from start_date to end_date """
+        codes, quantities, _ = self.product_totals(start_date, end_date)
+        best = np.argsort(-quantities, kind="stable")[:limit]
+        return [(int(codes[index]), int(quantities[index])) for index in best]
+
+    def describe_products(self, codes):
+        """ The current name and stock status of the products with the given codes, keyed by code """
+        item_ids = {self.products[code][0] for code in codes} - {None}
+        items = {
+            item_id: (product_name, stock_level < low_stock_threshold)
+            for item_id, product_name, stock_level, low_stock_threshold in Inventory.objects.for_owner(self.owner_id)
+            .filter(id__in=item_ids).order_by().values_list("id", "product_name", "stock_level", "low_stock_threshold")
+        }
+        descriptions = {}
+        for code in codes:
+            item_id, name = self.products[code]
+            if item_id in items:
+                product_name, low_stock = items[item_id]
+                descriptions[code] = (product_name, "low stock" if low_stock else "in stock")
+            else: # not in the inventory (anymore)
+                descriptions[code] = (name, "out of stock")
+        return descriptions
+
+    def top_product_names(self, date_ranges):
+        """ The name of the best selling product of every (start_date, end_date) range, None for ranges without sales """
+        top_codes = [next((code for code, _ in self.top_products(start_date, end_date, 1)), None) for start_date, end_date in date_ranges]
+        descriptions = self.describe_products({code for code in top_codes if code is not None})
+        return [descriptions[code][0] if code is not None else None for code in top_codes]
+
+    def product_sales(self, start_date=None, end_date=None):
+        """ (name, units sold) of every product sold from start_date to end_date """
+        codes, quantities, _ = self.product_totals(start_date, end_date)
+        descriptions = self.describe_products(codes.tolist())
+        return [(descriptions[code][0], int(quantity)) for code, quantity in zip(codes.tolist(), quantities)]
+
+    def product_summary(self, start_date=None, end_date=None):
+        """ (name, units sold, revenue, stock status) of every product sold from start_date to end_date, ordered by name """
+        codes, quantities, revenue = self.product_totals(start_date, end_date)
+        descriptions = self.describe_products(codes.tolist())
+        rows = [
+            (descriptions[code][0], int(quantity), from_minor_units(total), descriptions[code][1])
+            for code, quantity, total in zip(codes.tolist(), quantities, revenue)
+        ]
+        return sorted(rows, key=lambda row: row[0])
+
+
+def data_version(owner_id):
+    orders = Order.objects.for_owner(owner_id).order_by().filter(status="Delivered").aggregate(
+        revenue=Sum("total_price"), first_day=Min("order_date"), last_day=Max("order_date"), **fingerprint_aggregates(Q())
+    )
+    inventory = Inventory.objects.for_owner(owner_id).aggregate(count=Count("id"), last_id=Max("id"))
+    return (
+        f"{orders_fingerprint(orders)}:{orders['revenue']}:{orders['first_day']}:{orders['last_day']}:"
+        f"{inventory['count']}:{inventory['last_id']}"
+    )
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def clear_cache():
+    global _cache
+    with _cache_lock:
+        _cache = None
+
+
+def tenant_columns(owner_id):
+    """ The columns of a tenant, loaded from the database only if they aren't cached or its data changed since """
+    global _cache
+    version = data_version(owner_id)
+    with _cache_lock:
+        if _cache is None:
+            _cache = LRUCache(maxsize=getattr(settings, "REPORT_ANALYTICS_CACHE_SIZE", 64))
+        cached = _cache.get(owner_id)
+    if cached is not None and cached[0] == version:
+        metrics.incr("analytics.columns.hits")
+        return cached[1]
+
+    metrics.incr("analytics.columns.loads")
+    # the version is read before the columns so data written in between makes the next request reload them
+    columns = TenantColumns.load(owner_id)
+    with _cache_lock:
+        _cache[owner_id] = (version, columns)
+    return columns
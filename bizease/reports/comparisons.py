@@ -0,0 +1,184 @@
+"""
+Period comparisons for reports.
+
+A report period can be compared with any number of comparison windows: the preceding window of the same length
+('previous') and the same dates one year earlier ('yoy'). The revenue of the period and of every window is computed
+by one query over the orders with one conditional aggregate (SUM(...) FILTER (WHERE ...)) per window, and the
+stock values by one such query over the inventory.
+
+summarize_periods() does the same for the report cards of several periods at once, e.g the last week, month and year
+shown side by side, so the cost of a batch of cards is about the cost of one.
+"""
+from django.db.models import Sum, Count, F, Q
+from inventory.models import Inventory
+from orders.models import Order, OrderedProduct
+from datetime import timedelta
+
+
+def previous_window(start_date, end_date):
+    """ The window of the same number of days that ends the day before start_date """
+    length = end_date - start_date + timedelta(days=1)
+    return start_date - length, start_date - timedelta(days=1)
+
+
+def one_year_earlier(day):
+    try:
+        return day.replace(year=day.year - 1)
+    except ValueError: # the 29th of february
+        return day.replace(year=day.year - 1, day=28)
+
+
+def year_over_year_window(start_date, end_date):
+    return one_year_earlier(start_date), one_year_earlier(end_date)
+
+
+COMPARISONS = {"previous": previous_window, "yoy": year_over_year_window}
+
+
+def parse_comparisons(params):
+    """ The comparison windows requested with 'compare' (a comma separated list), 'previous' if it's absent """
+    compare = params.get("compare")
+    if compare is None:
+        return ["previous"]
+    names = list(dict.fromkeys(name.strip() for name in compare.split(",") if name.strip()))
+    if not names or any(name not in COMPARISONS for name in names) or len(params.getlist("compare")) != 1:
+        raise ValueError("Invalid value for compare parameter")
+    return names
+
+
+def percentage_change(value, previous_value):
+    if not previous_value:
+        return None
+    return round(((value - previous_value) / previous_value) * 100, 2)
+
+
+def compare_periods(owner_id, start_date, end_date, comparison_names, columns=None):
+    """
+    Returns the revenue (of delivered orders) and stock value of the period from start_date to end_date and a list
+    with the same totals and their percentage changes for each comparison window. The period is all time if the
+    dates are None, in which case there's nothing to compare with. Revenue is read from the tenant's
+    reports.analytics columns instead of the database if they're given.
+
+    The stock value of the period counts the items added until its end. Comparison windows are valued with the
+    items added until their start.
+    """
+    windows = []
+    if start_date and end_date:
+        windows = [(name, *COMPARISONS[name](start_date, end_date)) for name in comparison_names]
+
+    orders = Order.objects.for_owner(owner_id).filter(status="Delivered")
+    inventory = Inventory.objects.for_owner(owner_id)
+    if start_date and end_date:
+        # only the span covering the period and its windows is scanned
+        first_day = min([start_date] + [window_start for _, window_start, _ in windows])
+        last_day = max([end_date] + [window_end for _, _, window_end in windows])
+        orders = orders.filter(order_date__range=(first_day, last_day))
+        period_orders = Q(order_date__range=(start_date, end_date))
+        period_stock = Q(date_added__lte=end_date)
+    else:
+        period_orders = period_stock = Q()
+
+    if columns is not None:
+        revenue = {
+            "period": columns.revenue_sum(start_date, end_date),
+            **{name: columns.revenue_sum(window_start, window_end) for name, window_start, window_end in windows}
+        }
+    else:
+        revenue = orders.aggregate(
+            period=Sum("total_price", filter=period_orders),
+            **{name: Sum("total_price", filter=Q(order_date__range=(window_start, window_end))) for name, window_start, window_end in windows}
+        )
+    stock_value = inventory.aggregate(
+        period=Sum(F("price") * F("stock_level"), filter=period_stock),
+        **{name: Sum(F("price") * F("stock_level"), filter=Q(date_added__lte=window_start)) for name, window_start, _ in windows}
+    )
+
+    totals = {"revenue": revenue["period"] or 0, "stock_value": stock_value["period"] or 0, "comparisons": []}
+    for name, window_start, window_end in windows:
+        window_revenue = revenue[name] or 0
+        window_stock_value = stock_value[name] or 0
+        totals["comparisons"].append({
+            "compare": name,
+            "start_date": window_start,
+            "end_date": window_end,
+            "revenue": window_revenue,
+            "revenue_change": percentage_change(totals["revenue"], window_revenue),
+            "stock_value": window_stock_value,
+            "stock_value_change": percentage_change(totals["stock_value"], window_stock_value),
+        })
+    return totals
+
+
+def summarize_periods(owner_id, periods, columns=None):
+    """
+    Returns the report card (totals, top selling product, pending orders and changes from the previous window) of every
+    (name, start_date, end_date) period, keyed by name. Three queries are made whatever the number of periods: one
+    over the orders and one over the ordered products of delivered orders, both restricted to the span of all periods
+    and their previous windows, and one over the inventory. Each has one conditional aggregate per period and window.
+    If the tenant's reports.analytics columns are given, revenue and top selling products are read from them instead.
+    """
+    windows = [(name, start_date, end_date, *previous_window(start_date, end_date)) for name, start_date, end_date in periods]
+    first_day = min(window[3] for window in windows)
+    last_day = max(window[2] for window in windows)
+
+    order_aggregates = {}
+    for index, (_, start_date, end_date, previous_start, previous_end) in enumerate(windows):
+        order_aggregates[f"pending_{index}"] = Count("id", filter=Q(status="Pending", order_date__range=(start_date, end_date)))
+        if columns is None:
+            order_aggregates[f"revenue_{index}"] = Sum("total_price", filter=Q(status="Delivered", order_date__range=(start_date, end_date)))
+            order_aggregates[f"previous_revenue_{index}"] = Sum(
+                "total_price", filter=Q(status="Delivered", order_date__range=(previous_start, previous_end))
+            )
+    orders = Order.objects.for_owner(owner_id).order_by().filter(order_date__range=(first_day, last_day)).aggregate(**order_aggregates)
+    if columns is not None:
+        for index, (_, start_date, end_date, previous_start, previous_end) in enumerate(windows):
+            orders[f"revenue_{index}"] = columns.revenue_sum(start_date, end_date)
+            orders[f"previous_revenue_{index}"] = columns.revenue_sum(previous_start, previous_end)
+        top_products = [(name, None) for name in columns.top_product_names([(window[1], window[2]) for window in windows])]
+    else:
+        top_products = [(None, 0)] * len(windows)
+        product_sales = (
+            OrderedProduct.objects.for_owner(owner_id)
+            .filter(order_id__status="Delivered", order_id__order_date__range=(min(window[1] for window in windows), last_day))
+            .group_by_product()
+            .annotate(**{
+                f"sold_{index}": Sum("quantity", filter=Q(order_id__order_date__range=(start_date, end_date)))
+                for index, (_, start_date, end_date, _, _) in enumerate(windows)
+            })
+        )
+        for row in product_sales:
+            for index, (_, top_sold) in enumerate(top_products):
+                if (row[f"sold_{index}"] or 0) > top_sold:
+                    top_products[index] = (row["product_name"], row[f"sold_{index}"])
+
+    stock_aggregates = {
+        alias: aggregate
+        for index, (_, _, end_date, previous_start, _) in enumerate(windows)
+        for alias, aggregate in [
+            (f"stock_{index}", Sum(F("price") * F("stock_level"), filter=Q(date_added__lte=end_date))),
+            # valued as of the start of the previous window, the same as compare_periods() does
+            (f"previous_stock_{index}", Sum(F("price") * F("stock_level"), filter=Q(date_added__lte=previous_start))),
+        ]
+    }
+    stock_value = Inventory.objects.for_owner(owner_id).aggregate(
+        total=Count("id"), low_stock=Count("id", filter=Q(stock_level__lte=F("low_stock_threshold"))), **stock_aggregates
+    )
+
+    cards = {}
+    for index, (name, start_date, end_date, _, _) in enumerate(windows):
+        revenue = orders[f"revenue_{index}"] or 0
+        total_stock_value = stock_value[f"stock_{index}"] or 0
+        cards[name] = {
+            "period": name,
+            "start_date": start_date,
+            "end_date": end_date,
+            "total_products": stock_value["total"],
+            "low_stock_items": stock_value["low_stock"],
+            "top_selling_product": top_products[index][0],
+            "pending_orders": orders[f"pending_{index}"],
+            "total_stock_value": total_stock_value,
+            "stock_value_change": percentage_change(total_stock_value, stock_value[f"previous_stock_{index}"] or 0),
+            "total_revenue": revenue,
+            "revenue_change": percentage_change(revenue, orders[f"previous_revenue_{index}"] or 0),
+        }
+    return cards
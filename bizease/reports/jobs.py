@@ -0,0 +1,186 @@
+"""
+Asynchronous report generation.
+
+Reports that are too slow to compute within a request are queued as ReportJobs, each computed by a
+'reports.run_report_job' background job (see jobs.queue) run by python manage.py run_worker. A job that is identical
+to one that's queued, running or completed and not yet expired (same owner, report and parameters) isn't queued again,
+the existing job is returned instead.
+
+Clients queue jobs with ReportJobsView and poll ReportJobView for their status and result.
+"""
+from django.conf import settings
+from django.db.models import Q
+from django.http import QueryDict
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework.views import APIView
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework import status
+from accounts.models import CustomUser
+from bizease.parsers import JSONParser
+from bizease.transactions import run_in_transaction, lock_rows
+from jobs.queue import enqueue
+from .models import ReportJob
+from .views import build_report, build_summary, process_GET_parameters, process_chart_parameters
+from .comparisons import parse_comparisons
+from datetime import timedelta
+import hashlib
+import orjson
+
+
+REPORT_PARAMETERS = {
+    "report": ("period", "start_date", "end_date", "bucket", "max_points", "compare"),
+    "summary": ("period", "start_date", "end_date"),
+}
+BUILDERS = {"report": build_report, "summary": build_summary}
+
+
+def result_ttl():
+    return timedelta(seconds=getattr(settings, "REPORT_JOB_RESULT_TTL", 3600))
+
+
+def as_query_dict(params):
+    query_dict = QueryDict(mutable=True)
+    query_dict.update(params)
+    return query_dict
+
+
+def normalize_params(report, params):
+    """
+    Validates the parameters of a report job the same way the report's view validates its query parameters and
+    returns them as a dict of strings. Raises ValueError if the report or any parameter is invalid
+    """
+    if not isinstance(report, str) or report not in REPORT_PARAMETERS:
+        raise ValueError(f"Invalid report. Use one of {', '.join(REPORT_PARAMETERS)}")
+    if not isinstance(params, dict):
+        raise ValueError("params must be an object")
+    unknown_params = [name for name in params if name not in REPORT_PARAMETERS[report]]
+    if unknown_params:
+        raise ValueError(f"Unknown parameter(s): {', '.join(unknown_params)}")
+    if any(not isinstance(value, (str, int)) or isinstance(value, bool) for value in params.values()):
+        raise ValueError("Parameter values must be strings or integers")
+
+    params = {name: str(value) for name, value in params.items()}
+    query_dict = as_query_dict(params)
+    range_dict = process_GET_parameters(query_dict)
+    if range_dict.get("error"):
+        raise ValueError(range_dict["error"])
+    if report == "report":
+        process_chart_parameters(query_dict)
+        parse_comparisons(query_dict)
+    return params
+
+
+def params_hash(report, params):
+    return hashlib.sha256(orjson.dumps([report, sorted(params.items())])).hexdigest()
+
+
+def enqueue_report_job(owner_id, report, params):
+    """
+    Returns (job, created). The job is an existing identical job that's queued, running or has an unexpired result if
+    there's one. params must already be normalized
+    """
+    job_hash = params_hash(report, params)
+
+    def find_or_create():
+        # identical requests of an owner are serialized so they can't both miss each other's job
+        lock_rows(CustomUser.objects.filter(pk=owner_id))
+        existing_job = (
+            ReportJob.objects.for_owner(owner_id).filter(params_hash=job_hash)
+            .filter(Q(status__in=["Queued", "Running"]) | Q(status="Completed", expires_at__gt=timezone.now()))
+            .order_by("-id").first()
+        )
+        if existing_job:
+            return existing_job, False
+        job = ReportJob.objects.create(owner_id=owner_id, report=report, params=params, params_hash=job_hash)
+        enqueue("reports.run_report_job", {"job_id": job.id})
+        return job, True
+
+    return run_in_transaction(find_or_create, name="report_job_enqueue")
+
+
+def claim_job(job_id):
+    """ Atomically moves a queued job to 'Running'. Returns False if another worker got to it first """
+    return ReportJob.objects.unscoped().filter(pk=job_id, status="Queued").update(status="Running", started_at=timezone.now()) == 1
+
+
+def run_job(job):
+    """ Computes the report of a claimed job and stores its result (or its error) """
+    try:
+        job.set_result(BUILDERS[job.report](job.owner_id, as_query_dict(job.params)))
+        job.status = "Completed"
+    except Exception as err:
+        job.status, job.error, job.result = "Failed", str(err) or err.__class__.__name__, None
+    job.finished_at = timezone.now()
+    job.expires_at = job.finished_at + result_ttl()
+    job.save(update_fields=["status", "result", "error", "finished_at", "expires_at"])
+    return job
+
+
+def requeue_stale_jobs():
+    """ Jobs left 'Running' by a worker that died are queued again so identical requests don't wait on them forever """
+    stale_after = timedelta(seconds=getattr(settings, "REPORT_JOB_TIMEOUT", 900))
+    stale_ids = list(
+        ReportJob.objects.unscoped().filter(status="Running", started_at__lt=timezone.now() - stale_after).values_list("id", flat=True)
+    )
+    requeued = ReportJob.objects.unscoped().filter(id__in=stale_ids, status="Running").update(status="Queued", started_at=None)
+    # a job that finished in the meantime isn't claimed again, its background job does nothing
+    for job_id in stale_ids:
+        enqueue("reports.run_report_job", {"job_id": job_id})
+    return requeued
+
+
+def purge_expired_jobs():
+    return ReportJob.objects.unscoped().filter(expires_at__lt=timezone.now()).delete()[0]
+
+
+def job_data(request, job):
+    data = {
+        "id": job.id,
+        "report": job.report,
+        "params": job.params,
+        "status": job.status,
+        "status_url": request.build_absolute_uri(reverse("report-job", args=[request.version, job.id])),
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+        "expires_at": job.expires_at,
+    }
+    if job.status == "Failed":
+        data["error"] = job.error
+    return data
+
+
+class ReportJobsView(APIView):
+    parser_classes = [JSONParser]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, **kwargs):
+        body = request.data if isinstance(request.data, dict) else {}
+        report = body.get("report", "report")
+        try:
+            params = normalize_params(report, body.get("params", {}))
+        except ValueError as err:
+            return Response({"detail": str(err)}, status=status.HTTP_400_BAD_REQUEST)
+
+        job, created = enqueue_report_job(request.user.id, report, params)
+        data = job_data(request, job)
+        headers = {"Location": data["status_url"]}
+        if job.status == "Completed":
+            return Response({"detail": "Report already available", "data": data}, status=status.HTTP_200_OK, headers=headers)
+        detail = "Report queued for processing" if created else "An identical report is already being processed"
+        return Response({"detail": detail, "data": data}, status=status.HTTP_202_ACCEPTED, headers=headers)
+
+
+class ReportJobView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id, **kwargs):
+        try:
+            job = ReportJob.objects.for_owner(request.user.id).exclude(expires_at__lt=timezone.now()).get(pk=job_id)
+        except ReportJob.DoesNotExist:
+            return Response({"detail": "Report job not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        data = job_data(request, job)
+        data["result"] = job.get_result() if job.status == "Completed" else None
+        return Response({"data": data}, status=status.HTTP_200_OK)
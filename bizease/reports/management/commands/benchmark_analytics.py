@@ -0,0 +1,119 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.http import QueryDict
+from django.test import override_settings
+from accounts.models import CustomUser
+from inventory.models import Inventory
+from orders.models import Order, OrderedProduct
+from reports.views import build_report, build_summary
+from reports.comparisons import summarize_periods
+from reports.analytics import analytics_enabled, tenant_columns, clear_cache
+from datetime import date, timedelta
+from decimal import Decimal
+import random
+import timeit
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the database aggregates of reports with the numpy columns of reports.analytics, for tenants with "
+        "different numbers of ordered products. The data is created for the benchmark and rolled back once it's done"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--line-items", default="10000,100000,1000000", help="Comma separated numbers of ordered products to benchmark with")
+        parser.add_argument("--products", type=int, default=200, help="Number of inventory items")
+        parser.add_argument("--lines-per-order", type=int, default=3, help="Number of ordered products per order")
+        parser.add_argument("--days", type=int, default=730, help="Number of days the orders are spread over")
+        parser.add_argument("--repeat", type=int, default=5, help="Number of times each operation is timed")
+
+    def create_tenant(self, line_items, options):
+        rng = random.Random(line_items)
+        owner = CustomUser.objects.create(
+            business_name="benchmark-biz", full_name="benchmark", email=f"benchmark{line_items}@bizease.invalid", is_active=True
+        )
+        first_day = date.today() - timedelta(days=options["days"] - 1)
+        items = Inventory.objects.bulk_create([
+            Inventory(
+                owner=owner, product_name=f"Product {index}", price=Decimal(rng.randint(10000, 5000000)) / 100,
+                stock_level=rng.randint(0, 500), date_added=first_day
+            )
+            for index in range(options["products"])
+        ])
+
+        lines_per_order = min(options["lines_per_order"], len(items))
+        order_count = max(1, line_items // lines_per_order)
+        batch_size = 5000
+        for start in range(0, order_count, batch_size):
+            carts = [
+                [(item, rng.randint(1, 10)) for item in rng.sample(items, lines_per_order)]
+                for _ in range(min(batch_size, order_count - start))
+            ]
+            orders = Order.objects.bulk_create([
+                Order(
+                    product_owner_id=owner, client_name="client", status="Delivered",
+                    order_date=first_day + timedelta(days=rng.randrange(options["days"])),
+                    total_price=sum(item.price * quantity for item, quantity in cart)
+                )
+                for cart in carts
+            ])
+            OrderedProduct.objects.bulk_create([
+                OrderedProduct(
+                    order_id=order, inventory_item=item, name=item.product_name, quantity=quantity, price=item.price,
+                    cummulative_price=item.price * quantity
+                )
+                for order, cart in zip(orders, carts) for item, quantity in cart
+            ])
+        return owner
+
+    def time(self, label, func, repeat, baseline=None):
+        seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+        speedup = f" ({baseline / seconds:.1f}x)" if baseline else ""
+        self.stdout.write(f"{label:<72}{seconds * 1000:>10.2f} ms{speedup}")
+        return seconds
+
+    def compare(self, label, func, repeat):
+        """ Times func on the database path, then on the analytics path with cold and warm column caches """
+        with override_settings(REPORT_ANALYTICS=False):
+            database = self.time(f"{label} (database)", func, repeat)
+        with override_settings(REPORT_ANALYTICS=True):
+            self.time(f"{label} (analytics, columns loaded)", lambda: (clear_cache(), func()), repeat, database)
+            func()
+            self.time(f"{label} (analytics, columns cached)", func, repeat, database)
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options["line_items"].split(",") if size.strip()]
+        except ValueError:
+            raise CommandError("--line-items must be a comma separated list of numbers")
+        if not sizes or min(sizes) < 1 or options["products"] < 1 or options["lines_per_order"] < 1 or options["days"] < 1:
+            raise CommandError("--line-items, --products, --lines-per-order and --days must be at least 1")
+
+        repeat = options["repeat"]
+        for line_items in sizes:
+            with transaction.atomic():
+                owner = self.create_tenant(line_items, options)
+                today = date.today()
+                report_params = QueryDict(mutable=True)
+                report_params.update({
+                    "start_date": (today - timedelta(days=180)).isoformat(), "end_date": today.isoformat(), "bucket": "week", "compare": "previous,yoy"
+                })
+                summary_params = QueryDict(mutable=True)
+                summary_params.update({"start_date": (today - timedelta(days=365)).isoformat(), "end_date": today.isoformat()})
+                periods = [(f"last-{days}-days", today - timedelta(days=days), today) for days in (7, 30, 181, 365)]
+
+                clear_cache()
+                columns = tenant_columns(owner.id)
+                size = sum(array.nbytes for array in vars(columns).values() if hasattr(array, "nbytes"))
+                self.stdout.write(
+                    f"\n{line_items} ordered products ({len(columns.order_days)} orders, {len(columns.products)} products), "
+                    f"{size / 1024 / 1024:.1f} MiB of columns, best of {repeat}"
+                )
+                self.compare("build_report (week buckets, 2 comparisons)", lambda: build_report(owner.id, report_params), repeat)
+                self.compare("build_summary (last 365 days)", lambda: build_summary(owner.id, summary_params), repeat)
+                self.compare("summarize_periods (4 report cards)", lambda: summarize_periods(
+                    owner.id, periods, columns=tenant_columns(owner.id) if analytics_enabled() else None
+                ), repeat)
+                transaction.set_rollback(True)
+        clear_cache()
+
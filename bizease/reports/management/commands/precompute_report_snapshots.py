@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from accounts.models import CustomUser
+from reports.views import PERIOD_DAYS, period_range
+from reports.snapshots import precompute_snapshots
+import django
+import multiprocessing
+import os
+
+
+class Command(BaseCommand):
+    help = (
+        "Precomputes the snapshots of the standard period reports of every active tenant. Meant to run shortly after "
+        "midnight, which the PERIODIC_JOBS setting schedules through run_worker, so the day's reports are read from them"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes", type=int, default=min(4, os.cpu_count() or 1),
+            help="Maximum number of worker processes. 1 computes the snapshots in this process"
+        )
+        parser.add_argument("--chunk-size", type=int, default=50, help="Number of tenants handed to a worker process at a time")
+        parser.add_argument("--periods", default=",".join(PERIOD_DAYS), help="Comma separated list of the periods to precompute")
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options["periods"].split(",") if name.strip()]
+        if not names or any(name not in PERIOD_DAYS for name in names):
+            raise CommandError(f"Invalid periods. Use a comma separated list of {', '.join(PERIOD_DAYS)}")
+        if options["processes"] < 1 or options["chunk_size"] < 1:
+            raise CommandError("--processes and --chunk-size must be at least 1")
+
+        # every worker uses the same dates even if it only gets to its tenants after the day has changed
+        periods = [(name, *period_range(name)) for name in names]
+        owner_ids = list(CustomUser.objects.filter(is_active=True).order_by("id").values_list("id", flat=True))
+        chunks = [owner_ids[index:index + options["chunk_size"]] for index in range(0, len(owner_ids), options["chunk_size"])]
+
+        computed, failures = 0, []
+        if options["processes"] == 1:
+            for chunk in chunks:
+                chunk_computed, chunk_failures = precompute_snapshots(chunk, periods)
+                computed += chunk_computed
+                failures += chunk_failures
+        else:
+            # Workers are spawned rather than forked because forking a process that runs threads (e.g run_worker) isn't
+            # safe. Spawned workers import the project from scratch so django is set up before they unpickle any task
+            executor = ProcessPoolExecutor(
+                max_workers=min(options["processes"], len(chunks) or 1), mp_context=multiprocessing.get_context("spawn"), initializer=django.setup
+            )
+            with executor:
+                futures = [executor.submit(precompute_snapshots, chunk, periods) for chunk in chunks]
+                for future in as_completed(futures):
+                    chunk_computed, chunk_failures = future.result()
+                    computed += chunk_computed
+                    failures += chunk_failures
+
+        for owner_id, error in failures:
+            self.stderr.write(f"Snapshots of tenant {owner_id} failed: {error}")
+        self.stdout.write(f"Computed {computed} report snapshots for {len(owner_ids)} tenants")
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0001_reportjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('last-week', 'last-week'), ('last-month', 'last-month'), ('last-6-months', 'last-6-months'), ('last-year', 'last-year')])),
+                ('snapshot_date', models.DateField()),
+                ('orders_fingerprint', models.CharField(max_length=64)),
+                ('data', models.BinaryField()),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('owner', 'period'), name='unique_report_snapshot')],
+            },
+        ),
+    ]
@@ -1 +1,84 @@
 from django.db import models
+from accounts.models import CustomUser
+from bizease.tenancy import TenantQuerySet
+from bizease.renderers import dumps
+import orjson
+import zlib
+
+
+def compress_json(data):
+    return zlib.compress(dumps(data))
+
+
+def decompress_json(value):
+    return orjson.loads(zlib.decompress(value)) if value is not None else None
+
+
+class ReportJob(models.Model):
+    """
+    A report computed by a background job (see reports.jobs) instead of the request that asked for it.
+    The result is stored zlib compressed until expires_at.
+    """
+    REPORTS = {"report": "report", "summary": "summary"}
+    STATUSES = {"Queued": "Queued", "Running": "Running", "Completed": "Completed", "Failed": "Failed"}
+
+    owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    report = models.CharField(choices=REPORTS)
+    params = models.JSONField(default=dict)
+    # identifies identical jobs of an owner (same report and parameters) so they can share one computation
+    params_hash = models.CharField(max_length=64)
+    status = models.CharField(choices=STATUSES, default="Queued")
+    result = models.BinaryField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    objects = TenantQuerySet.as_manager()
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["status", "id"], name="report_job_queue_idx"),
+            models.Index(fields=["owner", "params_hash", "status"], name="report_job_dedup_idx"),
+        ]
+
+    def set_result(self, data):
+        self.result = compress_json(data)
+
+    def get_result(self):
+        return decompress_json(self.result)
+
+    def __str__(self):
+        return f"Report job {self.id} ({self.report}) - {self.status}"
+
+
+class ReportSnapshot(models.Model):
+    """
+    The part of a standard period's report (see reports.snapshots) that covers the days before snapshot_date,
+    precomputed by python manage.py precompute_report_snapshots. There's one snapshot per owner and period, replaced
+    every night.
+    """
+    PERIODS = {"last-week": "last-week", "last-month": "last-month", "last-6-months": "last-6-months", "last-year": "last-year"}
+
+    owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    period = models.CharField(choices=PERIODS)
+    snapshot_date = models.DateField()
+    # identifies the state of the orders the snapshot was computed from, see reports.snapshots.orders_fingerprint
+    orders_fingerprint = models.CharField(max_length=64)
+    data = models.BinaryField()
+    computed_at = models.DateTimeField(auto_now=True)
+
+    objects = TenantQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["owner", "period"], name="unique_report_snapshot")
+        ]
+
+    def get_data(self):
+        return decompress_json(self.data)
+
+    def __str__(self):
+        return f"{self.period} report snapshot of {self.owner_id} ({self.snapshot_date})"
@@ -0,0 +1,111 @@
+"""
+ABC (Pareto) classification of the products a tenant sold in a period.
+
+Products are ranked by revenue (or units sold) and classified by the share of the period's total taken by the products
+ranked above them: A until ABC_CLASS_SHARES[0] percent of the total (80 by default), then B until ABC_CLASS_SHARES[1]
+percent (95) and C for the long tail. Ranking is one numpy sort and the shares come from a cumulative sum of int64
+minor units, so they're exact however many products there are.
+
+The sales of a standard period come from its report snapshot (see reports.snapshots), which the report schedule
+precomputes every night, merged with today's sales. All time sales are read from the product sales stats and the sales
+of any other range from the analytics columns (see reports.analytics), or an aggregate query if they're disabled.
+"""
+from django.conf import settings
+from django.db.models import Sum
+from orders.models import OrderedProduct, ProductSalesStats
+from .analytics import analytics_enabled, tenant_columns, minor_units, from_minor_units, group_sum
+from .snapshots import checked_snapshot, snapshot_product_sales
+import numpy as np
+
+
+RANKINGS = ("revenue", "units")
+CLASSES = ("A", "B", "C")
+
+
+def class_shares():
+    return getattr(settings, "ABC_CLASS_SHARES", (80, 95))
+
+
+def period_sales(owner_id, start_date=None, end_date=None, period=None):
+    """ The (names, units sold, revenue in minor units) of the products sold in a period, as a list and two int64 arrays """
+    if period is not None:
+        checked = checked_snapshot(owner_id, period, start_date, end_date)
+        if checked is not None:
+            history, item_names, _ = checked
+            sales = snapshot_product_sales(owner_id, history, item_names, end_date)
+            names = [name for _, name in sales]
+            units = np.fromiter((quantity_sold for quantity_sold, _ in sales.values()), dtype=np.int64, count=len(sales))
+            revenue = np.fromiter((int(revenue * 100) for _, revenue in sales.values()), dtype=np.int64, count=len(sales))
+            return names, units, revenue
+
+    if start_date or end_date:
+        if analytics_enabled():
+            columns = tenant_columns(owner_id)
+            codes, units, revenue = columns.product_totals(start_date, end_date)
+            descriptions = columns.describe_products(codes.tolist())
+            return [descriptions[code][0] for code in codes.tolist()], units, revenue
+        rows = list(
+            OrderedProduct.objects.for_owner(owner_id).filter(order_id__status="Delivered", order_id__order_date__range=(start_date, end_date))
+            .group_by_product().annotate(quantity_sold=Sum("quantity"), revenue=Sum(minor_units("cummulative_price")))
+            .values_list("product_name", "quantity_sold", "revenue")
+        )
+    else:
+        rows = list(
+            ProductSalesStats.objects.for_owner(owner_id).with_product_name().order_by()
+            .annotate(revenue_units=minor_units("revenue")).values_list("product_name", "units_sold", "revenue_units")
+        )
+    units = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+    revenue = np.fromiter((row[2] for row in rows), dtype=np.int64, count=len(rows))
+    return [row[0] for row in rows], units, revenue
+
+
+def percentages(values, total):
+    return np.round(values * 100 / total, 2) if total else np.zeros(len(values))
+
+
+class Classification:
+    """ The ranking of the products of a period with the share and class of every rank """
+
+    def __init__(self, names, units, revenue, rank_by="revenue"):
+        self.names, self.units, self.revenue = names, units, revenue
+        measure, other = (revenue, units) if rank_by == "revenue" else (units, revenue)
+        # ties are ranked by the other measure, then by name
+        by_name = np.asarray(sorted(range(len(names)), key=names.__getitem__), dtype=np.int64)
+        self.order = by_name[np.lexsort((np.arange(len(by_name)), -other[by_name], -measure[by_name]))]
+
+        ranked = measure[self.order]
+        total = int(ranked.sum())
+        cumulative = np.cumsum(ranked)
+        # a product's class depends on the share of the products ranked above it, so the first product is always an A
+        a_share, b_share = class_shares()
+        above = (cumulative - ranked) * 100
+        self.classes = np.where(above < a_share * total, 0, np.where(above < b_share * total, 1, 2))
+        self.shares = percentages(ranked, total)
+        self.cumulative_shares = percentages(cumulative, total)
+        class_totals = group_sum(self.classes, ranked, len(CLASSES))
+        self.summary = {
+            name: {"products": count, "share": share}
+            for name, count, share in zip(
+                CLASSES, np.bincount(self.classes, minlength=len(CLASSES)).tolist(), percentages(class_totals, total).tolist()
+            )
+        }
+
+    def ranks(self, product_class=None):
+        """ The (0 based) ranks of the products of a class, or of every product """
+        if product_class is None:
+            return np.arange(len(self.order))
+        return np.flatnonzero(self.classes == CLASSES.index(product_class))
+
+    def products(self, ranks):
+        return [
+            {
+                "rank": rank + 1,
+                "name": self.names[index],
+                "quantity_sold": int(self.units[index]),
+                "revenue": from_minor_units(self.revenue[index]),
+                "share": self.shares[rank].item(),
+                "cumulative_share": self.cumulative_shares[rank].item(),
+                "class": CLASSES[self.classes[rank]],
+            }
+            for rank, index in zip(ranks.tolist(), self.order[ranks].tolist())
+        ]
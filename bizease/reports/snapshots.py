@@ -0,0 +1,208 @@
+"""
+Precomputed snapshots of the reports of the standard periods (last-week, last-month, last-6-months, last-year).
+
+A standard period ends today so all of its orders but today's are history once the day starts. After midnight,
+python manage.py precompute_report_snapshots stores the order totals of the days before today for every active tenant
+and period: the revenue and pending orders of the period, the revenue of its previous window, the revenue chart rows
+and the units sold and revenue of each product. A report request for a standard period then only reads today's orders
+(the same-day delta) and the inventory, which changes too often to be worth precomputing, and merges them with the
+snapshot. The ABC classification of a standard period (see reports.pareto) is built from the same snapshot.
+
+A snapshot records a fingerprint of the orders it was computed from (their count, max id and sum of versions, the same
+as bizease.conditional.list_etag). Every write to an order bumps its version so an order of an earlier day that's
+created, edited, delivered or deleted during the day changes the fingerprint, and the request that notices recomputes
+the snapshot before using it.
+"""
+from django.db.models import Sum, Count, Max, F, Q
+from inventory.models import Inventory
+from orders.models import Order, OrderedProduct
+from bizease import metrics
+from bizease.transactions import run_in_transaction
+from .models import ReportSnapshot, compress_json
+from .comparisons import previous_window, percentage_change
+from datetime import date, timedelta
+from decimal import Decimal
+
+
+def fingerprint_aggregates(condition):
+    return {
+        "count": Count("id", filter=condition),
+        "last_id": Max("id", filter=condition),
+        "versions": Sum("version", filter=condition),
+    }
+
+
+def orders_fingerprint(state):
+    return f"{state['count']}:{state['last_id']}:{state['versions']}"
+
+
+def decimal_or_none(value):
+    return Decimal(value) if value is not None else None
+
+
+def compute_snapshot(owner_id, period, start_date, end_date):
+    """
+    Computes and stores the snapshot of the period from start_date to end_date (today) and returns its data. Only the
+    orders dated before end_date are read. The data and its fingerprint are read in one transaction so they agree
+    """
+    return run_in_transaction(_compute_snapshot, owner_id, period, start_date, end_date, name="report_snapshot")
+
+
+def _compute_snapshot(owner_id, period, start_date, end_date):
+    previous_start, previous_end = previous_window(start_date, end_date)
+    last_day = end_date - timedelta(days=1)
+
+    totals = Order.objects.for_owner(owner_id).order_by().filter(order_date__range=(previous_start, last_day)).aggregate(
+        revenue=Sum("total_price", filter=Q(status="Delivered", order_date__gte=start_date)),
+        previous_revenue=Sum("total_price", filter=Q(status="Delivered", order_date__lte=previous_end)),
+        pending_orders=Count("id", filter=Q(status="Pending", order_date__gte=start_date)),
+        **fingerprint_aggregates(Q())
+    )
+    date_revenue = (
+        Order.objects.for_owner(owner_id).filter(status="Delivered", order_date__range=(start_date, last_day))
+        .values_list("order_date", "total_price")
+    )
+    product_sales = (
+        OrderedProduct.objects.for_owner(owner_id)
+        .filter(order_id__status="Delivered", order_id__order_date__range=(start_date, last_day))
+        .group_by_product()
+        .annotate(quantity_sold=Sum("quantity"), revenue=Sum("cummulative_price"))
+        .values_list("inventory_item", "product_name", "quantity_sold", "revenue")
+    )
+
+    # decimals are stored as strings so they're read back exactly and dates are formatted here so freshly computed
+    # data reads the same as stored data
+    data = {
+        "revenue": str(totals["revenue"]) if totals["revenue"] is not None else None,
+        "previous_revenue": str(totals["previous_revenue"]) if totals["previous_revenue"] is not None else None,
+        "pending_orders": totals["pending_orders"],
+        "date_revenue": [[order_date.isoformat(), str(revenue) if revenue is not None else None] for order_date, revenue in date_revenue],
+        "product_sales": [[item, name, quantity_sold, str(revenue)] for item, name, quantity_sold, revenue in product_sales],
+    }
+    ReportSnapshot.objects.unscoped().update_or_create(owner_id=owner_id, period=period, defaults={
+        "snapshot_date": end_date, "orders_fingerprint": orders_fingerprint(totals), "data": compress_json(data)
+    })
+    return data
+
+
+def current_item_names(owner_id, product_sales):
+    """
+    The current names of the inventory items the products of a snapshot were sold from, or None if any of them was
+    deleted since, because their sales are then grouped by the names they were ordered with instead
+    """
+    item_ids = {item for item, *_ in product_sales if item is not None}
+    if not item_ids:
+        return {}
+    names = dict(Inventory.objects.for_owner(owner_id).filter(id__in=item_ids).values_list("id", "product_name"))
+    return names if len(names) == len(item_ids) else None
+
+
+def checked_snapshot(owner_id, period, start_date, end_date, **today_aggregates):
+    """
+    The history (data) of the period's snapshot for today with the current names of its inventory items and the state
+    of the orders, which also has the 'today_aggregates' of the orders from the start of the previous window, or None
+    if the period has no snapshot for today. The snapshot is recomputed first if orders of earlier days changed since
+    """
+    snapshot = ReportSnapshot.objects.for_owner(owner_id).filter(period=period, snapshot_date=end_date).first()
+    if snapshot is None:
+        metrics.incr("report_snapshots.misses")
+        return None
+
+    previous_start, _ = previous_window(start_date, end_date)
+    state = Order.objects.for_owner(owner_id).order_by().filter(order_date__range=(previous_start, end_date)).aggregate(
+        **today_aggregates, **fingerprint_aggregates(Q(order_date__lt=end_date))
+    )
+    history = snapshot.get_data()
+    item_names = current_item_names(owner_id, history["product_sales"])
+    # snapshots computed before product revenue was stored have 3 columns of product sales
+    outdated = any(len(row) != 4 for row in history["product_sales"])
+    if snapshot.orders_fingerprint != orders_fingerprint(state) or item_names is None or outdated:
+        metrics.incr("report_snapshots.refreshes")
+        history = compute_snapshot(owner_id, period, start_date, end_date)
+        item_names = {item: name for item, name, *_ in history["product_sales"]}
+    metrics.incr("report_snapshots.hits")
+    return history, item_names, state
+
+
+def snapshot_product_sales(owner_id, history, item_names, end_date):
+    """ The units sold and revenue of every product in a snapshot's history and today, keyed by (inventory item, name) """
+    today_sales = (
+        OrderedProduct.objects.for_owner(owner_id).filter(order_id__status="Delivered", order_id__order_date=end_date)
+        .group_by_product()
+        .annotate(quantity_sold=Sum("quantity"), revenue=Sum("cummulative_price"))
+        .values_list("inventory_item", "product_name", "quantity_sold", "revenue")
+    )
+    product_sales = {}
+    for item, name, quantity_sold, revenue in history["product_sales"]:
+        key = (item, item_names[item] if item is not None else name)
+        product_sales[key] = [quantity_sold, decimal_or_none(revenue) or 0]
+    for item, name, quantity_sold, revenue in today_sales:
+        sales = product_sales.setdefault((item, name), [0, 0])
+        sales[0] += quantity_sold
+        sales[1] += revenue or 0
+    return product_sales
+
+
+def snapshot_report(owner_id, period, start_date, end_date):
+    """
+    The report of a standard period (the data of ReportDataView) built from its snapshot and today's orders, or None if
+    the period has no snapshot for today. Chart data is returned as lists of dicts
+    """
+    checked = checked_snapshot(owner_id, period, start_date, end_date, pending_today=Count("id", filter=Q(status="Pending", order_date=end_date)))
+    if checked is None:
+        return None
+    history, item_names, state = checked
+
+    previous_start, _ = previous_window(start_date, end_date)
+    today_revenue = list(
+        Order.objects.for_owner(owner_id).filter(status="Delivered", order_date=end_date).values_list("order_date", "total_price")
+    )
+    stock = Inventory.objects.for_owner(owner_id).aggregate(
+        total=Count("id"),
+        low_stock=Count("id", filter=Q(stock_level__lte=F("low_stock_threshold"))),
+        stock_value=Sum(F("price") * F("stock_level"), filter=Q(date_added__lte=end_date)),
+        # valued as of the start of the previous window, the same as compare_periods() does
+        previous_stock_value=Sum(F("price") * F("stock_level"), filter=Q(date_added__lte=previous_start)),
+    )
+
+    date_revenue_chart_data = [{"date": order_date, "revenue": revenue} for order_date, revenue in today_revenue] + [
+        {"date": date.fromisoformat(order_date), "revenue": decimal_or_none(revenue)} for order_date, revenue in history["date_revenue"]
+    ]
+    total_revenue = decimal_or_none(history["revenue"]) or 0
+    total_revenue += sum(revenue for _, revenue in today_revenue if revenue is not None)
+    previous_revenue = decimal_or_none(history["previous_revenue"]) or 0
+
+    product_sales = snapshot_product_sales(owner_id, history, item_names, end_date)
+    top_product = max(product_sales.items(), key=lambda sales: sales[1][0], default=None)
+
+    stock_value = stock["stock_value"] or 0
+    return {
+        "period": period,
+        "total_products": stock["total"],
+        "low_stock_items": stock["low_stock"],
+        "top_selling_product": top_product[0][1] if top_product else None,
+        "pending_orders": history["pending_orders"] + state["pending_today"],
+        "total_stock_value": stock_value,
+        "stock_value_change": percentage_change(stock_value, stock["previous_stock_value"] or 0),
+        "total_revenue": total_revenue,
+        "revenue_change": percentage_change(total_revenue, previous_revenue),
+        "date_revenue_chart_data": date_revenue_chart_data,
+        "product_sales_chart_data": [{"name": name, "quantity_sold": quantity_sold} for (_, name), (quantity_sold, _) in product_sales.items()],
+    }
+
+
+def precompute_snapshots(owner_ids, periods):
+    """
+    Computes the snapshots of every (period, start_date, end_date) in periods for each owner. Returns the number of
+    snapshots computed and the (owner_id, error) of the owners whose snapshots couldn't all be computed.
+    Called in the worker processes of precompute_report_snapshots with a chunk of owners at a time
+    """
+    computed, failures = 0, []
+    for owner_id in owner_ids:
+        try:
+            for period, start_date, end_date in periods:
+                compute_snapshot(owner_id, period, start_date, end_date)
+                computed += 1
+        except Exception as err:
+            failures.append((owner_id, str(err) or err.__class__.__name__))
+    return computed, failures
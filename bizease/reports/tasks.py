@@ -0,0 +1,24 @@
+from django.core.management import call_command
+from jobs.queue import task
+from .jobs import claim_job, run_job, requeue_stale_jobs, purge_expired_jobs
+from .models import ReportJob
+
+
+@task(max_attempts=2)
+def precompute_report_snapshots(**options):
+    """ Runs precompute_report_snapshots. Scheduled shortly after midnight by the PERIODIC_JOBS setting """
+    call_command("precompute_report_snapshots", **options)
+
+
+@task
+def run_report_job(job_id):
+    """ Computes a queued report job. Queued by enqueue_report_job """
+    if claim_job(job_id):
+        run_job(ReportJob.objects.unscoped().get(pk=job_id))
+
+
+@task(max_attempts=1)
+def clean_up_report_jobs():
+    """ Queues the report jobs of workers that died again and deletes expired ones. Scheduled by the PERIODIC_JOBS setting """
+    requeue_stale_jobs()
+    purge_expired_jobs()
@@ -1,13 +1,25 @@
 from rest_framework.test import APITransactionTestCase
-from orders.models import Order, OrderedProduct
+from orders.models import Order, OrderedProduct, OrderBuilder
 from accounts.models import CustomUser
 from inventory.models import Inventory
 from django.urls import reverse
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from unittest.mock import patch
 from decimal import Decimal
+from bizease.serializers import rows_to_dicts
+from bizease import metrics
+from reports.timeseries import lttb
+from reports.analytics import group_sum, EXACT_FLOAT_LIMIT
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.core.management import call_command
+from reports.models import ReportJob, ReportSnapshot
+from io import StringIO
+import json
+import numpy as np
 
 class mock_django_timezone(datetime):
 	@classmethod
@@ -30,20 +42,17 @@ class ReportsViewsTest(APITransactionTestCase):
 		)
 
 		self.order = Order(product_owner_id=self.test_user, client_name="bob", client_email="bob@gmail.com", order_date="2025-03-14")
-		self.order.ordered_products_objects = [OrderedProduct(name="Wheelbarrow", quantity=1, price=150000), OrderedProduct(name="Helmet", quantity=5, price=6000)]
-		self.order.save()
+		OrderBuilder(self.order, [OrderedProduct(name="Wheelbarrow", quantity=1, price=150000), OrderedProduct(name="Helmet", quantity=5, price=6000)]).save()
 
 		self.order_1 = Order(product_owner_id=self.test_user, client_name="Davy Jones", client_email="dv@shipwrecks.ocean", status="Delivered", order_date="2025-03-20")
-		self.order_1.ordered_products_objects = [OrderedProduct(name="Wheelbarrow", quantity=1, price=150000)]
-		self.order_1.save()
+		OrderBuilder(self.order_1, [OrderedProduct(name="Wheelbarrow", quantity=1, price=150000)]).save()
 
 		self.order_2 = Order(product_owner_id=self.test_user, client_name="customer 1", client_phone="08045342896", status="Delivered", order_date="2024-12-02")
-		self.order_2.ordered_products_objects = [
+		OrderBuilder(self.order_2, [
 			OrderedProduct(name="Helmet", quantity=10, price=6000), 
 			OrderedProduct(name="Tape", quantity=4, price=4000), 
 			OrderedProduct(name="Safety Boots", quantity=2, price=65000)
-		]
-		self.order_2.save()
+		]).save()
 
 
 	def test_get_reports_without_credentials(self):
@@ -72,6 +81,313 @@ class ReportsViewsTest(APITransactionTestCase):
 		self.assertIn({"name": "Wheelbarrow", "quantity_sold": 1}, response.data["data"]["product_sales_chart_data"])
 		self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+	def test_reports_attribute_sales_to_renamed_products(self):
+		self.item_2.refresh_from_db() # the orders created in setUp changed its stock level (and version)
+		self.item_2.product_name = "Hard Hat"
+		self.item_2.save()
+
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		response = self.client.get(reverse("reports", args=["v1"]), format="json")
+		self.assertEqual(response.data["data"]["top_selling_product"], "Hard Hat")
+		self.assertIn({"name": "Hard Hat", "quantity_sold": 10}, response.data["data"]["product_sales_chart_data"])
+
+		response = self.client.get(reverse("reports-summary", args=["v1"]), format="json")
+		self.assertIn({'name': 'Hard Hat', 'quantity_sold': 10, 'revenue': 60000.00, 'stock_status': 'in stock'}, response.data["data"]["summary"])
+
+	def test_columnar_reports_round_trip(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		default = json.loads(self.client.get(reverse("reports-summary", args=["v1"])).content)["data"]
+		response = self.client.get(reverse("reports-summary", args=["v1"]), HTTP_ACCEPT="application/vnd.bizease.columnar+json")
+		self.assertEqual(response["Content-Type"], "application/vnd.bizease.columnar+json")
+		columnar = json.loads(response.content)["data"]
+		self.assertEqual(columnar["summary"]["fields"], ["name", "quantity_sold", "revenue", "stock_status"])
+		self.assertEqual(rows_to_dicts(columnar["summary"]), default["summary"])
+
+		default = json.loads(self.client.get(reverse("reports", args=["v1"])).content)["data"]
+		columnar = json.loads(self.client.get(reverse("reports", args=["v1"]) + "?format=columnar").content)["data"]
+		chart_data = columnar["product_sales_chart_data"]
+		self.assertEqual(
+			[{"name": name, "quantity_sold": quantity} for name, quantity in zip(chart_data["name"], chart_data["quantity_sold"])],
+			default["product_sales_chart_data"]
+		)
+		chart_data = columnar["date_revenue_chart_data"]
+		self.assertEqual(
+			[{"date": day, "revenue": revenue} for day, revenue in zip(chart_data["date"], chart_data["revenue"])],
+			default["date_revenue_chart_data"]
+		)
+
+	@patch("reports.views.timezone", mock_django_timezone)
+	def test_bucketed_revenue_chart_data(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		response = self.client.get(reverse("reports", args=["v1"]), {"bucket": "month"})
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data["data"]["date_revenue_chart_data"], [
+			{"date": date(2024, 12, 1), "revenue": 206000}, {"date": date(2025, 1, 1), "revenue": 0},
+			{"date": date(2025, 2, 1), "revenue": 0}, {"date": date(2025, 3, 1), "revenue": 150000}
+		])
+
+		# 2025-02-18 to 2025-03-20, in weeks starting on monday
+		response = self.client.get(reverse("reports", args=["v1"]), {"bucket": "week", "period": "last-month"})
+		chart_data = response.data["data"]["date_revenue_chart_data"]
+		self.assertEqual([point["date"] for point in chart_data], [date(2025, 2, 17), date(2025, 2, 24), date(2025, 3, 3), date(2025, 3, 10), date(2025, 3, 17)])
+		self.assertEqual([point["revenue"] for point in chart_data], [0, 0, 0, 0, 150000])
+
+		# 109 days downsampled to 10 points. The first and last days are always kept
+		response = self.client.get(reverse("reports", args=["v1"]), {"max_points": "10", "format": "columnar"})
+		chart_data = json.loads(response.content)["data"]["date_revenue_chart_data"]
+		self.assertEqual(len(chart_data["date"]), 10)
+		self.assertEqual((chart_data["date"][0], chart_data["revenue"][0]), ("2024-12-02", 206000))
+		self.assertEqual((chart_data["date"][-1], chart_data["revenue"][-1]), ("2025-03-20", 150000))
+
+		for params in [{"bucket": "year"}, {"max_points": "2"}, {"max_points": "ten"}]:
+			response = self.client.get(reverse("reports", args=["v1"]), params)
+			self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+	@override_settings(REPORT_ANALYTICS=False) # the queries of the database path are checked
+	def test_custom_range_reports_with_comparisons(self):
+		order = Order(product_owner_id=self.test_user, client_name="jake", status="Delivered", order_date="2024-03-10")
+		OrderBuilder(order, [OrderedProduct(name="Tape", quantity=2, price=4000)]).save()
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+
+		response = self.client.get(reverse("reports", args=["v1"]), {"start_date": "2025-03-01", "end_date": "2025-03-20"})
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data["data"]["period"], "2025-03-01 to 2025-03-20")
+		self.assertEqual(response.data["data"]["total_revenue"], 150000)
+		self.assertEqual(response.data["data"]["revenue_change"], None) # nothing was delivered in the previous 20 days
+		self.assertEqual(response.data["data"]["stock_value_change"], Decimal("0.00"))
+		self.assertNotIn("comparisons", response.data["data"])
+
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(
+				reverse("reports", args=["v1"]), {"start_date": "2025-03-01", "end_date": "2025-03-20", "compare": "yoy,previous"}
+			)
+		comparisons = response.data["data"]["comparisons"]
+		self.assertEqual([(row["compare"], row["start_date"], row["end_date"]) for row in comparisons], [
+			("yoy", date(2024, 3, 1), date(2024, 3, 20)), ("previous", date(2025, 2, 9), date(2025, 2, 28))
+		])
+		self.assertEqual(comparisons[0]["revenue"], 8000)
+		self.assertEqual(comparisons[0]["revenue_change"], Decimal("1775.00"))
+		self.assertEqual(comparisons[0]["stock_value_change"], None)
+		self.assertEqual(comparisons[1]["revenue"], 0)
+		self.assertEqual(response.data["data"]["revenue_change"], Decimal("1775.00"))
+		# one query over the orders and one over the inventory for the period and both windows
+		self.assertEqual(len([query for query in queries if 'SUM("orders_order"."total_price") FILTER' in query["sql"]]), 1)
+		self.assertEqual(len([query for query in queries if "FILTER" in query["sql"] and "inventory_inventory" in query["sql"]]), 1)
+
+		response = self.client.get(reverse("reports", args=["v1"]), {"period": "last-week", "compare": "previous,lastyear"})
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+		self.assertEqual(response.data["detail"], "Invalid value for compare parameter")
+
+	@patch("reports.views.timezone", mock_django_timezone)
+	@override_settings(REPORT_ANALYTICS=False) # the queries of the database path are counted
+	def test_batch_reports_match_single_period_reports(self):
+		order = Order(product_owner_id=self.test_user, client_name="jake", status="Delivered", order_date="2025-02-07")
+		OrderBuilder(order, [OrderedProduct(name="Safety Boots", quantity=1, price=65000)]).save()
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+
+		periods = ["last-week", "last-month", "last-6-months", "last-year"]
+		with self.assertNumQueries(4): # the user's lookup by the jwt authentication, the orders, the ordered products and the inventory
+			response = self.client.get(reverse("reports-batch", args=["v1"]), {"periods": ",".join(periods)})
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(list(response.data["data"]), periods)
+
+		for period in periods:
+			report = self.client.get(reverse("reports", args=["v1"]), {"period": period}).data["data"]
+			card = response.data["data"][period]
+			for key in [
+				"period", "total_products", "low_stock_items", "top_selling_product", "pending_orders", "total_stock_value",
+				"stock_value_change", "total_revenue", "revenue_change"
+			]:
+				self.assertEqual(card[key], report[key], f"{period} {key}")
+
+		for periods in ["", "last-week,all-time"]:
+			response = self.client.get(reverse("reports-batch", args=["v1"]), {"periods": periods})
+			self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+	@patch("reports.views.timezone", mock_django_timezone)
+	def test_report_jobs(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		body = {"report": "report", "params": {"period": "last-year", "bucket": "month"}}
+		response = self.client.post(reverse("report-jobs", args=["v1"]), body, format="json")
+		self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+		job_id = response.data["data"]["id"]
+		self.assertEqual(response["Location"], response.data["data"]["status_url"])
+		self.assertEqual(response.data["data"]["status"], "Queued")
+
+		# an identical request shares the queued job
+		response = self.client.post(reverse("report-jobs", args=["v1"]), body, format="json")
+		self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+		self.assertEqual(response.data["data"]["id"], job_id)
+
+		response = self.client.get(reverse("report-job", args=["v1", job_id]))
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertIsNone(response.data["data"]["result"])
+
+		call_command("run_worker", "--once", "--no-scheduler")
+		response = self.client.get(reverse("report-job", args=["v1", job_id]))
+		self.assertEqual(response.data["data"]["status"], "Completed")
+		report = self.client.get(reverse("reports", args=["v1"]), {"period": "last-year", "bucket": "month"})
+		self.assertEqual(json.loads(response.content)["data"]["result"], json.loads(report.content)["data"])
+		self.assertIsNotNone(ReportJob.objects.get(pk=job_id).expires_at)
+
+		# the stored result is reused until it expires
+		response = self.client.post(reverse("report-jobs", args=["v1"]), body, format="json")
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data["data"]["id"], job_id)
+
+		for body in [{"report": "chart"}, {"params": {"period": "last-decade"}}, {"report": "summary", "params": {"bucket": "day"}}]:
+			response = self.client.post(reverse("report-jobs", args=["v1"]), body, format="json")
+			self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+		other_user = CustomUser.objects.create(business_name="Other llc", full_name="Other User", email="other@gmail.com", password="12345678", is_active=True)
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + str(RefreshToken.for_user(other_user).access_token))
+		response = self.client.get(reverse("report-job", args=["v1", job_id]))
+		self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+	@patch("reports.views.timezone", mock_django_timezone)
+	def test_reports_from_snapshots(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+		periods = ["last-week", "last-month", "last-6-months", "last-year"]
+
+		def get_report(params):
+			data = json.loads(self.client.get(reverse("reports", args=["v1"]), params).content)["data"]
+			data.pop("comparisons", None)
+			# the order of chart rows isn't part of the api
+			data["date_revenue_chart_data"].sort(key=lambda point: (point["date"], point["revenue"]))
+			data["product_sales_chart_data"].sort(key=lambda row: row["name"])
+			return data
+
+		def assert_snapshots_match_live_reports():
+			for period in periods:
+				# 'compare' isn't supported by snapshots so this report is computed from the orders
+				self.assertEqual(get_report({"period": period}), get_report({"period": period, "compare": "previous"}), period)
+
+		call_command("precompute_report_snapshots", "--processes", "1", stdout=StringIO())
+		self.assertEqual(ReportSnapshot.objects.filter(owner=self.test_user, snapshot_date=date(2025, 3, 20)).count(), 4)
+		metrics.reset()
+		assert_snapshots_match_live_reports()
+		self.assertEqual(metrics.snapshot("report_snapshots."), {"report_snapshots.hits": 4})
+
+		# today's orders are added to the snapshots
+		order = Order(product_owner_id=self.test_user, client_name="jake", status="Delivered", order_date="2025-03-20")
+		OrderBuilder(order, [OrderedProduct(name="Helmet", quantity=2, price=6000)]).save()
+		Inventory.objects.filter(pk=self.item_2.pk).update(product_name="Hard Hat")
+		assert_snapshots_match_live_reports()
+		self.assertNotIn("report_snapshots.refreshes", metrics.snapshot("report_snapshots."))
+
+		# a change to an order of an earlier day is noticed and the snapshots are recomputed
+		Order.objects.filter(pk=self.order.pk).mark_delivered()
+		assert_snapshots_match_live_reports()
+		self.assertEqual(metrics.snapshot("report_snapshots.")["report_snapshots.refreshes"], 4)
+
+	@patch("reports.views.timezone", mock_django_timezone)
+	@override_settings(REPORT_ANALYTICS=True)
+	def test_analytics_columns_match_database_reports(self):
+		order = Order(product_owner_id=self.test_user, client_name="jake", status="Delivered", order_date="2024-03-10")
+		OrderBuilder(order, [OrderedProduct(name="Tape", quantity=2, price=4000)]).save()
+		Inventory.objects.filter(pk=self.item_3.pk).delete() # its sales are grouped by name from now on
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+
+		def get(name, params):
+			data = json.loads(self.client.get(reverse(name, args=["v1"]), params).content)["data"]
+			# the order of chart rows isn't part of the api
+			for key, sort_key in [("date_revenue_chart_data", "date"), ("product_sales_chart_data", "name")]:
+				if isinstance(data.get(key), dict): # column arrays
+					data[key] = [dict(zip(data[key], row)) for row in zip(*data[key].values())]
+				if key in data:
+					data[key].sort(key=lambda row: (row[sort_key], str(row)))
+			return data
+
+		requests = [
+			("reports", {}), ("reports", {"bucket": "week"}), ("reports", {"max_points": "5"}),
+			("reports", {"start_date": "2024-03-01", "end_date": "2025-03-20", "compare": "previous,yoy"}),
+			("reports", {"start_date": "2024-12-01", "end_date": "2025-03-20", "bucket": "month", "format": "columnar"}),
+			("reports", {"period": "last-6-months", "compare": "previous"}),
+			("reports-summary", {"start_date": "2024-01-01", "end_date": "2025-03-20"}),
+			("reports-summary", {"period": "last-year", "format": "columnar"}),
+			("reports-batch", {"periods": "last-week,last-month,last-6-months,last-year"}),
+		]
+		def assert_analytics_match_database():
+			for name, params in requests:
+				with override_settings(REPORT_ANALYTICS=False):
+					expected = get(name, params)
+				self.assertEqual(get(name, params), expected, f"{name} {params}")
+
+		metrics.reset()
+		assert_analytics_match_database()
+		# the columns are loaded once and reused until the tenant's data changes
+		self.assertEqual(metrics.snapshot("analytics."), {"analytics.columns.loads": 1, "analytics.columns.hits": len(requests) - 1})
+
+		Order.objects.filter(pk=self.order.pk).mark_delivered()
+		assert_analytics_match_database()
+		self.assertEqual(metrics.snapshot("analytics.")["analytics.columns.loads"], 2)
+
+	@patch("reports.views.timezone", mock_django_timezone)
+	def test_abc_classification(self):
+		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+
+		def get_abc(params):
+			response = self.client.get(reverse("reports-abc", args=["v1"]), params)
+			self.assertEqual(response.status_code, status.HTTP_200_OK)
+			return response.data["data"]
+
+		data = get_abc({})
+		self.assertEqual(data["period"], "All time")
+		self.assertEqual([(row["rank"], row["name"], row["revenue"], row["cumulative_share"], row["class"]) for row in data["products"]], [
+			(1, "Wheelbarrow", 150000, 42.13, "A"),
+			(2, "Safety Boots", 130000, 78.65, "A"),
+			(3, "Helmet", 60000, 95.51, "A"), # the products ranked above it have less than 80% of the revenue
+			(4, "Tape", 16000, 100, "C"),
+		])
+		self.assertEqual(data["classes"], {"A": {"products": 3, "share": 95.51}, "B": {"products": 0, "share": 0}, "C": {"products": 1, "share": 4.49}})
+
+		data = get_abc({"rank_by": "units"})
+		self.assertEqual([(row["name"], row["quantity_sold"], row["class"]) for row in data["products"]], [
+			("Helmet", 10, "A"), ("Tape", 4, "A"), ("Safety Boots", 2, "B"), ("Wheelbarrow", 1, "B")
+		])
+		data = get_abc({"rank_by": "units", "class": "b", "page": 1})
+		self.assertEqual([row["rank"] for row in data["products"]], [3, 4])
+		self.assertEqual((data["page_count"], data["next_page"], data["length"]), (1, None, 2))
+
+		for params, status_code in [
+			({"page": 2}, status.HTTP_404_NOT_FOUND), ({"rank_by": "profit"}, status.HTTP_400_BAD_REQUEST),
+			({"class": "D"}, status.HTTP_400_BAD_REQUEST), ({"period": "last-decade"}, status.HTTP_400_BAD_REQUEST),
+		]:
+			self.assertEqual(self.client.get(reverse("reports-abc", args=["v1"]), params).status_code, status_code)
+
+		# standard periods are classified from their snapshots, the same as the range of days they cover
+		call_command("precompute_report_snapshots", "--processes", "1", stdout=StringIO())
+		order = Order(product_owner_id=self.test_user, client_name="jake", status="Delivered", order_date="2025-03-20")
+		OrderBuilder(order, [OrderedProduct(name="Tape", quantity=30, price=4000)]).save()
+		metrics.reset()
+		for period, days in [("last-week", 7), ("last-month", 30), ("last-6-months", 181), ("last-year", 365)]:
+			data = get_abc({"period": period})
+			range_params = {"start_date": (date(2025, 3, 20) - timedelta(days=days)).isoformat(), "end_date": "2025-03-20"}
+			expected = get_abc(range_params)
+			self.assertEqual((data["period"], data["products"], data["classes"]), (period, expected["products"], expected["classes"]))
+			with override_settings(REPORT_ANALYTICS=True):
+				self.assertEqual(get_abc(range_params)["products"], expected["products"])
+		# today's sales are included
+		self.assertEqual([row["name"] for row in data["products"]], ["Wheelbarrow", "Tape", "Safety Boots", "Helmet"])
+		self.assertEqual(metrics.snapshot("report_snapshots."), {"report_snapshots.hits": 4})
+
+	def test_analytics_group_sums_are_exact(self):
+		codes = np.array([0, 1, 0, 2], dtype=np.int32)
+		self.assertEqual(group_sum(codes, np.array([1, 2, 3, 4], dtype=np.int64), 4).tolist(), [4, 2, 4, 0])
+		# too large for float64 to add exactly
+		values = np.array([EXACT_FLOAT_LIMIT, 1, 1, 3], dtype=np.int64)
+		self.assertEqual(group_sum(codes, values, 3).tolist(), [EXACT_FLOAT_LIMIT + 1, 1, 3])
+
+	def test_lttb_keeps_extremes(self):
+		values = [1.0] * 100
+		values[37], values[71] = 50.0, -50.0
+		kept = lttb(values, 10)
+		self.assertEqual(len(kept), 10)
+		self.assertEqual([kept[0], kept[-1]], [0, 99])
+		self.assertIn(37, kept)
+		self.assertIn(71, kept)
+		self.assertEqual(lttb(values[:5], 10), [0, 1, 2, 3, 4])
+
 	def test_get_reports_summary_without_credentials(self):
 		response = self.client.get(reverse("reports-summary", args=["v1"]), format="json")
 		self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -94,11 +410,10 @@ class ReportsViewsTest(APITransactionTestCase):
 		self.order_week_b4_last = (
 			Order(product_owner_id=self.test_user, client_name="Davy Jones", client_email="dv@shipwrecks.ocean", status="Delivered", order_date="2025-03-12")
 		)
-		self.order_week_b4_last.ordered_products_objects = [
+		OrderBuilder(self.order_week_b4_last, [
 			OrderedProduct(name="Tape", quantity=1, price=4000), 
 			OrderedProduct(name="Safety Boots", quantity=2, price=65000)
-		]
-		self.order_week_b4_last.save()
+		]).save()
 
 		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
 		response = self.client.get(reverse("reports", args=["v1"]), query_params={"period": "last-week"}, format="json")
@@ -123,11 +438,10 @@ class ReportsViewsTest(APITransactionTestCase):
 		self.order_month_b4_last = (
 			Order(product_owner_id=self.test_user, client_name="Davy Jones", client_email="dv@shipwrecks.ocean", status="Delivered", order_date="2025-02-07")
 		)
-		self.order_month_b4_last.ordered_products_objects = [
+		OrderBuilder(self.order_month_b4_last, [
 			OrderedProduct(name="Wheelbarrow", quantity=1, price=150000),
 			OrderedProduct(name="Safety Boots", quantity=1, price=65000)
-		]
-		self.order_month_b4_last.save()
+		]).save()
 
 		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
 		response = self.client.get(reverse("reports", args=["v1"]), query_params={"period": "last-month"}, format="json")
@@ -152,10 +466,9 @@ class ReportsViewsTest(APITransactionTestCase):
 		self.order_month_b4_last = (
 			Order(product_owner_id=self.test_user, client_name="Davy Jones", client_email="dv@shipwrecks.ocean", status="Delivered", order_date="2024-05-07")
 		)
-		self.order_month_b4_last.ordered_products_objects = [
+		OrderBuilder(self.order_month_b4_last, [
 			OrderedProduct(name="Safety Boots", quantity=3, price=65000),
-		]
-		self.order_month_b4_last.save()
+		]).save()
 
 		self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
 		response = self.client.get(reverse("reports", args=["v1"]), query_params={"period": "last-6-months"}, format="json")
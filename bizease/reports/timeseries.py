@@ -0,0 +1,106 @@
+"""
+Revenue time series for the report charts.
+
+Orders are grouped into day, week or month buckets by the database (date truncation), missing buckets are filled with
+zeros so the series has one point per bucket and series that are still longer than the requested number of points
+are downsampled with Largest-Triangle-Three-Buckets, which keeps the peaks and troughs a chart needs to look right.
+"""
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth
+from datetime import timedelta
+from decimal import Decimal
+
+
+BUCKET_FUNCTIONS = {"day": TruncDay, "week": TruncWeek, "month": TruncMonth}
+
+
+def bucket_start(day, bucket):
+    """ The first day of the bucket a date falls in. Weeks start on monday, the same as the database's truncation """
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(day, bucket):
+    if bucket == "week":
+        return day + timedelta(days=7)
+    if bucket == "month":
+        return day.replace(year=day.year + 1, month=1) if day.month == 12 else day.replace(month=day.month + 1)
+    return day + timedelta(days=1)
+
+
+def bucketed_revenue(orders, bucket):
+    """ (bucket start date, revenue) of every bucket that has orders, oldest first, computed by the database """
+    return list(
+        orders.order_by()
+        .annotate(bucket=BUCKET_FUNCTIONS[bucket]("order_date"))
+        .values("bucket")
+        .annotate(revenue=Sum("total_price"))
+        .order_by("bucket")
+        .values_list("bucket", "revenue")
+    )
+
+
+def fill_gaps(rows, bucket, start_date, end_date):
+    """ One (bucket start date, revenue) row for every bucket between start_date and end_date, zero where there were no orders """
+    revenue_by_bucket = dict(rows)
+    series = []
+    day = bucket_start(start_date, bucket)
+    while day <= end_date:
+        series.append((day, revenue_by_bucket.get(day, Decimal(0))))
+        day = next_bucket(day, bucket)
+    return series
+
+
+def lttb(values, max_points):
+    """
+    Indices of the points Largest-Triangle-Three-Buckets keeps when downsampling the evenly spaced series 'values'
+    to max_points points. The first and last points are always kept. Every other bucket of points contributes the
+    point that forms the largest triangle with the point kept from the previous bucket and the average of the next one.
+    """
+    count = len(values)
+    if max_points >= count or max_points < 3:
+        return list(range(count))
+
+    kept = [0]
+    bucket_size = (count - 2) / (max_points - 2)
+    previous = 0
+    for index in range(max_points - 2):
+        start = int(index * bucket_size) + 1
+        end = int((index + 1) * bucket_size) + 1
+
+        next_start, next_end = end, min(int((index + 2) * bucket_size) + 1, count)
+        average_x = (next_start + next_end - 1) / 2
+        average_y = sum(values[next_start:next_end]) / (next_end - next_start)
+
+        previous_y = values[previous]
+        largest_area, chosen = -1, start
+        for point in range(start, end):
+            area = abs((previous - average_x) * (values[point] - previous_y) - (previous - point) * (average_y - previous_y))
+            if area > largest_area:
+                largest_area, chosen = area, point
+        kept.append(chosen)
+        previous = chosen
+    kept.append(count - 1)
+    return kept
+
+
+def revenue_series(orders, bucket, start_date, end_date, max_points=None, rows=None):
+    """
+    The revenue of the orders per bucket from start_date to end_date as a list of {"date": ..., "revenue": ...},
+    oldest first. start_date and end_date may be None to span from the first to the last order. 'rows' are the
+    bucketed_revenue() of the orders when they're already known (e.g from reports.analytics)
+    """
+    if rows is None:
+        rows = bucketed_revenue(orders, bucket)
+    if start_date is None:
+        start_date = rows[0][0] if rows else None
+    if end_date is None:
+        end_date = rows[-1][0] if rows else None
+    series = fill_gaps(rows, bucket, start_date, end_date) if start_date and end_date else []
+
+    if max_points is not None:
+        series = [series[index] for index in lttb([float(revenue) for _, revenue in series], max_points)]
+    return [{"date": day, "revenue": revenue} for day, revenue in series]
@@ -1,8 +1,13 @@
 from django.urls import path
-from .views import ReportDataView, ReportDataSummaryView
+from .views import ReportDataView, ReportDataSummaryView, BatchReportView, ABCReportView
+from .jobs import ReportJobsView, ReportJobView
 
 
 urlpatterns = [
     path('', ReportDataView.as_view(), name='reports'),
-    path('summary', ReportDataSummaryView.as_view(), name='reports-summary')
+    path('summary', ReportDataSummaryView.as_view(), name='reports-summary'),
+    path('batch', BatchReportView.as_view(), name='reports-batch'),
+    path('abc', ABCReportView.as_view(), name='reports-abc'),
+    path('jobs', ReportJobsView.as_view(), name='report-jobs'),
+    path('jobs/<int:job_id>', ReportJobView.as_view(), name='report-job')
 ]
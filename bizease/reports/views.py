@@ -2,41 +2,56 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from inventory.models import Inventory
-from orders.models import Order, OrderedProduct
-from django.db.models import Sum, F
+from orders.models import Order, OrderedProduct, ProductSalesStats
+from django.db.models import Sum, F, Case, When, Value
 from rest_framework import status
 from django.utils  import timezone
 from datetime import timedelta, datetime
+from rest_framework.settings import api_settings
+from bizease.renderers import ColumnarJSONRenderer, columnar_requested
+from bizease.serializers import rows_to_columns
+from .timeseries import BUCKET_FUNCTIONS, revenue_series
+from .comparisons import parse_comparisons, compare_periods, summarize_periods
+from .snapshots import snapshot_report
+from .analytics import analytics_enabled, tenant_columns
+from .pareto import RANKINGS, CLASSES, Classification, period_sales
+import math
 
 
-def process_GET_parameters(request):
-    user = request.user
+# 181 days was used for 6 months because not all months have 30 days 
+# so an extra day was added to be just a little bit more accurate
+PERIOD_DAYS = {"last-week": 7, "last-month": 30, "last-6-months": 181, "last-year": 365}
+
+
+def period_range(period):
+    """ The (start_date, end_date) of one of the PERIOD_DAYS periods, ending today """
+    current_timestamp = timezone.now()
+    start_date = (current_timestamp - timedelta(days=PERIOD_DAYS[period])).date()
+    end_date = current_timestamp.date()
+    return start_date, end_date
+
+
+def process_GET_parameters(params):
     start_date = None
     end_date = None
 
-    valid_values  = ["last-week", "last-month", "last-6-months", "last-year"]
+    valid_values  = list(PERIOD_DAYS)
 
-    period = request.GET.get('period')
-    start_date_str = request.GET.get('start_date')
-    end_date_str = request.GET.get('end_date')
+    period = params.get('period')
+    start_date_str = params.get('start_date')
+    end_date_str = params.get('end_date')
 
     if period and (start_date or end_date):
         return {"error": "Invalid GET parameters. Only period or a combination of start_date and end_date is allowed"}
 
-    if period and len(request.GET.getlist('period')) == 1:
+    if period and len(params.getlist('period')) == 1:
         if period not in valid_values:
             return {"error": "Invalid value for period parameter"}
 
-        # 181 days was used for 6 months because not all months have 30 days 
-        # so an extra day was added to be just a little bit more accurate
-        date_range_to_days_map = {"last-week": 7, "last-month": 30, "last-6-months": 181, "last-year": 365}
-        days_num = date_range_to_days_map[period]
-        current_timestamp = timezone.now()
-        start_date = (current_timestamp - timedelta(days=days_num)).date()
-        end_date = current_timestamp.date()
+        start_date, end_date = period_range(period)
         return {"start_date": start_date, "end_date": end_date, "time_period": period}
 
-    elif start_date_str and (len(request.GET.getlist('start_date')) == 1) and end_date_str and (len(request.GET.getlist('end_date')) == 1):
+    elif start_date_str and (len(params.getlist('start_date')) == 1) and end_date_str and (len(params.getlist('end_date')) == 1):
         try:
             start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
             end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
@@ -48,185 +63,284 @@ def process_GET_parameters(request):
     return {} 
 
 
+def process_chart_parameters(params):
+    """
+    Returns the (bucket, max_points) of the revenue chart. bucket is None if the chart should have one point per order
+    date with data. max_points without a bucket buckets by day. Raises ValueError for invalid values
+    """
+    bucket = params.get("bucket")
+    if bucket is not None and (bucket not in BUCKET_FUNCTIONS or len(params.getlist("bucket")) != 1):
+        raise ValueError("Invalid value for bucket parameter")
 
-class ReportDataView(APIView):
-    permission_classes = [IsAuthenticated]
-
-    def get(self, request, **kwargs):
-        range_dict = process_GET_parameters(self.request)
-        if (range_dict.get("error")):
-            return Response({"detail": range_dict["error"]}, status=status.HTTP_400_BAD_REQUEST)
-            
-        start_date = range_dict.get("start_date")
-        end_date = range_dict.get("end_date")
-
-        report_data = {}
-        report_data["total_products"] = Inventory.objects.filter(owner=request.user.id).count()
-        report_data["low_stock_items"] = Inventory.objects.filter(owner=request.user.id).filter(stock_level__lte=F("low_stock_threshold")).count()
-
-        period = self.request.GET.get('period')
-        if not start_date and not end_date:
-            report_data["period"] = "All time"
-
-            top_product = (
-                OrderedProduct.objects
-                .filter(order_id__product_owner_id=request.user)
-                .values("name")
-                .annotate(total_sold=Sum("quantity"))
-                .order_by("-total_sold")
-                .first()
-            )
-            report_data["top_selling_product"] = top_product["name"] if top_product else None
-            report_data["pending_orders"] = Order.objects.filter(product_owner_id=request.user.id).filter(status="Pending").count()
-            report_data["total_stock_value"] = Inventory.objects.annotate(value=F("price")*F("stock_level")).aggregate(Sum("value"))["value__sum"]
-            report_data["stock_value_change"] = None
-            if report_data["total_stock_value"] is None:
-                report_data["total_stock_value"] = 0
-
-            report_data["total_revenue"] = (
-                Order.objects.filter(product_owner_id=request.user.id).filter(status="Delivered").aggregate(Sum("total_price"))["total_price__sum"]
-            )
-            if report_data["total_revenue"] is None:
-                report_data["total_revenue"] = 0
-            report_data["revenue_change"] = None
-
-            date_revenue_chart_data = (
-                Order.objects.filter(status="Delivered").values("order_date")
-                .annotate(date=F("order_date"), revenue=Sum("total_price")).order_by("-order_date").values("date", "revenue")
-            )
-            report_data["date_revenue_chart_data"] = date_revenue_chart_data
-            product_sales_chart_data = OrderedProduct.objects.filter(order_id__status="Delivered").values('name').annotate(quantity_sold=Sum("quantity"))
-            report_data["product_sales_chart_data"] = product_sales_chart_data
+    max_points = params.get("max_points")
+    if max_points is not None:
+        try:
+            max_points = int(max_points)
+        except ValueError:
+            raise ValueError("Invalid value for max_points parameter")
+        if max_points < 3 or len(params.getlist("max_points")) != 1:
+            raise ValueError("Invalid value for max_points parameter. It must be at least 3")
+        bucket = bucket or "day"
+    return bucket, max_points
+
+
+def build_report(owner_id, params, columnar=False):
+    """
+    The report data of ReportDataView for the query parameters 'params' (a QueryDict). Chart data is returned as column
+    arrays if columnar is True. Raises ValueError for invalid parameters
+    """
+    range_dict = process_GET_parameters(params)
+    if (range_dict.get("error")):
+        raise ValueError(range_dict["error"])
+    bucket, max_points = process_chart_parameters(params)
+    comparison_names = parse_comparisons(params)
+
+    start_date = range_dict.get("start_date")
+    end_date = range_dict.get("end_date")
+
+    if list(params) == ["period"]: # a standard period without chart or comparison options can be read from its snapshot
+        report_data = snapshot_report(owner_id, range_dict["time_period"], start_date, end_date)
+        if report_data is not None:
+            if columnar:
+                report_data["date_revenue_chart_data"] = rows_to_columns({
+                    "fields": ["date", "revenue"], "rows": [(point["date"], point["revenue"]) for point in report_data["date_revenue_chart_data"]]
+                })
+                report_data["product_sales_chart_data"] = rows_to_columns({
+                    "fields": ["name", "quantity_sold"],
+                    "rows": [(row["name"], row["quantity_sold"]) for row in report_data["product_sales_chart_data"]]
+                })
+            return report_data
+
+    # the revenue and sales of delivered orders are computed from the tenant's in-memory columns when enabled
+    columns = tenant_columns(owner_id) if analytics_enabled() else None
+
+    report_data = {}
+    report_data["period"] = range_dict.get("time_period", "All time")
+    report_data["total_products"] = Inventory.objects.for_owner(owner_id).count()
+    report_data["low_stock_items"] = Inventory.objects.for_owner(owner_id).low_stock().count()
+
+    orders = Order.objects.for_owner(owner_id)
+    delivered_products = OrderedProduct.objects.for_owner(owner_id).filter(order_id__status="Delivered")
+    if start_date and end_date:
+        orders = orders.filter(order_date__range=(start_date, end_date))
+        delivered_products = delivered_products.filter(order_id__order_date__range=(start_date, end_date))
+        sold_products = delivered_products
+    else:
+        # all time sales include the products of orders that haven't been delivered yet
+        sold_products = OrderedProduct.objects.for_owner(owner_id)
+
+    if start_date and end_date and columns is not None:
+        report_data["top_selling_product"] = columns.top_product_names([(start_date, end_date)])[0]
+    else:
+        top_product = sold_products.group_by_product().annotate(total_sold=Sum("quantity")).order_by("-total_sold").first()
+        report_data["top_selling_product"] = top_product["product_name"] if top_product else None
+    report_data["pending_orders"] = orders.filter(status="Pending").count()
+
+    totals = compare_periods(owner_id, start_date, end_date, comparison_names, columns=columns)
+    first_comparison = totals["comparisons"][0] if totals["comparisons"] else {}
+    report_data["total_stock_value"] = totals["stock_value"]
+    report_data["stock_value_change"] = first_comparison.get("stock_value_change")
+    report_data["total_revenue"] = totals["revenue"]
+    report_data["revenue_change"] = first_comparison.get("revenue_change")
+    if "compare" in params:
+        report_data["comparisons"] = totals["comparisons"]
+
+    delivered_orders = orders.filter(status="Delivered")
+    if bucket:
+        # the bucketed series is gap-filled over the whole period (over the span of the orders for all time)
+        rows = columns.bucketed_revenue(bucket, start_date, end_date) if columns is not None else None
+        date_revenue_chart_data = revenue_series(delivered_orders, bucket, start_date, end_date, max_points, rows=rows)
+    elif columns is not None:
+        # one point per order for a period and one per day with orders for all time, newest first either way
+        if start_date and end_date:
+            date_revenue_rows = columns.order_revenue_rows(start_date, end_date)
+        else:
+            date_revenue_rows = columns.bucketed_revenue("day")[::-1]
+        date_revenue_chart_data = [{"date": day, "revenue": revenue} for day, revenue in date_revenue_rows]
+    elif start_date and end_date:
+        date_revenue_chart_data = delivered_orders.annotate(revenue=Sum("total_price"), date=F("order_date")).values("date", "revenue")
+    else:
+        date_revenue_chart_data = (
+            delivered_orders.values("order_date").annotate(date=F("order_date"), revenue=Sum("total_price"))
+            .order_by("-order_date").values("date", "revenue")
+        )
+    if start_date and end_date and columns is not None:
+        product_sales_chart_data = [
+            {"product_name": name, "quantity_sold": quantity_sold} for name, quantity_sold in columns.product_sales(start_date, end_date)
+        ]
+    elif start_date and end_date:
+        product_sales_chart_data = delivered_products.group_by_product().annotate(quantity_sold=Sum("quantity"))
+    else:
+        # all time sales are read from the per product stats instead of being aggregated from every ordered product
+        product_sales_chart_data = (
+            ProductSalesStats.objects.for_owner(owner_id).with_product_name()
+            .annotate(quantity_sold=F("units_sold")).values("product_name", "quantity_sold")
+        )
+
+    if columnar: # chart data is returned as column arrays
+        if isinstance(date_revenue_chart_data, list):
+            date_revenue_rows = [(point["date"], point["revenue"]) for point in date_revenue_chart_data]
+        else:
+            date_revenue_rows = list(date_revenue_chart_data.values_list("date", "revenue"))
+        if isinstance(product_sales_chart_data, list):
+            product_sales_rows = [(row["product_name"], row["quantity_sold"]) for row in product_sales_chart_data]
         else:
-            report_data["period"] = range_dict["time_period"]
-            top_product = (
-                OrderedProduct.objects
-                .filter(order_id__product_owner_id=request.user.id)
-                .filter(order_id__order_date__range=(start_date, end_date))
-                .filter(order_id__status="Delivered")
-                .values("name")
-                .annotate(total_sold=Sum("quantity"))
-                .order_by("-total_sold")
-                .first()
+            product_sales_rows = list(product_sales_chart_data.values_list("product_name", "quantity_sold"))
+        report_data["date_revenue_chart_data"] = rows_to_columns({"fields": ["date", "revenue"], "rows": date_revenue_rows})
+        report_data["product_sales_chart_data"] = rows_to_columns({"fields": ["name", "quantity_sold"], "rows": product_sales_rows})
+    else:
+        report_data["date_revenue_chart_data"] = date_revenue_chart_data
+        report_data["product_sales_chart_data"] = [
+            {"name": row["product_name"], "quantity_sold": row["quantity_sold"]} for row in product_sales_chart_data
+        ]
+
+    return report_data
+
+
+def build_summary(owner_id, params, columnar=False):
+    """ The report summary of ReportDataSummaryView for the query parameters 'params'. Raises ValueError for invalid parameters """
+    range_dict = process_GET_parameters(params)
+    if (range_dict.get("error")):
+        raise ValueError(range_dict["error"])
+
+    start_date = range_dict.get("start_date")
+    end_date = range_dict.get("end_date")
+
+    if (start_date or end_date) and analytics_enabled():
+        summary_rows = tenant_columns(owner_id).product_summary(start_date, end_date)
+    else:
+        if start_date or end_date:
+            summary = (
+                OrderedProduct.objects.for_owner(owner_id).filter(order_id__status="Delivered", order_id__order_date__range=(start_date, end_date))
+                .group_by_product().annotate(quantity_sold=Sum("quantity"), revenue=Sum("cummulative_price"))
             )
-            report_data["top_selling_product"] = top_product["name"] if top_product else None
-            
-            report_data["pending_orders"] = (
-                Order.objects.filter(product_owner_id=request.user.id)
-                .filter(order_date__range=(start_date, end_date))
-                .filter(status="Pending").count()
+        else:
+            # all time totals are read from the per product stats instead of being aggregated from every ordered product
+            summary = (
+                ProductSalesStats.objects.for_owner(owner_id).with_product_name()
+                .annotate(quantity_sold=F("units_sold")).values("product_name", "quantity_sold", "revenue")
             )
 
-            prev_period_offsets = {"last-week": 8, "last-month": 31, "last-6-months": 182, "last-year": 366}
-            prev_cutoff_date = start_date - timedelta(days=prev_period_offsets[period])
-
-            cutoff_date = end_date
-            # print(Inventory.objects.filter(date_added__lte=cutoff_date).values("product_name", "price", "stock_level"))
-            report_data["total_stock_value"] = (
-                Inventory.objects.filter(date_added__lte=cutoff_date).annotate(value=F("price")*F("stock_level")).aggregate(Sum("value"))["value__sum"]
-            )
-            prev_period_stock_value = (
-                Inventory.objects.filter(date_added__lte=prev_cutoff_date).annotate(value=F("price")*F("stock_level")).aggregate(Sum("value"))["value__sum"]
+        # stock status is read through the inventory_item foreign key instead of matching inventory items by name
+        summary_rows = (
+            summary.annotate(
+                stock_status=Case(
+                    When(inventory_item__isnull=True, then=Value("out of stock")),
+                    When(inventory_item__stock_level__lt=F("inventory_item__low_stock_threshold"), then=Value("low stock")),
+                    default=Value("in stock"),
+                )
             )
+            .order_by("product_name")
+            .values_list("product_name", "quantity_sold", "revenue", "stock_status")
+        )
+    if columnar:
+        summary = {"fields": ["name", "quantity_sold", "revenue", "stock_status"], "rows": [list(row) for row in summary_rows]}
+    else:
+        summary = [
+            {"name": name, "quantity_sold": quantity_sold, "revenue": revenue, "stock_status": stock_status}
+            for name, quantity_sold, revenue, stock_status in summary_rows
+        ]
+
+    time_period = "All time" if not range_dict.get("time_period") else range_dict["time_period"]
+    return {"summary": summary, "period": time_period}
+
+
+def build_abc(owner_id, params, page_size=50):
+    """
+    The ABC classification of ABCReportView for the query parameters 'params', or None if the requested page doesn't
+    exist. Raises ValueError for invalid parameters
+    """
+    range_dict = process_GET_parameters(params)
+    if (range_dict.get("error")):
+        raise ValueError(range_dict["error"])
+    rank_by = params.get("rank_by", "revenue")
+    if rank_by not in RANKINGS or len(params.getlist("rank_by")) > 1:
+        raise ValueError(f"Invalid value for rank_by parameter. Use one of {', '.join(RANKINGS)}")
+    product_class = params.get("class")
+    if product_class is not None and (product_class.upper() not in CLASSES or len(params.getlist("class")) != 1):
+        raise ValueError(f"Invalid value for class parameter. Use one of {', '.join(CLASSES)}")
+
+    period = range_dict.get("time_period")
+    names, units, revenue = period_sales(
+        owner_id, range_dict.get("start_date"), range_dict.get("end_date"), period=period if period in PERIOD_DAYS else None
+    )
+    classification = Classification(names, units, revenue, rank_by)
+    ranks = classification.ranks(product_class and product_class.upper())
+
+    try:
+        page = int(params["page"]) if len(params.getlist("page")) == 1 else None
+    except ValueError:
+        page = None
+    page_count = max(math.ceil(len(ranks)/page_size), 1)
+    if page:
+        if page_count < page or page <= 0:
+            return None
+        ranks = ranks[(page-1) * page_size:page * page_size]
+    else:
+        page_count = 1
+
+    return {
+        "period": period or "All time",
+        "rank_by": rank_by,
+        "classes": classification.summary,
+        "page_count": page_count,
+        "next_page": page + 1 if page and page + 1 <= page_count else None,
+        "prev_page": page - 1 if page and page - 1 >= 1 else None,
+        "length": len(ranks),
+        "products": classification.products(ranks),
+    }
 
-            if (report_data["total_stock_value"] is None):
-                report_data["total_stock_value"] = 0
-            if prev_period_stock_value is None:
-                prev_period_stock_value = 0
-
-            change = report_data["total_stock_value"] - prev_period_stock_value
-            if prev_period_stock_value == 0:
-                change_percentage = None
-            else:
-                change_percentage = round((change/prev_period_stock_value) * 100, 2)
 
-            report_data["stock_value_change"] = change_percentage
+class ReportDataView(APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, ColumnarJSONRenderer]
 
-            report_data["total_revenue"] = (
-                Order.objects.filter(product_owner_id=request.user.id)
-                .filter(order_date__range=(start_date, end_date))
-                .filter(status="Delivered")
-                .aggregate(Sum("total_price"))["total_price__sum"]
-            )
+    def get(self, request, **kwargs):
+        try:
+            report_data = build_report(request.user.id, request.GET, columnar_requested(request))
+        except ValueError as err:
+            return Response({"detail": str(err)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"data": report_data}, status=status.HTTP_200_OK)
 
-            prev_start_date = start_date - timedelta(days=prev_period_offsets[period])
-            prev_end_date = start_date - timedelta(days=1)
 
-            prev_revenue = (
-                Order.objects
-                .filter(product_owner_id=request.user.id)
-                .filter(order_date__range=(prev_start_date, prev_end_date))
-                .filter(status="Delivered")
-                .aggregate(Sum("total_price"))['total_price__sum']
-            )
+class ReportDataSummaryView(APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, ColumnarJSONRenderer]
 
-            if (report_data["total_revenue"] is None):
-                report_data["total_revenue"] = 0
-            if prev_revenue is None:
-                prev_revenue = 0
+    def get(self, request, **kwargs):
+        try:
+            summary_data = build_summary(request.user.id, request.GET, columnar_requested(request))
+        except ValueError as err:
+            return Response({"detail": str(err)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"data": summary_data}, status=status.HTTP_200_OK)
 
-            change = report_data["total_revenue"] - prev_revenue
-            if prev_revenue == 0:
-                change_percentage = None
-            else:
-                change_percentage = round((change/prev_revenue) * 100, 2)
 
-            report_data["revenue_change"] = change_percentage
+class ABCReportView(APIView):
+    """ The products sold in a period ranked by revenue or units sold and classified into A, B and C (see reports.pareto) """
+    permission_classes = [IsAuthenticated]
 
-            date_revenue_chart_data = (
-                Order.objects
-                .filter(order_date__range=(start_date, end_date))
-                .filter(status="Delivered")
-                .annotate(revenue=Sum("total_price"), date=F("order_date")).values("date", "revenue")
-            )
-            report_data["date_revenue_chart_data"] = date_revenue_chart_data
-            product_sales_chart_data = (
-                OrderedProduct.objects
-                .filter(order_id__order_date__range=(start_date, end_date))
-                .filter(order_id__status="Delivered")
-                .values('name').annotate(quantity_sold=Sum("quantity"))
-            )
-            report_data["product_sales_chart_data"] = product_sales_chart_data
+    def get(self, request, **kwargs):
+        try:
+            abc_data = build_abc(request.user.id, request.GET)
+        except ValueError as err:
+            return Response({"detail": str(err)}, status=status.HTTP_400_BAD_REQUEST)
+        if abc_data is None:
+            return Response({"detail": "Page Not found", "data": None}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"data": abc_data}, status=status.HTTP_200_OK)
 
-        return Response({"data": report_data}, status=status.HTTP_200_OK)
 
-class ReportDataSummaryView(APIView):
+class BatchReportView(APIView):
+    """ The report cards of several periods, computed with the same few queries no matter how many periods are requested """
     permission_classes = [IsAuthenticated]
 
     def get(self, request, **kwargs):
-        range_dict = process_GET_parameters(self.request)
-        if (range_dict.get("error")):
-            return Response({"detail": range_dict["error"]}, status=status.HTTP_400_BAD_REQUEST)
-
-        start_date = range_dict.get("start_date")
-        end_date = range_dict.get("end_date")
-
-        if not start_date and not end_date:
-            summary = (
-                OrderedProduct.objects
-                .filter(order_id__status="Delivered")
-                .order_by("name").values('name')
-                .annotate(quantity_sold=Sum("quantity"), revenue=Sum("cummulative_price"))
+        periods = list(dict.fromkeys(name.strip() for name in request.GET.get("periods", "").split(",") if name.strip()))
+        if not periods or any(period not in PERIOD_DAYS for period in periods) or len(request.GET.getlist("periods")) > 1:
+            return Response(
+                {"detail": f"Invalid value for periods parameter. Use a comma separated list of {', '.join(PERIOD_DAYS)}"},
+                status=status.HTTP_400_BAD_REQUEST
             )
-        else:
-            summary = (
-                OrderedProduct.objects
-                .filter(order_id__order_date__range=(start_date, end_date))
-                .filter(order_id__status="Delivered")
-                .order_by("name").values('name')
-                .annotate(quantity_sold=Sum("quantity"), revenue=Sum("cummulative_price"))
-            )
-
-        inventory_items = Inventory.objects.filter(owner=self.request.user).order_by("product_name")
-
-        for obj in summary:
-            for item in inventory_items:
-                if obj["name"] == item.product_name:
-                    obj["stock_status"] = "low stock" if item.stock_level < item.low_stock_threshold else "in stock"
-                    
-            if not obj.get("stock_status"):
-                obj["stock_status"] = "out of stock"
-
-        time_period = "All time" if not range_dict.get("time_period") else range_dict["time_period"]
-        return Response({"data": {"summary": summary, "period": time_period}}, status=status.HTTP_200_OK)
 
+        columns = tenant_columns(request.user.id) if analytics_enabled() else None
+        cards = summarize_periods(request.user.id, [(period, *period_range(period)) for period in periods], columns=columns)
+        return Response({"data": cards}, status=status.HTTP_200_OK)